@@ -0,0 +1,76 @@
+"""出力画像のエンコーダごとのエンコード時間とサイズを比較するベンチマーク
+
+使い方:
+    python -m bench.encode_bench [--repeat 5] [--main-size 128] [--json result.json]
+"""
+import argparse
+import json
+import random
+import statistics
+import time
+from typing import Dict, List
+
+from bench.fixtures import make_icon
+from data.image_encoder import ENCODERS, EncoderParams, encode_image
+from data.loadout_renderer import compose_loadout
+
+
+def make_layout(count: int, main_size: int, seed: int = 0) -> Dict:
+    """count人分のレイアウト記述を作ります"""
+    rng = random.Random(seed)
+    gear_keys = [f"gear{i}" for i in range(26)]
+    players = []
+    for i in range(count):
+        gears = rng.sample(gear_keys, 3)
+        players.append({
+            'main_key': f"bench_main_{i}",
+            'main': make_icon(1000 + i, main_size),
+            'gears': [[key, make_icon(2000 + gear_keys.index(key), 64)] for key in gears],
+        })
+    return {'gear_size': 64, 'padding': 10, 'players': players}
+
+
+def run(repeat: int, main_size: int) -> List[Dict]:
+    results = []
+    for count in range(1, 9):
+        img = compose_loadout(make_layout(count, main_size))
+        for name in [*ENCODERS, 'auto']:
+            timings = []
+            data = b''
+            ext = ''
+            for _ in range(repeat):
+                start = time.perf_counter()
+                if name == 'auto':
+                    data, ext = encode_image(img, 'auto', EncoderParams.BYTE_BUDGET)
+                else:
+                    data, ext = encode_image(img, name)
+                timings.append((time.perf_counter() - start) * 1000)
+            results.append({
+                'count': count,
+                'encoder': name,
+                'format': ext,
+                'median_ms': round(statistics.median(timings), 2),
+                'bytes': len(data),
+            })
+    return results
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--main-size', type=int, default=128)
+    parser.add_argument('--json', help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    results = run(args.repeat, args.main_size)
+    print(f"{'count':>5} {'encoder':<15} {'format':<6} {'median_ms':>10} {'bytes':>10}")
+    for r in results:
+        print(f"{r['count']:>5} {r['encoder']:<15} {r['format']:<6} {r['median_ms']:>10.2f} {r['bytes']:>10}")
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,259 @@
+"""Discord REST API の代わりに応答するローカルHTTPサーバー (負荷試験用)
+
+discord.py がスラッシュコマンドの応答で使うエンドポイントだけを実装します:
+ログイン (/users/@me, /oauth2/applications/@me)、Interaction の応答 (defer / メッセージ)、
+元の応答の取得・編集、フォローアップ、チャンネルへの送信。
+添付ファイルには Discord の CDN 形式のURL (有効期限 ex= 付き) を返します。
+使う側は discord.http.Route.BASE を api_base に向けてください。
+"""
+import asyncio
+import datetime
+import json
+import random
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Tuple
+
+from aiohttp import web
+
+APPLICATION_ID = 100000000000000001
+BOT_USER = {
+    'id': str(APPLICATION_ID),
+    'username': 'loadtest',
+    'discriminator': '0',
+    'global_name': None,
+    'avatar': None,
+    'bot': True,
+}
+
+
+def _json(body: Any, status: int = 200, headers: Optional[Dict[str, str]] = None) -> web.Response:
+    # discord.py は Content-Type が charset なしの application/json の場合だけ JSON として読む
+    return web.Response(body=json.dumps(body).encode('utf-8'), status=status,
+                        content_type='application/json', headers=headers)
+
+
+class FakeDiscordServer:
+    """Discord REST API の代替サーバー
+
+    latency を指定すると各リクエストの応答をその秒数だけ遅らせます。
+    rate_limit_ratio の割合のリクエストには 429 (retry_after 付き) を返し、
+    discord.py の再試行を含めた応答時間を再現します。
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0,
+                 rate_limit_ratio: float = 0.0, retry_after: float = 0.05):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.rate_limit_ratio = rate_limit_ratio
+        self.retry_after = retry_after
+        self.requests: Counter = Counter()
+        self.uploaded_bytes = 0
+        # Interaction の token -> 最初の応答 (defer) を受け取った時刻 (perf_counter)
+        self.responded_at: Dict[str, float] = {}
+        # token -> 元の応答のメッセージ / フォローアップのメッセージ
+        self._originals: Dict[str, Dict[str, Any]] = {}
+        self._followups: Dict[str, List[Dict[str, Any]]] = {}
+        self._next_id = 200000000000000000
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def api_base(self) -> str:
+        return f"{self.base_url}/api/v10"
+
+    def forget(self, token: str) -> List[Dict[str, Any]]:
+        """完了した Interaction の記録を破棄し、送信されたメッセージ (元の応答が先頭) を返します
+
+        長時間の試験で記録が溜まってメモリが増えないよう、完了ごとに呼び出してください。
+        """
+        self.responded_at.pop(token, None)
+        original = self._originals.pop(token, None)
+        return ([original] if original else []) + self._followups.pop(token, [])
+
+    def _snowflake(self) -> int:
+        self._next_id += 1
+        return self._next_id
+
+    async def _enter(self, name: str) -> Optional[web.Response]:
+        """リクエストを数えて遅延を入れ、レート制限を再現する場合は 429 を返します"""
+        self.requests[name] += 1
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+        if self.rate_limit_ratio > 0 and random.random() < self.rate_limit_ratio:
+            self.requests['429'] += 1
+            body = {'message': 'You are being rate limited.', 'retry_after': self.retry_after, 'global': False}
+            return _json(body, status=429, headers={
+                'Retry-After': str(self.retry_after),
+                'X-RateLimit-Limit': '5',
+                'X-RateLimit-Remaining': '0',
+                'X-RateLimit-Reset-After': str(self.retry_after),
+                'X-RateLimit-Bucket': name,
+                'X-RateLimit-Scope': 'user',
+                # Via が無い 429 は Cloudflare による遮断として扱われ、再試行されない
+                'Via': '1.1 google',
+            })
+        return None
+
+    async def _read_payload(self, request: web.Request, channel_id: int) -> Tuple[Dict[str, Any], List[Dict[str, Any]]]:
+        """JSON または multipart のリクエストから (payload, 新しい添付ファイル) を取り出します"""
+        if not request.content_type.startswith('multipart/'):
+            return (await request.json() if request.can_read_body else {}), []
+        payload: Dict[str, Any] = {}
+        uploads: List[Dict[str, Any]] = []
+        reader = await request.multipart()
+        async for part in reader:
+            if part.name == 'payload_json':
+                payload = json.loads(await part.text())
+                continue
+            size = len(await part.read())
+            self.uploaded_bytes += size
+            attachment_id = self._snowflake()
+            filename = part.filename or 'file'
+            # 本物の CDN URL と同じく、有効期限 (24時間後) を ex= に16進数で付ける
+            expiry = int(time.time()) + 24 * 60 * 60
+            uploads.append({
+                'id': str(attachment_id),
+                'filename': filename,
+                'size': size,
+                'url': f"https://cdn.discordapp.com/attachments/{channel_id}/{attachment_id}/{filename}"
+                       f"?ex={expiry:x}&is={int(time.time()):x}&hm=0",
+                'proxy_url': f"https://media.discordapp.net/attachments/{channel_id}/{attachment_id}/{filename}",
+            })
+        return payload, uploads
+
+    def _message(self, channel_id: int, payload: Dict[str, Any], attachments: List[Dict[str, Any]],
+                 message_id: Optional[int] = None) -> Dict[str, Any]:
+        return {
+            'id': str(message_id or self._snowflake()),
+            'channel_id': str(channel_id),
+            'type': 0,
+            'content': payload.get('content') or '',
+            'author': BOT_USER,
+            'timestamp': datetime.datetime.now(datetime.timezone.utc).isoformat(),
+            'edited_timestamp': None,
+            'tts': False,
+            'mention_everyone': False,
+            'mentions': [],
+            'mention_roles': [],
+            'attachments': attachments,
+            'embeds': payload.get('embeds') or [],
+            'pinned': False,
+            'flags': payload.get('flags') or 0,
+            'webhook_id': str(APPLICATION_ID),
+        }
+
+    async def _me(self, request: web.Request) -> web.Response:
+        return await self._enter('users/@me') or _json(BOT_USER)
+
+    async def _application(self, request: web.Request) -> web.Response:
+        return await self._enter('applications/@me') or _json({
+            'id': str(APPLICATION_ID),
+            'name': BOT_USER['username'],
+            'icon': None,
+            'description': '',
+            'bot_public': True,
+            'bot_require_code_grant': False,
+            'owner': BOT_USER,
+            'verify_key': '0' * 64,
+            'flags': 0,
+        })
+
+    async def _callback(self, request: web.Request) -> web.Response:
+        limited = await self._enter('interaction_callback')
+        if limited is not None:
+            return limited
+        token = request.match_info['token']
+        payload, uploads = await self._read_payload(request, 0)
+        self.responded_at.setdefault(token, time.perf_counter())
+        data = payload.get('data') or {}
+        message = self._message(0, data, uploads)
+        self._originals[token] = message
+        resource: Dict[str, Any] = {'type': payload.get('type')}
+        if payload.get('type') == 4:
+            # with_response=1 の場合、メッセージを送る応答には作成されたメッセージが含まれる
+            resource['message'] = message
+        return _json({
+            'interaction': {
+                'id': request.match_info['interaction_id'],
+                'type': 2,
+                'response_message_id': message['id'],
+                'response_message_loading': payload.get('type') == 5,
+                'response_message_ephemeral': bool((data.get('flags') or 0) & 64),
+            },
+            'resource': resource,
+        })
+
+    async def _get_original(self, request: web.Request) -> web.Response:
+        limited = await self._enter('original:get')
+        if limited is not None:
+            return limited
+        message = self._originals.get(request.match_info['token'])
+        if message is None:
+            return _json({'message': 'Unknown Message', 'code': 10008}, status=404)
+        return _json(message)
+
+    async def _edit_original(self, request: web.Request) -> web.Response:
+        limited = await self._enter('original:edit')
+        if limited is not None:
+            return limited
+        token = request.match_info['token']
+        message = self._originals.get(token)
+        if message is None:
+            return _json({'message': 'Unknown Message', 'code': 10008}, status=404)
+        payload, uploads = await self._read_payload(request, int(message['channel_id']))
+        if 'content' in payload:
+            message['content'] = payload['content'] or ''
+        if 'embeds' in payload:
+            message['embeds'] = payload['embeds'] or []
+        if 'attachments' in payload:
+            # 指定された既存の添付ファイルだけを残し、新しいファイルを追加する
+            keep = {str(a.get('id')) for a in payload['attachments']}
+            message['attachments'] = [a for a in message['attachments'] if a['id'] in keep] + uploads
+        message['edited_timestamp'] = datetime.datetime.now(datetime.timezone.utc).isoformat()
+        return _json(message)
+
+    async def _followup(self, request: web.Request) -> web.Response:
+        limited = await self._enter('followup')
+        if limited is not None:
+            return limited
+        payload, uploads = await self._read_payload(request, 0)
+        message = self._message(0, payload, uploads)
+        self._followups.setdefault(request.match_info['token'], []).append(message)
+        if request.query.get('wait', 'false') != 'true':
+            return web.Response(status=204)
+        return _json(message)
+
+    async def _channel_message(self, request: web.Request) -> web.Response:
+        limited = await self._enter('channel_message')
+        if limited is not None:
+            return limited
+        channel_id = int(request.match_info['channel_id'])
+        payload, uploads = await self._read_payload(request, channel_id)
+        return _json(self._message(channel_id, payload, uploads))
+
+    async def start(self) -> str:
+        """サーバーを起動し、APIのベースURLを返します"""
+        app = web.Application(client_max_size=32 * 1024 * 1024)
+        app.router.add_get('/api/v10/users/@me', self._me)
+        app.router.add_get('/api/v10/oauth2/applications/@me', self._application)
+        app.router.add_post('/api/v10/interactions/{interaction_id}/{token}/callback', self._callback)
+        app.router.add_get('/api/v10/webhooks/{application_id}/{token}/messages/@original', self._get_original)
+        app.router.add_patch('/api/v10/webhooks/{application_id}/{token}/messages/@original', self._edit_original)
+        app.router.add_post('/api/v10/webhooks/{application_id}/{token}', self._followup)
+        app.router.add_post('/api/v10/channels/{channel_id}/messages', self._channel_message)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.api_base
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
@@ -0,0 +1,122 @@
+"""ベンチマーク・負荷試験用の stat.ink フィクスチャ
+
+bench/fixtures/weapon.json と ability.json があればそれを使います
+(python -m bench.record_fixtures で stat.ink から記録できます)。
+無い場合は stat.ink と同じ形式・同程度の件数のデータを決まった内容で生成します。
+"""
+import io
+import json
+import os
+import random
+from typing import Dict, List
+
+from PIL import Image, ImageDraw
+
+FIXTURE_DIR = os.path.join(os.path.dirname(__file__), 'fixtures')
+
+LOCALES = [
+    'de_DE', 'en_GB', 'en_US', 'es_ES', 'es_MX', 'fr_CA', 'fr_FR',
+    'it_IT', 'ja_JP', 'ko_KR', 'nl_NL', 'ru_RU', 'zh_CN', 'zh_TW',
+]
+
+# stat.ink のギアパワー (key, 日本語名, 英語名)
+ABILITIES = [
+    ('ink_saver_main', 'インク効率アップ(メイン)', 'Ink Saver (Main)'),
+    ('ink_saver_sub', 'インク効率アップ(サブ)', 'Ink Saver (Sub)'),
+    ('ink_recovery_up', 'インク回復力アップ', 'Ink Recovery Up'),
+    ('run_speed_up', 'ヒト移動速度アップ', 'Run Speed Up'),
+    ('swim_speed_up', 'イカダッシュ速度アップ', 'Swim Speed Up'),
+    ('special_charge_up', 'スペシャル増加量アップ', 'Special Charge Up'),
+    ('special_saver', 'スペシャル減少量ダウン', 'Special Saver'),
+    ('special_power_up', 'スペシャル性能アップ', 'Special Power Up'),
+    ('quick_respawn', '復活時間短縮', 'Quick Respawn'),
+    ('quick_super_jump', 'スーパージャンプ時間短縮', 'Quick Super Jump'),
+    ('sub_power_up', 'サブ性能アップ', 'Sub Power Up'),
+    ('ink_resistance_up', '相手インク影響軽減', 'Ink Resistance Up'),
+    ('sub_resistance_up', 'サブ影響軽減', 'Sub Resistance Up'),
+    ('intensify_action', 'アクション強化', 'Intensify Action'),
+    ('opening_gambit', 'スタートダッシュ', 'Opening Gambit'),
+    ('last_ditch_effort', 'ラストスパート', 'Last-Ditch Effort'),
+    ('tenacity', '逆境強化', 'Tenacity'),
+    ('comeback', 'カムバック', 'Comeback'),
+    ('ninja_squid', 'イカニンジャ', 'Ninja Squid'),
+    ('haunt', 'リベンジ', 'Haunt'),
+    ('thermal_ink', 'サーマルインク', 'Thermal Ink'),
+    ('respawn_punisher', '復活ペナルティアップ', 'Respawn Punisher'),
+    ('ability_doubler', '追加ギアパワー倍化', 'Ability Doubler'),
+    ('stealth_jump', 'ステルスジャンプ', 'Stealth Jump'),
+    ('object_shredder', '対物攻撃力アップ', 'Object Shredder'),
+    ('drop_roller', '受け身術', 'Drop Roller'),
+]
+
+WEAPON_COUNT = 150
+TYPE_COUNT = 11
+SUB_COUNT = 14
+SPECIAL_COUNT = 19
+
+
+def _names(ja: str, en: str) -> Dict[str, str]:
+    names = {lang: f"{en} [{lang}]" for lang in LOCALES}
+    names['ja_JP'] = ja
+    names['en_US'] = en
+    return names
+
+
+def _item(prefix: str, i: int, ja: str) -> Dict:
+    return {'key': f"{prefix}_{i}", 'name': _names(f"{ja}{i}", f"{prefix.title()} {i}")}
+
+
+def generate_weapons() -> List[Dict]:
+    """stat.ink の /api/v3/weapon と同じ形式のブキ一覧を生成します"""
+    weapons = []
+    for i in range(WEAPON_COUNT):
+        weapon_type = _item('type', i % TYPE_COUNT, 'シューター')
+        weapon_type['category'] = {'key': 'category', 'name': _names('カテゴリ', 'Category')}
+        weapons.append({
+            'key': f"weapon_{i}",
+            'aliases': [str(i)],
+            'type': weapon_type,
+            'name': _names(f"ブキ{i}", f"Weapon {i}"),
+            'main': f"weapon_{i}",
+            'sub': _item('sub', i % SUB_COUNT, 'サブ'),
+            'special': _item('special', i % SPECIAL_COUNT, 'スペシャル'),
+            'reskin_of': None,
+            'main_ref': f"weapon_{i}",
+            'rank': [],
+        })
+    return weapons
+
+
+def generate_abilities() -> List[Dict]:
+    """stat.ink の /api/v3/ability と同じ形式のギアパワー一覧を生成します"""
+    return [
+        {'key': key, 'name': _names(ja, en), 'primary_only': False}
+        for key, ja, en in ABILITIES
+    ]
+
+
+def load(name: str) -> List[Dict]:
+    """記録済みのフィクスチャ (無ければ生成したもの) を返します"""
+    path = os.path.join(FIXTURE_DIR, f"{name}.json")
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            return json.load(f)
+    return generate_weapons() if name == 'weapon' else generate_abilities()
+
+
+def make_icon(seed: int, size: int) -> bytes:
+    """ブキ/ギアアイコンに似た透過付きのPNGを作ります (同じseedなら同じ画像)"""
+    rng = random.Random(seed)
+    img = Image.new('RGBA', (size, size), (0, 0, 0, 0))
+    draw = ImageDraw.Draw(img)
+    for _ in range(12):
+        x0, y0 = rng.randrange(size), rng.randrange(size)
+        x1, y1 = x0 + rng.randrange(size // 2) + 1, y0 + rng.randrange(size // 2) + 1
+        color = tuple(rng.randrange(256) for _ in range(3)) + (rng.randrange(128, 256),)
+        if rng.random() < 0.5:
+            draw.ellipse((x0, y0, x1, y1), fill=color, outline=(0, 0, 0, 255), width=2)
+        else:
+            draw.rectangle((x0, y0, x1, y1), fill=color, outline=(0, 0, 0, 255), width=2)
+    output = io.BytesIO()
+    img.save(output, format='PNG')
+    return output.getvalue()
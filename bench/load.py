@@ -0,0 +1,465 @@
+"""/random_weapon の負荷試験・長時間試験 (ネットワーク不要)
+
+Discord REST API・stat.ink・splatoonwiki の代わりにローカルの代替サーバーを起動し、
+Spl3Random Cog にスラッシュコマンドの Interaction を一定の頻度で流し込みます。
+ゲートウェイには接続せず、discord.py のハートビート送信スレッドと同じ方法で
+イベントループに処理を投入し、実行されるまでの遅れ (ハートビートの遅延) を計測します。
+
+報告する値:
+    - スループット (完了数/秒) と応答時間の分布 (最初の応答 / 完了まで)
+    - 応答の内訳 (画像添付 / アップロード済みURLの再利用 / テキストのみ / エラー)
+    - ハートビートの遅延 (イベントループの詰まり)
+    - RSS の推移 (長時間試験でのメモリ増加量と増加率)
+
+使い方:
+    python -m bench.load --rate 20 --duration 60                 # 20件/秒で60秒
+    python -m bench.load --rate 5 --ramp 5 --interval 15 --duration 300
+                                                                 # 15秒ごとに5件/秒ずつ上げ、限界を探す
+    python -m bench.load --rate 10 --duration 3600 --interval 60 --json soak.json
+                                                                 # 1時間の長時間試験
+"""
+import os
+import tempfile
+
+# キャッシュの保存先はデータ層の読み込み前に一時ディレクトリへ向ける
+_WORKDIR = tempfile.mkdtemp(prefix='spl3_load_')
+os.environ.setdefault('IMAGE_CACHE_DIR', os.path.join(_WORKDIR, 'images'))
+os.environ.setdefault('CATALOG_DIR', os.path.join(_WORKDIR, 'catalog'))
+os.environ.setdefault('REDIRECT_CACHE_PATH', os.path.join(_WORKDIR, 'redirects.json'))
+os.environ.setdefault('ASSET_WARMUP', '0')
+
+import argparse
+import asyncio
+import gc
+import json
+import math
+import random
+import resource
+import shutil
+import threading
+import time
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
+
+import discord
+from discord.ext import commands
+
+from bench.fake_discord import APPLICATION_ID, FakeDiscordServer
+from bench.standin_server import StandinServer
+from cogs.spl3_random import Spl3Random
+from data.weapon_api import WeaponDataParams
+
+
+class LatencyHistogram:
+    """対数間隔のバケットで応答時間を数えます
+
+    長時間の試験でも計測値を保持し続けないよう (計測自体でメモリが増えないよう)、
+    値はバケットごとの件数としてのみ記録します。百分位の誤差はバケットの幅 (約5%) 以内です。
+    """
+
+    MIN = 1e-4
+    GROWTH = 1.05
+
+    def __init__(self):
+        self.buckets: Counter = Counter()
+        self.count = 0
+        self.total = 0.0
+        self.max = 0.0
+
+    def record(self, seconds: float) -> None:
+        index = 0 if seconds <= self.MIN else int(math.log(seconds / self.MIN, self.GROWTH)) + 1
+        self.buckets[index] += 1
+        self.count += 1
+        self.total += seconds
+        self.max = max(self.max, seconds)
+
+    def percentile(self, p: float) -> float:
+        if not self.count:
+            return 0.0
+        rank = max(1, math.ceil(self.count * p))
+        seen = 0
+        for index in sorted(self.buckets):
+            seen += self.buckets[index]
+            if seen >= rank:
+                # バケットの上端を返す (最大値は超えない)
+                return min(self.max, self.MIN * self.GROWTH ** index)
+        return self.max
+
+    def summary(self) -> Dict[str, float]:
+        """件数と分布 (ミリ秒) を返します"""
+        return {
+            'n': self.count,
+            'mean_ms': round(self.total / self.count * 1000, 2) if self.count else 0.0,
+            'p50_ms': round(self.percentile(0.50) * 1000, 2),
+            'p90_ms': round(self.percentile(0.90) * 1000, 2),
+            'p99_ms': round(self.percentile(0.99) * 1000, 2),
+            'max_ms': round(self.max * 1000, 2),
+        }
+
+
+class HeartbeatProbe(threading.Thread):
+    """discord.py のハートビート送信スレッド (KeepAliveHandler) を模したイベントループの遅延計測
+
+    別スレッドから一定間隔でイベントループに処理を投入し、実行されるまでの時間を記録します。
+    本番ではこの遅れがそのままハートビートの遅れになり、長く続くとゲートウェイから切断されます。
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, interval: float):
+        super().__init__(name='heartbeat-probe', daemon=True)
+        self.loop = loop
+        self.interval = interval
+        self.window = LatencyHistogram()
+        self.total = LatencyHistogram()
+        self._lock = threading.Lock()
+        self._stop_event = threading.Event()
+
+    async def _beat(self) -> None:
+        return None
+
+    def run(self) -> None:
+        while not self._stop_event.wait(self.interval):
+            started = time.perf_counter()
+            future = asyncio.run_coroutine_threadsafe(self._beat(), self.loop)
+            try:
+                future.result()
+            except Exception:
+                # ループが停止した
+                return
+            delay = time.perf_counter() - started
+            with self._lock:
+                self.window.record(delay)
+                self.total.record(delay)
+
+    def take_window(self) -> LatencyHistogram:
+        """前回呼び出し以降の計測値を返し、次の区間の計測を始めます"""
+        with self._lock:
+            window, self.window = self.window, LatencyHistogram()
+        return window
+
+    def stop(self) -> None:
+        self._stop_event.set()
+
+
+def rss_bytes() -> int:
+    """現在の常駐メモリ量 (バイト)。/proc が無い環境では最大常駐メモリ量を返します"""
+    try:
+        with open('/proc/self/statm', 'r') as f:
+            return int(f.read().split()[1]) * os.sysconf('SC_PAGE_SIZE')
+    except (OSError, ValueError, IndexError):
+        # Linux 以外では ru_maxrss の単位がバイト (macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak if os.uname().sysname == 'Darwin' else peak * 1024
+
+
+def memory_slope(samples: List[List[float]]) -> float:
+    """(経過秒, RSS) の列から最小二乗法で求めた増加率 (MB/分)"""
+    if len(samples) < 2:
+        return 0.0
+    xs = [s[0] for s in samples]
+    ys = [s[1] for s in samples]
+    mean_x = sum(xs) / len(xs)
+    mean_y = sum(ys) / len(ys)
+    var = sum((x - mean_x) ** 2 for x in xs)
+    if var == 0:
+        return 0.0
+    slope = sum((x - mean_x) * (y - mean_y) for x, y in zip(xs, ys)) / var
+    return slope * 60 / (1024 * 1024)
+
+
+def interaction_payload(seq: int, count: int, channel_id: int, user_id: int) -> Dict[str, Any]:
+    """/random_weapon count:<count> のスラッシュコマンド Interaction を作ります"""
+    options = [{'name': 'count', 'type': 4, 'value': count}] if count != 1 else []
+    return {
+        'id': str(300000000000000000 + seq),
+        'application_id': str(APPLICATION_ID),
+        'type': 2,
+        'token': f"load-{seq}",
+        'version': 1,
+        'locale': 'ja',
+        'channel_id': str(channel_id),
+        'channel': {'id': str(channel_id), 'type': 1},
+        'user': {
+            'id': str(user_id),
+            'username': f"player{user_id % 10000}",
+            'discriminator': '0',
+            'global_name': None,
+            'avatar': None,
+        },
+        'app_permissions': '0',
+        'attachment_size_limit': 10 * 1024 * 1024,
+        'entitlements': [],
+        'authorizing_integration_owners': {},
+        'data': {
+            'id': '400000000000000001',
+            'name': 'random_weapon',
+            'type': 1,
+            'options': options,
+        },
+    }
+
+
+class LoadTest:
+    """Interaction を開ループで (前の応答を待たずに) 投入し、結果を集計します"""
+
+    def __init__(self, bot: commands.Bot, discord_server: FakeDiscordServer, counts: List[int], channels: int):
+        self.bot = bot
+        self.discord_server = discord_server
+        self.counts = counts
+        self.channels = max(1, channels)
+        self.rng = random.Random(0)
+        self.seq = 0
+        self.inflight: Set[asyncio.Task] = set()
+        self.peak_inflight = 0
+        self.outcomes: Counter = Counter()
+        self.window = {'first': LatencyHistogram(), 'total': LatencyHistogram()}
+        self.total = {'first': LatencyHistogram(), 'total': LatencyHistogram()}
+
+    def dispatch(self) -> None:
+        self.seq += 1
+        payload = interaction_payload(
+            self.seq, self.rng.choice(self.counts),
+            500000000000000000 + self.seq % self.channels, 600000000000000000 + self.rng.randrange(10000))
+        task = asyncio.create_task(self._invoke(payload))
+        self.inflight.add(task)
+        task.add_done_callback(self.inflight.discard)
+        self.peak_inflight = max(self.peak_inflight, len(self.inflight))
+
+    async def _invoke(self, payload: Dict[str, Any]) -> None:
+        token = payload['token']
+        started = time.perf_counter()
+        try:
+            interaction = discord.Interaction(data=payload, state=self.bot._connection)
+            await self.bot.tree._call(interaction)
+        except Exception as e:
+            self.outcomes['exception'] += 1
+            self.outcomes[f"exception:{type(e).__name__}"] += 1
+            return
+        finally:
+            elapsed = time.perf_counter() - started
+            responded_at = self.discord_server.responded_at.get(token)
+            messages = self.discord_server.forget(token)
+        self._record(elapsed, None if responded_at is None else responded_at - started)
+        self.outcomes[self._classify(messages)] += 1
+
+    @staticmethod
+    def _classify(messages: List[Dict[str, Any]]) -> str:
+        """送信されたメッセージから応答の種類を判定します"""
+        if not messages:
+            return 'no_response'
+        if any(m['content'].startswith('エラー') for m in messages):
+            return 'error'
+        if any(m['attachments'] for m in messages):
+            return 'image'
+        if any((e.get('image') or {}).get('url', '').startswith('https://') for m in messages for e in m['embeds']):
+            return 'cached_image'
+        return 'text_only'
+
+    def _record(self, elapsed: float, first: Optional[float]) -> None:
+        for stats in (self.window, self.total):
+            stats['total'].record(elapsed)
+            if first is not None:
+                stats['first'].record(first)
+
+    def take_window(self) -> Dict[str, LatencyHistogram]:
+        window, self.window = self.window, {'first': LatencyHistogram(), 'total': LatencyHistogram()}
+        return window
+
+
+async def run(args: argparse.Namespace) -> Dict[str, Any]:
+    standin = StandinServer(latency=args.upstream_latency)
+    await standin.start()
+    WeaponDataParams.API_URL = f"{standin.base_url}/api/v3/weapon"
+    WeaponDataParams.ABILITY_API_URL = f"{standin.base_url}/api/v3/ability"
+    WeaponDataParams.IMAGE_BASE_URL = standin.image_base_url
+
+    discord_server = FakeDiscordServer(latency=args.discord_latency, rate_limit_ratio=args.rate_limit_ratio)
+    await discord_server.start()
+    discord.http.Route.BASE = discord_server.api_base
+
+    bot = commands.Bot(command_prefix='!', intents=discord.Intents.none(), help_command=None)
+    probe = HeartbeatProbe(asyncio.get_running_loop(), args.heartbeat_interval)
+    try:
+        await bot.login('load-test-token')
+        await bot.add_cog(Spl3Random(bot))
+        cog = bot.get_cog('Spl3Random')
+        if not args.cold:
+            # 本番の起動時と同じく画像を事前に取得した状態から計測する
+            await cog.warm_up()
+
+        test = LoadTest(bot, discord_server, args.counts, args.channels)
+        gc.collect()
+        rss_start = rss_bytes()
+        memory: List[List[float]] = [[0.0, rss_start]]
+        windows: List[Dict[str, Any]] = []
+        probe.start()
+
+        loop = asyncio.get_running_loop()
+        started = loop.time()
+        next_at = started
+        window_start = started
+        window_sent = 0
+        done_before = 0
+        rate = args.rate
+        sustained_rate: Optional[float] = None
+
+        print(f"{'elapsed':>8} {'rate':>6} {'sent':>7} {'done/s':>7} {'inflight':>8} "
+              f"{'p50_ms':>9} {'p99_ms':>9} {'hb_p99_ms':>10} {'hb_max_ms':>10} {'rss_mb':>8}")
+        while loop.time() - started < args.duration:
+            now = loop.time()
+            if now >= window_start + args.interval:
+                done = test.total['total'].count
+                stats = test.take_window()
+                heartbeat = probe.take_window()
+                rss = rss_bytes()
+                memory.append([round(now - started, 1), rss])
+                window = {
+                    'elapsed': round(now - started, 1),
+                    'rate': rate,
+                    'sent': window_sent,
+                    'throughput': round((done - done_before) / (now - window_start), 2),
+                    'inflight': len(test.inflight),
+                    'first_response': stats['first'].summary(),
+                    'latency': stats['total'].summary(),
+                    'heartbeat': heartbeat.summary(),
+                    'rss_mb': round(rss / (1024 * 1024), 1),
+                }
+                windows.append(window)
+                print(f"{window['elapsed']:>8} {rate:>6g} {window_sent:>7} {window['throughput']:>7} "
+                      f"{window['inflight']:>8} {window['latency']['p50_ms']:>9} {window['latency']['p99_ms']:>9} "
+                      f"{window['heartbeat']['p99_ms']:>10} {window['heartbeat']['max_ms']:>10} {window['rss_mb']:>8}")
+                # ハートビートの遅れ・p99 のほか、投入や完了が指定の頻度に追いつかない場合も上限を超えたとみなす
+                overloaded = (heartbeat.max > args.lag_limit
+                              or (args.p99_limit > 0 and stats['total'].percentile(0.99) > args.p99_limit)
+                              or window_sent < rate * (now - window_start) * 0.9
+                              or window['throughput'] < rate * 0.8)
+                if args.ramp > 0:
+                    if overloaded:
+                        print(f"Stopping ramp: limits exceeded at {rate:g}/s")
+                        break
+                    sustained_rate = rate
+                    rate += args.ramp
+                window_start = now
+                window_sent = 0
+                done_before = done
+
+            if now >= next_at:
+                test.dispatch()
+                window_sent += 1
+                # 一定間隔またはポアソン到着で次の投入時刻を決める
+                gap = test.rng.expovariate(rate) if args.poisson else 1 / rate
+                next_at = max(next_at + gap, now - 1.0)
+                continue
+            await asyncio.sleep(min(next_at - now, window_start + args.interval - now))
+
+        sent = test.seq
+        send_seconds = loop.time() - started
+        if test.inflight:
+            done, pending = await asyncio.wait(set(test.inflight), timeout=args.drain_timeout)
+            if pending:
+                test.outcomes['timeout'] += len(pending)
+            for task in pending:
+                task.cancel()
+        elapsed = loop.time() - started
+        gc.collect()
+        rss_end = rss_bytes()
+        memory.append([round(elapsed, 1), rss_end])
+    finally:
+        probe.stop()
+        await bot.close()
+        await discord_server.stop()
+        await standin.stop()
+
+    completed = test.total['total'].count
+    # 最初の区間はキャッシュが埋まる分の増加を含むため、増加率はそれ以降の区間から求める
+    steady = memory[2:] if len(memory) > 3 else memory
+    return {
+        'config': {
+            'rate': args.rate,
+            'ramp': args.ramp,
+            'duration': args.duration,
+            'counts': args.counts,
+            'poisson': args.poisson,
+            'upstream_latency': args.upstream_latency,
+            'discord_latency': args.discord_latency,
+            'rate_limit_ratio': args.rate_limit_ratio,
+            'cold': args.cold,
+        },
+        'sent': sent,
+        'completed': completed,
+        'offered_rate': round(sent / send_seconds, 2) if send_seconds > 0 else 0.0,
+        'throughput': round(completed / elapsed, 2) if elapsed > 0 else 0.0,
+        'peak_inflight': test.peak_inflight,
+        'outcomes': dict(test.outcomes),
+        'first_response': test.total['first'].summary(),
+        'latency': test.total['total'].summary(),
+        'heartbeat': probe.total.summary(),
+        'heartbeat_over_limit': sum(w['heartbeat']['max_ms'] > args.lag_limit * 1000 for w in windows),
+        'sustained_rate': sustained_rate,
+        'memory': {
+            'rss_start_mb': round(rss_start / (1024 * 1024), 1),
+            'rss_end_mb': round(rss_end / (1024 * 1024), 1),
+            'growth_mb': round((rss_end - rss_start) / (1024 * 1024), 1),
+            'steady_slope_mb_per_min': round(memory_slope(steady), 3),
+            'samples': [[t, round(b / (1024 * 1024), 1)] for t, b in memory],
+        },
+        'discord_requests': dict(discord_server.requests),
+        'upstream_requests': dict(standin.requests),
+        'windows': windows,
+    }
+
+
+def print_summary(result: Dict[str, Any]) -> None:
+    print()
+    print(f"sent {result['sent']} ({result['offered_rate']}/s), completed {result['completed']} "
+          f"({result['throughput']}/s), peak in-flight {result['peak_inflight']}")
+    print(f"outcomes: {', '.join(f'{k}={v}' for k, v in sorted(result['outcomes'].items()))}")
+    print(f"{'':<16} {'n':>8} {'mean_ms':>9} {'p50_ms':>9} {'p90_ms':>9} {'p99_ms':>9} {'max_ms':>9}")
+    for name in ('first_response', 'latency', 'heartbeat'):
+        s = result[name]
+        print(f"{name:<16} {s['n']:>8} {s['mean_ms']:>9} {s['p50_ms']:>9} {s['p90_ms']:>9} {s['p99_ms']:>9} {s['max_ms']:>9}")
+    memory = result['memory']
+    print(f"rss {memory['rss_start_mb']}MB -> {memory['rss_end_mb']}MB "
+          f"(+{memory['growth_mb']}MB, steady {memory['steady_slope_mb_per_min']}MB/min)")
+    if result['sustained_rate'] is not None:
+        print(f"highest rate within limits: {result['sustained_rate']:g}/s")
+    print(f"discord requests: {dict(sorted(result['discord_requests'].items()))}")
+    print(f"upstream requests: {dict(sorted(result['upstream_requests'].items()))}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="/random_weapon の負荷試験・長時間試験")
+    parser.add_argument('--rate', type=float, default=10.0, help="1秒あたりのコマンド数")
+    parser.add_argument('--duration', type=float, default=30.0, help="投入を続ける秒数")
+    parser.add_argument('--interval', type=float, default=5.0, help="途中経過を表示する間隔 (秒)")
+    parser.add_argument('--ramp', type=float, default=0.0,
+                        help="区間ごとに rate をこの値ずつ上げ、上限を超えたら止める (0 で一定)")
+    parser.add_argument('--counts', type=lambda s: [int(x) for x in s.split(',')], default=[1, 2, 4, 8],
+                        help="人数の候補 (カンマ区切り、コマンドごとにランダムに選ぶ)")
+    parser.add_argument('--channels', type=int, default=50, help="コマンドを送るチャンネルの数")
+    parser.add_argument('--poisson', action='store_true', help="一定間隔ではなくポアソン到着で投入する")
+    parser.add_argument('--cold', action='store_true', help="画像の事前取得をせずに始める")
+    parser.add_argument('--upstream-latency', type=float, default=0.0, help="stat.ink / splatoonwiki の代替の応答遅延 (秒)")
+    parser.add_argument('--discord-latency', type=float, default=0.05, help="Discord API の代替の応答遅延 (秒)")
+    parser.add_argument('--rate-limit-ratio', type=float, default=0.0, help="Discord API の代替が 429 を返す割合")
+    parser.add_argument('--heartbeat-interval', type=float, default=0.25, help="ハートビートの遅延を計測する間隔 (秒)")
+    parser.add_argument('--lag-limit', type=float, default=1.0, help="許容するハートビートの遅延 (秒)")
+    parser.add_argument('--p99-limit', type=float, default=0.0, help="許容する完了までの p99 (秒, 0 で判定しない)")
+    parser.add_argument('--drain-timeout', type=float, default=30.0, help="投入終了後に実行中のコマンドを待つ秒数")
+    parser.add_argument('--json', help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+    if args.rate <= 0:
+        parser.error("--rate must be positive")
+
+    try:
+        result = asyncio.run(run(args))
+    finally:
+        shutil.rmtree(_WORKDIR, ignore_errors=True)
+    print_summary(result)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(result, f, indent=2, ensure_ascii=False)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,31 @@
+"""stat.ink のブキ・ギアパワー一覧を bench/fixtures/ に記録します
+
+使い方:
+    python -m bench.record_fixtures
+"""
+import asyncio
+import json
+import os
+
+import aiohttp
+
+from bench.fixtures import FIXTURE_DIR
+from data.weapon_api import WeaponDataParams
+
+
+async def main():
+    os.makedirs(FIXTURE_DIR, exist_ok=True)
+    headers = {"User-Agent": WeaponDataParams.USER_AGENT}
+    async with aiohttp.ClientSession(headers=headers) as session:
+        for name, url in (('weapon', WeaponDataParams.API_URL), ('ability', WeaponDataParams.ABILITY_API_URL)):
+            async with session.get(url) as response:
+                response.raise_for_status()
+                data = await response.json()
+            path = os.path.join(FIXTURE_DIR, f"{name}.json")
+            with open(path, 'w', encoding='utf-8') as f:
+                json.dump(data, f, ensure_ascii=False, indent=1)
+            print(f"Recorded {len(data)} items to {path}")
+
+
+if __name__ == '__main__':
+    asyncio.run(main())
@@ -0,0 +1,224 @@
+"""ホットパスのマイクロベンチマーク (ネットワーク不要)
+
+stat.ink / splatoonwiki の代わりにローカルの代替サーバーを起動し、
+抽選・ギア生成・オートコンプリート・画像取得・合成・エンコードの各段階を 1〜8 人分で計測します。
+
+使い方:
+    python -m bench.run                     # 計測して保存済みのベースラインと比較
+    python -m bench.run --save-baseline     # 結果を bench/baseline.json に保存
+    python -m bench.run --check             # ベースラインより遅くなった段階があれば終了コード1
+"""
+import os
+import tempfile
+
+# キャッシュの保存先はデータ層の読み込み前に一時ディレクトリへ向ける
+_WORKDIR = tempfile.mkdtemp(prefix='spl3_bench_')
+os.environ.setdefault('IMAGE_CACHE_DIR', os.path.join(_WORKDIR, 'images'))
+os.environ.setdefault('CATALOG_DIR', os.path.join(_WORKDIR, 'catalog'))
+os.environ.setdefault('REDIRECT_CACHE_PATH', os.path.join(_WORKDIR, 'redirects.json'))
+os.environ.setdefault('ASSET_WARMUP', '0')
+
+import argparse
+import asyncio
+import json
+import random
+import shutil
+import statistics
+import time
+from typing import Awaitable, Callable, Dict, List, Optional
+
+from bench.standin_server import StandinServer
+from cogs.spl3_random import Spl3Random
+from data.image_cache import ImageCache
+from data.image_encoder import encode_image
+from data.loadout_renderer import compose_loadout
+from data.weapon_api import WeaponDataParams
+
+BASELINE_PATH = os.path.join(os.path.dirname(__file__), 'baseline.json')
+COUNTS = range(1, 9)
+
+
+def summarize(samples: List[float]) -> Dict[str, float]:
+    """計測値 (秒) からスループットとレイテンシ分布 (ミリ秒) を求めます"""
+    ordered = sorted(samples)
+
+    def pct(p: float) -> float:
+        return ordered[min(len(ordered) - 1, int(len(ordered) * p))] * 1000
+
+    total = sum(samples)
+    return {
+        'n': len(samples),
+        'ops_per_sec': round(len(samples) / total, 1) if total > 0 else 0.0,
+        'p50_ms': round(statistics.median(ordered) * 1000, 4),
+        'p90_ms': round(pct(0.90), 4),
+        'p99_ms': round(pct(0.99), 4),
+        'max_ms': round(ordered[-1] * 1000, 4),
+    }
+
+
+def measure(func: Callable[[], object], iterations: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def measure_async(func: Callable[[], Awaitable[object]], iterations: int) -> Dict[str, float]:
+    samples = []
+    for _ in range(iterations):
+        start = time.perf_counter()
+        await func()
+        samples.append(time.perf_counter() - start)
+    return summarize(samples)
+
+
+async def run(iterations: int, latency: float) -> Dict[str, Dict[str, float]]:
+    server = StandinServer(latency=latency)
+    await server.start()
+    WeaponDataParams.API_URL = f"{server.base_url}/api/v3/weapon"
+    WeaponDataParams.ABILITY_API_URL = f"{server.base_url}/api/v3/ability"
+    WeaponDataParams.IMAGE_BASE_URL = server.image_base_url
+
+    cog = Spl3Random(None)
+    dm = cog.data_manager
+    results: Dict[str, Dict[str, float]] = {}
+    try:
+        start = time.perf_counter()
+        await dm.open()
+        await dm.fetch_weapons()
+        await cog.fetch_gear_abilities()
+        results['catalog_load'] = summarize([time.perf_counter() - start])
+
+        weapons = dm.get_all_weapons()
+        types = [t.key for t in dm.get_weapon_types()]
+        subs = [s.key for s in dm.get_sub_weapons()]
+        rng = random.Random(0)
+
+        # 1. 抽選
+        results['get_random_weapon'] = measure(lambda: dm.get_random_weapon(rng.choice(types)), iterations * 10)
+        for count in COUNTS:
+            results[f'sample_weapons[count={count}]'] = measure(lambda: dm.sample_weapons(count), iterations * 10)
+            results[f'sample_weapons_filtered[count={count}]'] = measure(
+                lambda: dm.sample_weapons(count, rng.choice(types), rng.choice(subs)), iterations * 10)
+
+        # 2. ギア構成
+        results['gear_set'] = measure(cog._generate_gear_set, iterations * 10)
+
+        # 3. オートコンプリート (全言語名の接頭辞を入力として使う)
+        queries = []
+        for item in dm.get_sub_weapons() + dm.get_special_weapons() + dm.get_weapon_types():
+            for name in item.all_names():
+                queries.extend(name[:n] for n in range(1, min(len(name), 6) + 1))
+        rng.shuffle(queries)
+        query_iter = iter(queries * (iterations * 10 // max(1, len(queries)) + 1))
+        results['autocomplete'] = await measure_async(
+            lambda: cog._autocomplete_helper(next(query_iter), rng.choice(('type', 'sub', 'special'))), iterations * 10)
+
+        # 4. 画像取得 (キャッシュなし / キャッシュあり)
+        urls = [dm.get_image_url(w) for w in weapons]
+        dm.image_cache = ImageCache(os.path.join(_WORKDIR, 'cold_images'))
+        url_iter = iter(urls * (iterations // len(urls) + 1))
+        results['image_fetch_cold'] = await measure_async(lambda: dm.fetch_image_data(next(url_iter)), min(iterations, len(urls)))
+        await dm.prefetch_images(urls + list(cog.GEAR_IMAGE_URLS.values()))
+        results['image_fetch_warm'] = await measure_async(lambda: dm.fetch_image_data(rng.choice(urls)), iterations)
+
+        # 5. 合成・エンコード・一連の画像生成
+        for count in COUNTS:
+            selected = dm.sample_weapons(count)
+            gears = [cog._generate_gear_set() for _ in selected]
+            layout = {
+                'gear_size': 64,
+                'padding': 10,
+                'players': [
+                    {
+                        'main_key': w.key,
+                        'main': await dm.fetch_image_data(dm.get_image_url(w)),
+                        'gears': [[g['key'], await dm.fetch_image_data(cog.GEAR_IMAGE_URLS[g['key']])] for g in gear_set],
+                    }
+                    for w, gear_set in zip(selected, gears)
+                ],
+            }
+            img = compose_loadout(layout)
+            results[f'compose[count={count}]'] = measure(lambda: compose_loadout(layout), iterations)
+            results[f'encode[count={count}]'] = measure(lambda: encode_image(img), iterations)
+
+            def _random_loadout():
+                picked = dm.sample_weapons(count)
+                return cog._generate_combined_image(picked, [cog._generate_gear_set() for _ in picked])
+
+            results[f'combined_image[count={count}]'] = await measure_async(_random_loadout, iterations)
+    finally:
+        await cog.cog_unload()
+        await server.stop()
+    return results
+
+
+def compare(results: Dict[str, Dict[str, float]], baseline: Dict[str, Dict[str, float]],
+            tolerance: float, floor_ms: float) -> List[str]:
+    """ベースラインより p50 が tolerance 以上 (かつ floor_ms 以上) 遅くなった段階を返します"""
+    regressions = []
+    for name, current in results.items():
+        base = baseline.get(name)
+        if base is None:
+            continue
+        limit = base['p50_ms'] * (1 + tolerance)
+        if current['p50_ms'] > limit and current['p50_ms'] - base['p50_ms'] > floor_ms:
+            regressions.append(f"{name}: p50 {base['p50_ms']:.4f}ms -> {current['p50_ms']:.4f}ms")
+    return regressions
+
+
+def print_table(results: Dict[str, Dict[str, float]], baseline: Optional[Dict[str, Dict[str, float]]]) -> None:
+    print(f"{'stage':<38} {'ops/s':>10} {'p50_ms':>10} {'p90_ms':>10} {'p99_ms':>10} {'max_ms':>10} {'vs base':>8}")
+    for name, r in results.items():
+        ratio = ''
+        if baseline and name in baseline and baseline[name]['p50_ms'] > 0:
+            ratio = f"{r['p50_ms'] / baseline[name]['p50_ms']:.2f}x"
+        print(f"{name:<38} {r['ops_per_sec']:>10} {r['p50_ms']:>10.4f} {r['p90_ms']:>10.4f} "
+              f"{r['p99_ms']:>10.4f} {r['max_ms']:>10.4f} {ratio:>8}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="ホットパスのマイクロベンチマーク")
+    parser.add_argument('--iterations', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.0, help="代替サーバーの応答遅延 (秒)")
+    parser.add_argument('--baseline', default=BASELINE_PATH)
+    parser.add_argument('--save-baseline', action='store_true')
+    parser.add_argument('--check', action='store_true', help="劣化があれば終了コード1で終了")
+    parser.add_argument('--tolerance', type=float, default=0.25, help="許容する p50 の増加率")
+    parser.add_argument('--floor-ms', type=float, default=0.05, help="これ未満の差は劣化とみなさない")
+    parser.add_argument('--json', help="結果をJSONで保存するファイル")
+    args = parser.parse_args()
+
+    try:
+        results = asyncio.run(run(args.iterations, args.latency))
+    finally:
+        shutil.rmtree(_WORKDIR, ignore_errors=True)
+
+    baseline = None
+    if os.path.exists(args.baseline):
+        with open(args.baseline, 'r', encoding='utf-8') as f:
+            baseline = json.load(f)
+    print_table(results, baseline)
+
+    if args.json:
+        with open(args.json, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+
+    if args.save_baseline:
+        with open(args.baseline, 'w', encoding='utf-8') as f:
+            json.dump(results, f, indent=2)
+        print(f"Saved baseline to {args.baseline}")
+        return
+
+    if baseline:
+        regressions = compare(results, baseline, args.tolerance, args.floor_ms)
+        for line in regressions:
+            print(f"REGRESSION {line}")
+        if regressions and args.check:
+            raise SystemExit(1)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,119 @@
+"""stat.ink と splatoonwiki の代わりに応答するローカルHTTPサーバー
+
+/api/v3/weapon, /api/v3/ability と /wiki/Special:Redirect/file/<name> (画像へリダイレクト) を提供します。
+単体で起動する場合:
+    python -m bench.standin_server [--port 8080] [--latency 0.05]
+"""
+import argparse
+import asyncio
+import hashlib
+import json
+import zlib
+from collections import Counter
+from typing import Dict, Optional
+
+from aiohttp import web
+
+from bench import fixtures
+
+
+class StandinServer:
+    """ベンチマーク・負荷試験用の代替サーバー
+
+    latency を指定すると各リクエストの応答をその秒数だけ遅らせます。
+    """
+
+    def __init__(self, host: str = '127.0.0.1', port: int = 0, latency: float = 0.0, main_size: int = 128):
+        self.host = host
+        self.port = port
+        self.latency = latency
+        self.main_size = main_size
+        self.requests: Counter = Counter()
+        self._catalogs: Dict[str, bytes] = {
+            name: json.dumps(fixtures.load(name), ensure_ascii=False).encode('utf-8')
+            for name in ('weapon', 'ability')
+        }
+        self._images: Dict[str, bytes] = {}
+        self._runner: Optional[web.AppRunner] = None
+
+    @property
+    def base_url(self) -> str:
+        return f"http://{self.host}:{self.port}"
+
+    @property
+    def image_base_url(self) -> str:
+        return f"{self.base_url}/wiki/Special:Redirect/file/"
+
+    async def _delay(self) -> None:
+        if self.latency > 0:
+            await asyncio.sleep(self.latency)
+
+    async def _catalog(self, request: web.Request) -> web.Response:
+        name = request.match_info['name']
+        self.requests[f"catalog:{name}"] += 1
+        body = self._catalogs.get(name)
+        if body is None:
+            return web.Response(status=404)
+        await self._delay()
+        etag = f'"{hashlib.sha256(body).hexdigest()[:16]}"'
+        if request.headers.get('If-None-Match') == etag:
+            return web.Response(status=304, headers={'ETag': etag})
+        return web.Response(body=body, content_type='application/json', headers={'ETag': etag})
+
+    async def _redirect(self, request: web.Request) -> web.Response:
+        self.requests['redirect'] += 1
+        await self._delay()
+        raise web.HTTPFound(f"/images/{request.match_info['name']}")
+
+    async def _image(self, request: web.Request) -> web.Response:
+        name = request.match_info['name']
+        self.requests['image'] += 1
+        data = self._images.get(name)
+        if data is None:
+            size = 64 if name.startswith('S3_Ability_') else self.main_size
+            data = fixtures.make_icon(zlib.crc32(name.encode('utf-8')), size)
+            self._images[name] = data
+        await self._delay()
+        return web.Response(body=data, content_type='image/png')
+
+    async def start(self) -> str:
+        """サーバーを起動し、ベースURLを返します"""
+        app = web.Application()
+        app.router.add_get('/api/v3/{name}', self._catalog)
+        app.router.add_get('/wiki/Special:Redirect/file/{name}', self._redirect)
+        app.router.add_get('/images/{name}', self._image)
+        self._runner = web.AppRunner(app, access_log=None)
+        await self._runner.setup()
+        site = web.TCPSite(self._runner, self.host, self.port)
+        await site.start()
+        self.port = self._runner.addresses[0][1]
+        return self.base_url
+
+    async def stop(self) -> None:
+        if self._runner is not None:
+            await self._runner.cleanup()
+            self._runner = None
+
+
+async def _serve(port: int, latency: float) -> None:
+    server = StandinServer(port=port, latency=latency)
+    await server.start()
+    print(f"Stand-in server running on {server.base_url}")
+    print(f"  STATINK_BASE_URL={server.base_url}")
+    print(f"  IMAGE_BASE_URL={server.image_base_url}")
+    await asyncio.Event().wait()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="stat.ink / splatoonwiki の代替サーバー")
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--latency', type=float, default=0.0)
+    args = parser.parse_args()
+    try:
+        asyncio.run(_serve(args.port, args.latency))
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,238 @@
+import asyncio
+import os
+import time
+from collections import deque
+from typing import Deque, Dict, List, Optional, Tuple
+
+import discord
+from discord.ext import commands
+
+
+class ResponseSchedulerParams:
+    # テキストコマンドの応答をチャンネルごとに送る速さ (CHANNEL_RATE 回 / CHANNEL_PER 秒)
+    # Discord のチャンネルへの送信の制限 (5回/5秒) を超えないようにします
+    CHANNEL_RATE = int(os.environ.get("RESPONSE_CHANNEL_RATE", 5))
+    CHANNEL_PER = float(os.environ.get("RESPONSE_CHANNEL_PER", 5.0))
+    # 送信が続いているチャンネルで、後続の応答をまとめるために待つ秒数
+    BATCH_WINDOW = float(os.environ.get("RESPONSE_BATCH_WINDOW", 0.25))
+    # 結果のテキストを先に返し、合成画像は完成後に編集で追加する (0 で無効)
+    PROGRESSIVE = os.environ.get("PROGRESSIVE_REPLY", "1") != "0"
+    # 合成画像を待つ上限 (秒)。超えた場合は画像なしの結果のままにする
+    IMAGE_DEADLINE = float(os.environ.get("IMAGE_RENDER_DEADLINE", 8.0))
+
+# 1メッセージあたりの Discord の上限
+MAX_EMBEDS = 10
+MAX_FILES = 10
+MAX_EMBED_CHARS = 6000
+MAX_CONTENT_CHARS = 2000
+
+
+class _RateLimiter:
+    """キーごとのスライディングウィンドウ方式の送信回数制限"""
+
+    def __init__(self, rate: int, per: float):
+        self.rate = max(1, rate)
+        self.per = per
+        self._sent: Dict[int, Deque[float]] = {}
+
+    def _window(self, key: int) -> Deque[float]:
+        sent = self._sent.setdefault(key, deque())
+        now = time.monotonic()
+        while sent and now - sent[0] >= self.per:
+            sent.popleft()
+        return sent
+
+    def used(self, key: int) -> int:
+        """直近のウィンドウ内での送信回数"""
+        sent = self._window(key)
+        if not sent:
+            self._sent.pop(key, None)
+        return len(sent)
+
+    async def acquire(self, key: int) -> None:
+        """送信枠が空くまで待ってから1回分を消費します"""
+        while True:
+            sent = self._window(key)
+            if len(sent) < self.rate:
+                sent.append(time.monotonic())
+                return
+            await asyncio.sleep(self.per - (time.monotonic() - sent[0]))
+
+
+class _PendingReply:
+    __slots__ = ('ctx', 'content', 'embed', 'files', 'future', 'mergeable')
+
+    def __init__(self, ctx: commands.Context, content: Optional[str], embed: Optional[discord.Embed],
+                 files: List[discord.File], future: asyncio.Future, mergeable: bool):
+        self.ctx = ctx
+        self.content = content
+        self.embed = embed
+        self.files = files
+        self.future = future
+        self.mergeable = mergeable
+
+
+class ResponseScheduler:
+    """コマンドの応答をまとめて送信するスケジューラー
+
+    スラッシュコマンドでは Interaction への応答 (defer 済みの場合はその応答の編集) で返すため、
+    応答1件につきリクエストは1回です。
+    テキストコマンドではチャンネルごとに送信回数を制限し、送信が続いている間に溜まった応答を
+    1つのメッセージ (Embed・添付ファイルはそれぞれ10個まで) にまとめて送信することで、
+    429 (レート制限) による待機を起こさないようにします。
+    複数のユーザーへの応答をまとめる場合は、各応答に依頼者の名前を付けます。
+    """
+
+    def __init__(self, rate: int = ResponseSchedulerParams.CHANNEL_RATE,
+                 per: float = ResponseSchedulerParams.CHANNEL_PER,
+                 batch_window: float = ResponseSchedulerParams.BATCH_WINDOW):
+        self.batch_window = batch_window
+        self._limiter = _RateLimiter(rate, per)
+        self._queues: Dict[int, List[_PendingReply]] = {}
+        self._workers: Dict[int, asyncio.Task] = {}
+
+    async def send(self, ctx: commands.Context, content: Optional[str] = None, *,
+                   embed: Optional[discord.Embed] = None, file: Optional[discord.File] = None,
+                   files: Optional[List[discord.File]] = None, mergeable: bool = True) -> Optional[discord.Message]:
+        """コマンドへの応答を送信し、送信されたメッセージを返します
+
+        後から edit() で編集する応答は mergeable=False とし、他の応答とまとめずに送ります。
+        """
+        files = ([file] if file else []) + list(files or [])
+        if ctx.interaction is not None:
+            return await self._send_interaction(ctx.interaction, content, embed, files)
+
+        future = asyncio.get_running_loop().create_future()
+        key = ctx.channel.id
+        self._queues.setdefault(key, []).append(_PendingReply(ctx, content, embed, files, future, mergeable))
+        if key not in self._workers:
+            self._workers[key] = asyncio.create_task(self._drain(key))
+        return await future
+
+    async def defer(self, ctx: commands.Context) -> None:
+        """スラッシュコマンドにまだ応答していなければ「考え中」を表示します (結果は send() で返します)
+
+        すぐに結果を返せる場合は defer せずに send() することで、応答のリクエストを1回減らせます。
+        """
+        if ctx.interaction is not None and not ctx.interaction.response.is_done():
+            await ctx.interaction.response.defer()
+
+    async def edit(self, ctx: commands.Context, message: discord.Message, *,
+                   embed: discord.Embed, file: Optional[discord.File] = None) -> discord.Message:
+        """send() で送信した応答の Embed を差し替え、添付ファイルを追加します"""
+        attachments = [file] if file else discord.utils.MISSING
+        if ctx.interaction is not None:
+            return await ctx.interaction.edit_original_response(embed=embed, attachments=attachments)
+        # メッセージの編集もチャンネルの送信枠を消費する
+        await self._limiter.acquire(ctx.channel.id)
+        return await message.edit(embed=embed, attachments=attachments)
+
+    def is_busy(self, ctx: commands.Context) -> bool:
+        """ctx のチャンネルで応答が混み合っているか (応答を分けて送ると送信枠を圧迫する状態か)"""
+        if ctx.interaction is not None:
+            # スラッシュコマンドの応答は Interaction ごとの枠なので混み合わない
+            return False
+        key = ctx.channel.id
+        return bool(self._queues.get(key)) or self._limiter.used(key) * 2 >= self._limiter.rate
+
+    async def _send_interaction(self, interaction: discord.Interaction, content: Optional[str],
+                                embed: Optional[discord.Embed], files: List[discord.File]) -> Optional[discord.Message]:
+        if not interaction.response.is_done():
+            callback = await interaction.response.send_message(content=content, embed=embed, files=files)
+            # 以降の send() はフォローアップとして送る (edit() は引き続きこの応答を編集する)
+            interaction.extras['original_edited'] = True
+            # 応答のメッセージはコールバックの結果に含まれるため、取得し直さない
+            if isinstance(callback.resource, discord.InteractionMessage):
+                return callback.resource
+            return await interaction.original_response()
+        if not interaction.extras.get('original_edited'):
+            # defer で表示した「考え中」の応答をそのまま結果に置き換える
+            interaction.extras['original_edited'] = True
+            return await interaction.edit_original_response(
+                content=content, embed=embed, attachments=files)
+        return await interaction.followup.send(content=content, embed=embed, files=files, wait=True)
+
+    async def _drain(self, key: int) -> None:
+        """チャンネルに溜まった応答を送信枠に合わせてまとめて送信します"""
+        try:
+            while self._queues.get(key):
+                if self._limiter.used(key) > 0:
+                    # 送信が続いている間は少し待って後続の応答を同じメッセージにまとめる
+                    await asyncio.sleep(self.batch_window)
+                await self._limiter.acquire(key)
+                batch = self._take_batch(self._queues[key])
+                await self._send_batch(batch)
+        finally:
+            self._workers.pop(key, None)
+            for pending in self._queues.pop(key, []):
+                if not pending.future.done():
+                    pending.future.set_exception(RuntimeError("response scheduler stopped"))
+
+    @staticmethod
+    def _take_batch(queue: List[_PendingReply]) -> List[_PendingReply]:
+        """1メッセージに収まる分だけ先頭から取り出します"""
+        batch: List[_PendingReply] = []
+        embeds = files = embed_chars = content_chars = 0
+        while queue:
+            pending = queue[0]
+            if batch and not (pending.mergeable and batch[0].mergeable):
+                break
+            n_embeds = 1 if pending.embed else 0
+            # 他のユーザーの応答とまとめる場合に付ける名前の分も含めて数える
+            label = len(pending.ctx.author.display_name) + 10
+            n_chars = len(pending.embed) + (0 if pending.embed.author.name else label) if pending.embed else 0
+            n_content = len(pending.content) + 1 + label if pending.content else 0
+            if batch and (embeds + n_embeds > MAX_EMBEDS or files + len(pending.files) > MAX_FILES
+                          or embed_chars + n_chars > MAX_EMBED_CHARS
+                          or content_chars + n_content > MAX_CONTENT_CHARS):
+                break
+            batch.append(queue.pop(0))
+            embeds += n_embeds
+            files += len(pending.files)
+            embed_chars += n_chars
+            content_chars += n_content
+        return batch
+
+    @staticmethod
+    def _label(batch: List[_PendingReply]) -> List[Tuple[Optional[str], Optional[discord.Embed]]]:
+        """複数のユーザーへの応答をまとめる場合は、どの応答が誰のものか分かるよう依頼者の名前を付けます"""
+        if len({p.ctx.author.id for p in batch}) <= 1:
+            return [(p.content, p.embed) for p in batch]
+        labeled = []
+        for p in batch:
+            author = p.ctx.author
+            content = f"**{author.display_name}**: {p.content}" if p.content else None
+            embed = p.embed
+            if embed is not None and not embed.author.name:
+                embed = embed.copy()
+                embed.set_author(name=f"{author.display_name} さんの選出結果", icon_url=author.display_avatar.url)
+            labeled.append((content, embed))
+        return labeled
+
+    @classmethod
+    async def _send_batch(cls, batch: List[_PendingReply]) -> None:
+        first = batch[0]
+        labeled = cls._label(batch)
+        content = '\n'.join(c for c, _ in labeled if c) or None
+        embeds = [e for _, e in labeled if e]
+        files = [f for p in batch for f in p.files]
+        try:
+            message = await first.ctx.channel.send(
+                content=content, embeds=embeds, files=files,
+                reference=first.ctx.message.to_reference(fail_if_not_exists=False),
+                mention_author=False)
+        except Exception as e:
+            for pending in batch:
+                if not pending.future.done():
+                    pending.future.set_exception(e)
+            return
+        for pending in batch:
+            if not pending.future.done():
+                pending.future.set_result(message)
+
+    async def close(self) -> None:
+        """送信待ちの処理を停止します"""
+        workers = list(self._workers.values())
+        for task in workers:
+            task.cancel()
+        await asyncio.gather(*workers, return_exceptions=True)
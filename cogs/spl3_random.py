@@ -1,18 +1,35 @@
 import discord
 from discord.ext import commands
 from discord import app_commands
-from data.weapon_api import WeaponDataManager
-from typing import List, Optional
+from data.weapon_api import WeaponDataManager, WeaponDataParams
+from data.catalog import Weapon
+from data.metrics import COMMAND_SECONDS, COMMAND_STAGE_SECONDS, EVENT_LOOP_LAG_SECONDS, RENDER_FALLBACKS
+from data.render_worker import RenderWorker, RenderQueueFull
+from data.bulk_export import BulkParams, export, iter_rows, paginate
+from data.attachment_cache import AttachmentCache, layout_digest
+from data.sprite_atlas import get_atlas
+from data.metrics import register_cache
+from cogs.response_scheduler import ResponseScheduler, ResponseSchedulerParams
+from typing import Dict, List, Optional, Tuple
 import io
 import random
 import asyncio
-import aiohttp
-from PIL import Image
+import time
 
 class Spl3Random(commands.Cog):
     def __init__(self, bot):
         self.bot = bot
         self.data_manager = WeaponDataManager()
+        # 画像の合成・エンコードはイベントループ外のワーカーで行う
+        self.render_worker = RenderWorker()
+        # アップロード済みの合成画像のURL (同じ組み合わせは再アップロードしない)
+        self.attachment_cache = AttachmentCache()
+        register_cache('attachment', self.attachment_cache)
+        # 応答の送信 (レート制限に合わせてまとめて送る)
+        self.responses = ResponseScheduler()
+        self._warmup_task: Optional[asyncio.Task] = None
+        self._refresh_task: Optional[asyncio.Task] = None
+        self._loop_monitor_task: Optional[asyncio.Task] = None
         # ギアパワーのデータ格納用
         self.gear_powers = {
             'head': [],
@@ -26,54 +43,154 @@ class Spl3Random(commands.Cog):
             'shoes': ['stealth_jump', 'object_shredder', 'drop_roller']
         }
         # Inkipedia (SplatoonWiki) の画像URL定義
+        base = WeaponDataParams.IMAGE_BASE_URL
         self.GEAR_IMAGE_URLS = {
-            'ink_saver_main': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Ink_Saver_(Main).png',
-            'ink_saver_sub': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Ink_Saver_(Sub).png',
-            'ink_recovery_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Ink_Recovery_Up.png',
-            'run_speed_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Run_Speed_Up.png',
-            'swim_speed_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Swim_Speed_Up.png',
-            'special_charge_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Special_Charge_Up.png',
-            'special_saver': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Special_Saver.png',
-            'special_power_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Special_Power_Up.png',
-            'quick_respawn': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Quick_Respawn.png',
-            'quick_super_jump': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Quick_Super_Jump.png',
-            'sub_power_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Sub_Power_Up.png',
-            'ink_resistance_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Ink_Resistance_Up.png',
-            'sub_resistance_up': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Sub_Resistance_Up.png',
-            'intensify_action': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Intensify_Action.png',
-            'opening_gambit': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Opening_Gambit.png',
-            'last_ditch_effort': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Last-Ditch_Effort.png',
-            'tenacity': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Tenacity.png',
-            'comeback': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Comeback.png',
-            'ninja_squid': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Ninja_Squid.png',
-            'haunt': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Haunt.png',
-            'thermal_ink': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Thermal_Ink.png',
-            'respawn_punisher': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Respawn_Punisher.png',
-            'ability_doubler': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Ability_Doubler.png',
-            'stealth_jump': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Stealth_Jump.png',
-            'object_shredder': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Object_Shredder.png',
-            'drop_roller': 'https://splatoonwiki.org/wiki/Special:Redirect/file/S3_Ability_Drop_Roller.png'
+            'ink_saver_main': f'{base}S3_Ability_Ink_Saver_(Main).png',
+            'ink_saver_sub': f'{base}S3_Ability_Ink_Saver_(Sub).png',
+            'ink_recovery_up': f'{base}S3_Ability_Ink_Recovery_Up.png',
+            'run_speed_up': f'{base}S3_Ability_Run_Speed_Up.png',
+            'swim_speed_up': f'{base}S3_Ability_Swim_Speed_Up.png',
+            'special_charge_up': f'{base}S3_Ability_Special_Charge_Up.png',
+            'special_saver': f'{base}S3_Ability_Special_Saver.png',
+            'special_power_up': f'{base}S3_Ability_Special_Power_Up.png',
+            'quick_respawn': f'{base}S3_Ability_Quick_Respawn.png',
+            'quick_super_jump': f'{base}S3_Ability_Quick_Super_Jump.png',
+            'sub_power_up': f'{base}S3_Ability_Sub_Power_Up.png',
+            'ink_resistance_up': f'{base}S3_Ability_Ink_Resistance_Up.png',
+            'sub_resistance_up': f'{base}S3_Ability_Sub_Resistance_Up.png',
+            'intensify_action': f'{base}S3_Ability_Intensify_Action.png',
+            'opening_gambit': f'{base}S3_Ability_Opening_Gambit.png',
+            'last_ditch_effort': f'{base}S3_Ability_Last-Ditch_Effort.png',
+            'tenacity': f'{base}S3_Ability_Tenacity.png',
+            'comeback': f'{base}S3_Ability_Comeback.png',
+            'ninja_squid': f'{base}S3_Ability_Ninja_Squid.png',
+            'haunt': f'{base}S3_Ability_Haunt.png',
+            'thermal_ink': f'{base}S3_Ability_Thermal_Ink.png',
+            'respawn_punisher': f'{base}S3_Ability_Respawn_Punisher.png',
+            'ability_doubler': f'{base}S3_Ability_Ability_Doubler.png',
+            'stealth_jump': f'{base}S3_Ability_Stealth_Jump.png',
+            'object_shredder': f'{base}S3_Ability_Object_Shredder.png',
+            'drop_roller': f'{base}S3_Ability_Drop_Roller.png'
         }
 
     async def cog_load(self):
         """Cog読み込み時にデータをフェッチ（キャッシュ）します"""
-        await self.data_manager.fetch_weapons()
-        await self.fetch_gear_abilities()
+        await self.data_manager.open()
+        # 保存済みのスナップショットがあればそれで応答を始め、最新版はバックグラウンドで取得する
+        has_snapshot = self.data_manager.load_snapshots()
+        if not self.catalog_leader:
+            # 上流への取得がプロセス数倍にならないよう、担当プロセスが保存するスナップショットを待つ
+            await self._wait_for_snapshots()
+        # ブキとギアパワーの一覧は並行して取得する (スナップショットがあるものは取得しない)
+        await asyncio.gather(self.data_manager.fetch_weapons(), self.fetch_gear_abilities())
         print("Splatoon 3 Weapon Data loaded.")
+        if self.catalog_leader:
+            self._refresh_task = asyncio.create_task(self._refresh_catalogs_loop(revalidate_now=has_snapshot))
+        else:
+            # 複数プロセス構成では再取得は1プロセスのみが行い、他は共有スナップショットに追従する
+            self._refresh_task = asyncio.create_task(self._follow_catalogs_loop())
+        self._loop_monitor_task = asyncio.create_task(self._monitor_event_loop())
+        if WeaponDataParams.WARMUP_ENABLED and self.catalog_leader:
+            # 画像のプリフェッチはコマンドの受付を妨げないようバックグラウンドで行う
+            # (画像キャッシュはディスク上で共有されるため、担当プロセスのみが行う)
+            self._warmup_task = asyncio.create_task(self.warm_up())
+
+    @property
+    def catalog_leader(self) -> bool:
+        """このプロセスが stat.ink からのカタログ再取得を担当するかどうか"""
+        return getattr(self.bot, 'catalog_leader', True)
+
+    @property
+    def catalogs_loaded(self) -> bool:
+        """ブキ・ギアパワー一覧の両方が読み込まれているかどうか"""
+        return bool(self.data_manager.get_all_weapons()) and bool(self.gear_powers['head'])
+
+    async def cog_unload(self):
+        """Cog解除時に共有HTTPセッションとレンダリングワーカーを閉じます"""
+        for task in (self._warmup_task, self._refresh_task, self._loop_monitor_task):
+            if task is not None:
+                task.cancel()
+        await self.responses.close()
+        await self.data_manager.close()
+        self.render_worker.shutdown()
+
+    @commands.Cog.listener()
+    async def on_raw_message_delete(self, payload: discord.RawMessageDeleteEvent):
+        """画像を添付したメッセージが削除されたら、そのURLを再利用しないようにします"""
+        self.attachment_cache.invalidate_messages([payload.message_id])
+
+    @commands.Cog.listener()
+    async def on_raw_bulk_message_delete(self, payload: discord.RawBulkMessageDeleteEvent):
+        self.attachment_cache.invalidate_messages(payload.message_ids)
+
+    async def warm_up(self):
+        """全ブキ・全ギアパワーの画像を事前に取得してキャッシュに載せます (アトラスにあるものは除く)"""
+        atlas = get_atlas()
+        urls = [self.data_manager.get_image_url(w) for w in self.data_manager.get_all_weapons()
+                if atlas is None or not atlas.has('main', w.key)]
+        urls.extend(url for key, url in self.GEAR_IMAGE_URLS.items() if atlas is None or not atlas.has('gear', key))
+        failed = await self.data_manager.prefetch_images(urls)
+        if failed:
+            print(f"Failed to prefetch {len(failed)} images: {', '.join(failed[:5])}")
+        print("Image warm-up finished.")
+
+    async def _monitor_event_loop(self, interval: float = 0.5):
+        """イベントループの遅延 (sleepが予定よりどれだけ遅れて戻ったか) を記録します"""
+        loop = asyncio.get_running_loop()
+        while True:
+            start = loop.time()
+            await asyncio.sleep(interval)
+            EVENT_LOOP_LAG_SECONDS.observe(max(0.0, loop.time() - start - interval))
+
+    async def _refresh_catalogs_loop(self, revalidate_now: bool = False):
+        """カタログを定期的に再検証し、更新があれば差し替えます"""
+        if not revalidate_now:
+            await asyncio.sleep(WeaponDataParams.CATALOG_REFRESH_INTERVAL)
+        while True:
+            try:
+                changed = await self.data_manager.refresh_catalogs()
+                if 'ability' in changed:
+                    self._process_gear_data(self.data_manager.get_abilities())
+                if changed:
+                    print(f"Catalog updated: {', '.join(changed)}")
+            except Exception as e:
+                print(f"Error refreshing catalogs: {e}")
+            await asyncio.sleep(WeaponDataParams.CATALOG_REFRESH_INTERVAL)
+
+    async def _wait_for_snapshots(self, interval: float = 1.0):
+        """共有スナップショットからブキ・ギアパワー一覧を読み込めるまで待ちます
+
+        CATALOG_WAIT_TIMEOUT 秒を過ぎても読み込めない場合は、呼び出し元で通常どおり取得します。
+        """
+        deadline = time.monotonic() + WeaponDataParams.CATALOG_WAIT_TIMEOUT
+        while not (self.data_manager.get_all_weapons() and self.data_manager.get_abilities()):
+            if time.monotonic() >= deadline:
+                print("Timed out waiting for catalog snapshots, fetching them directly")
+                return
+            await asyncio.sleep(interval)
+            try:
+                self.data_manager.reload_snapshots()
+            except Exception as e:
+                print(f"Error reloading catalog snapshots: {e}")
+
+    async def _follow_catalogs_loop(self):
+        """他のプロセスが更新した共有スナップショットを定期的に読み込み直します"""
+        while True:
+            await asyncio.sleep(WeaponDataParams.CATALOG_FOLLOW_INTERVAL)
+            try:
+                changed = self.data_manager.reload_snapshots()
+                if 'ability' in changed:
+                    self._process_gear_data(self.data_manager.get_abilities())
+            except Exception as e:
+                print(f"Error reloading catalog snapshots: {e}")
 
     async def fetch_gear_abilities(self):
         """stat.ink APIからギアパワー情報を取得して分類する"""
-        url = "https://stat.ink/api/v3/ability"
-        try:
-            async with aiohttp.ClientSession() as session:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        data = await response.json()
-                        self._process_gear_data(data)
-                    else:
-                        print(f"Failed to fetch gear data: {response.status}")
-        except Exception as e:
-            print(f"Error fetching gear data: {e}")
+        data = await self.data_manager.fetch_abilities()
+        if data:
+            self._process_gear_data(data)
+        else:
+            print("Failed to fetch gear data")
 
     def _process_gear_data(self, data):
         head = []
@@ -113,25 +230,19 @@ class Spl3Random(commands.Cog):
         self.gear_powers['clothing'] = clothing
         self.gear_powers['shoes'] = shoes
 
-    async def _autocomplete_helper(self, current: str, get_items_method) -> List[app_commands.Choice[str]]:
-        """オートコンプリートの共通ロジック"""
-        await self.data_manager.fetch_weapons()
-        items = get_items_method()
-        choices = []
-        for item in items:
-            name = self.data_manager.get_localized_name(item, 'name')
-            if current in name:
-                choices.append(app_commands.Choice(name=name, value=item['key']))
-        return choices[:25]
+    async def _autocomplete_helper(self, current: str, field: str) -> List[app_commands.Choice[str]]:
+        """オートコンプリートの共通ロジック (事前に作成した索引のみを参照します)"""
+        return [app_commands.Choice(name=name, value=key)
+                for name, key in self.data_manager.search_items(field, current)]
 
     async def weapon_type_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
-        return await self._autocomplete_helper(current, self.data_manager.get_weapon_types)
+        return await self._autocomplete_helper(current, 'type')
 
     async def sub_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
-        return await self._autocomplete_helper(current, self.data_manager.get_sub_weapons)
+        return await self._autocomplete_helper(current, 'sub')
 
     async def special_autocomplete(self, interaction: discord.Interaction, current: str) -> List[app_commands.Choice[str]]:
-        return await self._autocomplete_helper(current, self.data_manager.get_special_weapons)
+        return await self._autocomplete_helper(current, 'special')
 
     @commands.hybrid_command(name="random_weapon", description="スプラトゥーン3のブキとギアをランダムに選出します")
     @app_commands.describe(
@@ -148,7 +259,7 @@ class Spl3Random(commands.Cog):
     async def random_weapon(self, ctx: commands.Context, weapon_type: str = None, sub: str = None, special: str = None, count: int = 1):
         """ブキとギアをランダムに選出して表示するコマンド"""
         
-        processing_msg = None
+        started = time.perf_counter()
         try:
             # テキストコマンドで「!random_weapon 4」のように数値のみ指定された場合、それを人数として扱う
             if ctx.interaction is None and weapon_type and weapon_type.isdigit():
@@ -156,102 +267,116 @@ class Spl3Random(commands.Cog):
                 weapon_type = None
 
             if count < 1 or count > 8:
-                await ctx.reply("人数は 1〜8 の間で指定してください。")
+                await self.responses.send(ctx, "人数は 1〜8 の間で指定してください。")
                 return
             
-            # 処理中メッセージを送信
-            processing_msg = await ctx.reply("生成中... ⏳")
-            
-            # データが空の場合は再取得を試みる
-            await self.data_manager.fetch_weapons()
-            if not self.gear_powers['head']:
-                await self.fetch_gear_abilities()
-
-            selected_weapons = []
-            # 重複なしで武器を選出するロジック
-            # 無限ループ防止のため試行回数制限を設ける
-            max_attempts = count * 20
-            attempts = 0
-            
-            while len(selected_weapons) < count and attempts < max_attempts:
-                attempts += 1
-                weapon = self.data_manager.get_random_weapon(weapon_type, sub, special)
-                
-                if not weapon:
-                    break
-                
-                # 重複チェック (keyで比較)
-                if any(w['key'] == weapon['key'] for w in selected_weapons):
-                    continue
-                    
-                selected_weapons.append(weapon)
+            if not self.catalogs_loaded:
+                # 一覧の取得を待つ間に応答期限 (3秒) を過ぎないよう「考え中」を表示する
+                await self.responses.defer(ctx)
+
+            with COMMAND_STAGE_SECONDS.time(command='random_weapon', stage='catalog'):
+                # データが空の場合は再取得を試みる
+                await self.data_manager.fetch_weapons()
+                if not self.gear_powers['head']:
+                    await self.fetch_gear_abilities()
+
+                # 重複なしで武器を選出する
+                selected_weapons = self.data_manager.sample_weapons(count, weapon_type, sub, special)
+
+                # ギア構成を先に生成
+                selected_gears = []
+                for _ in range(len(selected_weapons)):
+                    selected_gears.append(self._generate_gear_set())
 
             if not selected_weapons:
-                await ctx.reply("条件に一致するブキが見つかりませんでした。")
+                await self.responses.send(ctx, "条件に一致するブキが見つかりませんでした。")
                 return
 
-            # ギア構成を先に生成
-            selected_gears = []
-            for _ in range(len(selected_weapons)):
-                selected_gears.append(self._generate_gear_set())
-
-            # 画像を合成して生成 (1人の場合もこれを使用)
-            combined_image = await self._generate_combined_image(selected_weapons, selected_gears)
-            file = None
-            if combined_image:
-                filename = f"loadout_{random.randint(1000, 9999)}.png"
-                file = discord.File(combined_image, filename=filename)
-
-            # 処理中メッセージを削除
-            if processing_msg:
-                try:
-                    await processing_msg.delete()
-                except Exception:
-                    pass
-
-            if count == 1:
-                # 1人の場合は詳細Embed
-                weapon = selected_weapons[0]
-                head, clothing, shoes = selected_gears[0]
-                
-                # 画像は添付ファイルを使用
-                embed = self._create_weapon_embed(weapon, f"attachment://{filename}" if file else None)
-                embed.add_field(name="おすすめギア(ランダム)", value=f"🧢 {head['name']}\n👕 {clothing['name']}\n👟 {shoes['name']}", inline=False)
-                embed.set_author(name=f"{ctx.author.display_name} さんの選出結果", icon_url=ctx.author.display_avatar.url)
-                await ctx.reply(embed=embed, file=file)
-            
+            # 同じ組み合わせの画像をアップロード済みであればそのURLを使い、合成・アップロードを省く
+            layout_key = layout_digest(self._build_layout(selected_weapons, selected_gears))
+            image_url = self.attachment_cache.get(layout_key)
+            if image_url is not None:
+                embed = self._create_result_embed(ctx, selected_weapons, selected_gears, image_url)
+                with COMMAND_STAGE_SECONDS.time(command='random_weapon', stage='upload'):
+                    await self.responses.send(ctx, embed=embed)
+                return
+
+            if ResponseSchedulerParams.PROGRESSIVE and not self.responses.is_busy(ctx):
+                # 選出結果のテキストを先に返し、合成画像は完成してから編集で追加する
+                embed = self._create_result_embed(ctx, selected_weapons, selected_gears)
+                with COMMAND_STAGE_SECONDS.time(command='random_weapon', stage='reply'):
+                    message = await self.responses.send(ctx, embed=embed, mergeable=False)
+                file, complete = await self._render_result_file(selected_weapons, selected_gears)
+                if file is None:
+                    return
+                embed.set_image(url=f"attachment://{file.filename}")
+                with COMMAND_STAGE_SECONDS.time(command='random_weapon', stage='upload'):
+                    message = await self.responses.edit(ctx, message, embed=embed, file=file)
             else:
-                # 複数人の場合はリスト表示 + 合成画像
-                embed = discord.Embed(
-                    title=f"🦑 ランダムブキ＆ギア選出 ({len(selected_weapons)}人分)",
-                    color=discord.Color.orange()
-                )
-                
-                if file:
-                    embed.set_image(url=f"attachment://{filename}")
-
-                for i, weapon in enumerate(selected_weapons):
-                    w_name = self.data_manager.get_localized_name(weapon, 'name')
-                    head, clothing, shoes = selected_gears[i]
-                    gear_text = f"🧢 {head['name']} | 👕 {clothing['name']} | 👟 {shoes['name']}"
-                    embed.add_field(name=f"{i+1}: {w_name}", value=gear_text, inline=False)
-                
-                await ctx.reply(embed=embed, file=file)
+                # 応答が混み合っている場合は編集の分の送信を増やさないよう、画像と合わせて1回で返す
+                # (スラッシュコマンドでは合成を待つ間に応答期限を過ぎないよう「考え中」を表示する)
+                await self.responses.defer(ctx)
+                file, complete = await self._render_result_file(selected_weapons, selected_gears)
+                embed = self._create_result_embed(
+                    ctx, selected_weapons, selected_gears, f"attachment://{file.filename}" if file else None)
+                with COMMAND_STAGE_SECONDS.time(command='random_weapon', stage='upload'):
+                    message = await self.responses.send(ctx, embed=embed, file=file)
+
+            # 取得できなかった画像がある場合は再利用せず、次回は揃った画像で作り直す
+            if file and complete and message is not None:
+                self.attachment_cache.put(layout_key, self._uploaded_image_url(message, file.filename), message.id)
         except Exception as e:
-            # エラー時も処理中メッセージを削除
-            if processing_msg:
-                try:
-                    await processing_msg.delete()
-                except Exception:
-                    pass
-            await ctx.reply(f"エラーが発生しました: {e}")
-
-    def _create_weapon_embed(self, weapon: dict, image_url: Optional[str] = None) -> discord.Embed:
+            await self.responses.send(ctx, f"エラーが発生しました: {e}")
+        finally:
+            COMMAND_SECONDS.observe(time.perf_counter() - started, command='random_weapon')
+
+    async def _render_result_file(self, weapons: List[Weapon], gear_sets: List[tuple]) -> Tuple[Optional[discord.File], bool]:
+        """合成画像を添付ファイルとして作成し、(ファイル, 全画像が揃ったか) を返す (期限内に完成しない場合のファイルは None)"""
+        try:
+            combined_image = await asyncio.wait_for(
+                self._generate_combined_image(weapons, gear_sets), ResponseSchedulerParams.IMAGE_DEADLINE)
+        except asyncio.TimeoutError:
+            print(f"Render exceeded {ResponseSchedulerParams.IMAGE_DEADLINE}s, replying without image")
+            RENDER_FALLBACKS.inc(reason='deadline')
+            return None, False
+        if not combined_image:
+            return None, False
+        image_data, ext, complete = combined_image
+        return discord.File(image_data, filename=f"loadout_{random.randint(1000, 9999)}.{ext}"), complete
+
+    def _create_result_embed(self, ctx: commands.Context, weapons: List[Weapon], gear_sets: List[tuple],
+                             image_url: Optional[str] = None) -> discord.Embed:
+        """選出結果のEmbedを作成する (1人の場合は詳細、複数人の場合はリスト表示)"""
+        if len(weapons) == 1:
+            # 1人の場合は詳細Embed
+            head, clothing, shoes = gear_sets[0]
+            # 画像は合成画像 (添付ファイルまたはアップロード済みのURL) を使用
+            embed = self._create_weapon_embed(weapons[0], image_url)
+            embed.add_field(name="おすすめギア(ランダム)", value=f"🧢 {head['name']}\n👕 {clothing['name']}\n👟 {shoes['name']}", inline=False)
+            embed.set_author(name=f"{ctx.author.display_name} さんの選出結果", icon_url=ctx.author.display_avatar.url)
+            return embed
+
+        # 複数人の場合はリスト表示 + 合成画像
+        embed = discord.Embed(
+            title=f"🦑 ランダムブキ＆ギア選出 ({len(weapons)}人分)",
+            color=discord.Color.orange()
+        )
+        if image_url:
+            embed.set_image(url=image_url)
+
+        for i, weapon in enumerate(weapons):
+            w_name = self.data_manager.get_localized_name(weapon)
+            head, clothing, shoes = gear_sets[i]
+            gear_text = f"🧢 {head['name']} | 👕 {clothing['name']} | 👟 {shoes['name']}"
+            embed.add_field(name=f"{i+1}: {w_name}", value=gear_text, inline=False)
+        return embed
+
+    def _create_weapon_embed(self, weapon: Weapon, image_url: Optional[str] = None) -> discord.Embed:
         """ブキ情報からEmbedを作成するヘルパーメソッド"""
-        w_name = self.data_manager.get_localized_name(weapon, 'name')
-        sub_name = self.data_manager.get_localized_name(weapon.get('sub', {}), 'name')
-        sp_name = self.data_manager.get_localized_name(weapon.get('special', {}), 'name')
-        w_type = self.data_manager.get_localized_name(weapon.get('type', {}), 'name')
+        w_name = self.data_manager.get_localized_name(weapon)
+        sub_name = self.data_manager.get_localized_name(weapon.sub)
+        sp_name = self.data_manager.get_localized_name(weapon.special)
+        w_type = self.data_manager.get_localized_name(weapon.type)
         
         if image_url is None:
             image_url = self.data_manager.get_image_url(weapon)
@@ -270,6 +395,16 @@ class Spl3Random(commands.Cog):
 
         return embed
 
+    @staticmethod
+    def _uploaded_image_url(message: Optional[discord.Message], filename: str) -> Optional[str]:
+        """送信したメッセージから添付した合成画像の CDN URL を取り出す (複数の応答をまとめたメッセージにも対応)"""
+        if message is None:
+            return None
+        for attachment in message.attachments:
+            if attachment.filename == filename:
+                return attachment.url
+        return None
+
     def _generate_gear_set(self):
         """ランダムなギア構成を生成する"""
         # データがない場合のフォールバック
@@ -281,133 +416,191 @@ class Spl3Random(commands.Cog):
         shoes = random.choice(self.gear_powers['shoes'])
         return head, clothing, shoes
 
-    async def _fetch_external_image(self, url: str) -> Optional[bytes]:
-        """外部URLから画像をダウンロードする"""
-        try:
-            async with aiohttp.ClientSession() as session:
-                headers = {'User-Agent': 'Mozilla/5.0 (Windows NT 10.0; Win64; x64)'}
-                async with session.get(url, headers=headers) as response:
-                    if response.status == 200:
-                        return await response.read()
-        except Exception as e:
-            print(f"Failed to fetch external image {url}: {e}")
-        return None
+    def _generate_gear_sets(self, n: int) -> List[tuple]:
+        """ランダムなギア構成をn人分まとめて生成する"""
+        if not self.gear_powers['head']:
+            return [self._generate_gear_set() for _ in range(n)]
+        return list(zip(
+            random.choices(self.gear_powers['head'], k=n),
+            random.choices(self.gear_powers['clothing'], k=n),
+            random.choices(self.gear_powers['shoes'], k=n),
+        ))
 
-    async def _generate_combined_image(self, weapons: List[dict], gear_sets: List[tuple]) -> Optional[io.BytesIO]:
-        """複数のブキ画像とギアパワー画像を合成して1枚の画像にする"""
-        
-        async def _fetch_image(item, type_hint="Main"):
-            if not item: return None
-            url = self.data_manager.get_image_url(item, type_hint=type_hint)
+    async def _fetch_loadout_images(self, weapons: List[Weapon], gear_sets: List[tuple],
+                                    command: str = 'random_weapon') -> Tuple[Dict[str, Optional[bytes]], Dict[str, Optional[bytes]]]:
+        """メインとギアの画像を並行して取得し、(ブキkey -> 画像, ギアkey -> 画像) を返す (同じ画像は1回だけ)
+
+        アトラスに含まれる画像は取得しません (レンダリング時にアトラスから切り出されます)。
+        """
+
+        async def _fetch_image(url):
             if not url: return None
             return await self.data_manager.fetch_image_data(url)
 
-        # 画像取得タスク (メインのみ)
-        tasks = []
-        for w in weapons:
-            tasks.append(_fetch_image(w, "Main"))           # Main
+        atlas = get_atlas()
+        unique_weapons = [w for w in {w.key: w for w in weapons}.values() if atlas is None or not atlas.has('main', w.key)]
+        gear_keys = sorted({g.get('key') for gears in gear_sets for g in gears
+                            if g.get('key') and (atlas is None or not atlas.has('gear', g.get('key')))})
+        with COMMAND_STAGE_SECONDS.time(command=command, stage='image_fetch'):
+            results = await asyncio.gather(
+                *(_fetch_image(self.data_manager.get_image_url(w, type_hint="Main")) for w in unique_weapons),
+                *(_fetch_image(self.GEAR_IMAGE_URLS.get(key)) for key in gear_keys)
+            )
+        main_images = {w.key: data for w, data in zip(unique_weapons, results)}
+        gear_images = dict(zip(gear_keys, results[len(unique_weapons):]))
+        return main_images, gear_images
+
+    @staticmethod
+    def _has_main_image(weapon: Weapon, main_images: Dict[str, Optional[bytes]]) -> bool:
+        """メイン画像を取得できたか、アトラスに含まれているか"""
+        if main_images.get(weapon.key) is not None:
+            return True
+        atlas = get_atlas()
+        return atlas is not None and atlas.has('main', weapon.key)
+
+    @staticmethod
+    def _build_layout(weapons: List[Weapon], gear_sets: List[tuple],
+                      main_images: Optional[Dict[str, Optional[bytes]]] = None,
+                      gear_images: Optional[Dict[str, Optional[bytes]]] = None) -> Dict:
+        """レンダリングワーカーに渡すレイアウト記述を作成する (画像を省略した場合はkeyのみ)"""
+        main_images = main_images or {}
+        gear_images = gear_images or {}
+        return {
+            'gear_size': 64,
+            'padding': 10,
+            'players': [
+                {
+                    'main_key': w.key,
+                    'main': main_images.get(w.key),
+                    'gears': [[g.get('key'), gear_images.get(g.get('key'))] for g in gears if g.get('key')],
+                }
+                for w, gears in zip(weapons, gear_sets)
+            ],
+        }
 
-        # メインウェポンの画像データリスト
-        main_weapon_images_data = await asyncio.gather(*tasks)
-        
+    async def _render_layout(self, layout: Dict, command: str = 'random_weapon') -> Optional[Tuple[io.BytesIO, str, bool]]:
+        """レイアウト記述をレンダリングワーカーで画像にし、(画像データ, 拡張子, 全画像が揃ったか) を返す"""
+        try:
+            rendered = await self.render_worker.render(layout)
+        except RenderQueueFull as e:
+            # 混雑時は画像なしで応答する
+            print(f"Render queue full, skipping image: {e}")
+            RENDER_FALLBACKS.inc(reason='queue_full')
+            return None
+        if not rendered:
+            return None
+        data, ext, timings, complete = rendered
+        for stage, seconds in timings.items():
+            COMMAND_STAGE_SECONDS.observe(seconds, command=command, stage=stage)
+        return io.BytesIO(data), ext, complete
+
+    async def _generate_combined_image(self, weapons: List[Weapon], gear_sets: List[tuple]) -> Optional[Tuple[io.BytesIO, str, bool]]:
+        """複数のブキ画像とギアパワー画像を合成して1枚の画像にし、(画像データ, 拡張子, 全画像が揃ったか) を返す"""
+        main_images, gear_images = await self._fetch_loadout_images(weapons, gear_sets)
         # 有効な画像データがあるか確認
-        if not main_weapon_images_data or all(d is None for d in main_weapon_images_data):
+        if not any(self._has_main_image(w, main_images) for w in weapons):
             return None
+        return await self._render_layout(self._build_layout(weapons, gear_sets, main_images, gear_images))
+
+    def generate_bulk_loadouts(self, teams: int, team_size: int, weapon_type: Optional[str] = None,
+                               sub: Optional[str] = None, special: Optional[str] = None) -> List[List[Tuple[Weapon, tuple]]]:
+        """大会用に teams チーム x team_size 人分の選出結果をまとめて生成する (チーム内のブキは重複なし)"""
+        batches = self.data_manager.sample_weapon_batches(teams, team_size, weapon_type, sub, special)
+        gear_sets = iter(self._generate_gear_sets(sum(len(b) for b in batches)))
+        return [[(weapon, next(gear_sets)) for weapon in batch] for batch in batches]
 
-        # メイン画像のサイズ基準を取得 (最初の有効な画像から)
-        first_valid_data = next((d for d in main_weapon_images_data if d is not None), None)
+    @commands.hybrid_command(name="random_bracket", description="大会用に複数チーム分のブキとギアをまとめて選出します")
+    @app_commands.describe(
+        teams="チーム数",
+        team_size="1チームの人数（1〜8人）",
+        weapon_type="ブキの種類（シューター、チャージャーなど）",
+        sub="サブウェポン（スプラッシュボムなど）",
+        special="スペシャルウェポン（ウルトラショットなど）",
+        output="一覧の形式（csv または json）",
+        images="合成画像を添付するかどうか"
+    )
+    @app_commands.choices(output=[
+        app_commands.Choice(name="CSV", value="csv"),
+        app_commands.Choice(name="JSON", value="json"),
+    ])
+    @app_commands.autocomplete(
+        weapon_type=weapon_type_autocomplete,
+        sub=sub_autocomplete,
+        special=special_autocomplete
+    )
+    async def random_bracket(self, ctx: commands.Context, teams: int = 2, team_size: int = 4, weapon_type: str = None,
+                             sub: str = None, special: str = None, output: str = 'csv', images: bool = True):
+        """複数チーム分の選出結果を一覧ファイルとスプライトシートで返すコマンド"""
+        started = time.perf_counter()
         try:
-            with Image.open(io.BytesIO(first_valid_data)) as img:
-                w, h = img.size
-        except Exception as e:
-            print(f"Error opening first image: {e}")
-            return None
-            
-        # グリッド計算 (4人以上は2列、それ以下は1列など)
-        count = len(weapons)
-        if count <= 3:
-            cols = count
-            rows = 1
-        else:
-            cols = 2
-            rows = (count + 1) // 2
+            if team_size < 1 or team_size > 8:
+                await self.responses.send(ctx, "1チームの人数は 1〜8 の間で指定してください。")
+                return
+            max_teams = max(1, BulkParams.MAX_LOADOUTS // team_size)
+            if teams < 1 or teams > max_teams:
+                await self.responses.send(ctx, f"チーム数は 1〜{max_teams} の間で指定してください。")
+                return
+            if output not in ('csv', 'json'):
+                await self.responses.send(ctx, "形式は csv または json を指定してください。")
+                return
 
-        # ギアアイコンのサイズと余白
-        gear_size = 64
-        padding = 10
-        
-        # 1セルのサイズ計算
-        # レイアウト:
-        # [Main Weapon]
-        # [Gear] [Gear] [Gear]
-        cell_w = max(w, (gear_size * 3) + (padding * 2))
-        cell_h = h + padding + gear_size + padding
-        
-        combined = Image.new('RGBA', (cell_w * cols, cell_h * rows), (0, 0, 0, 0))
-        
-        # ギア画像のキャッシュ
-        gear_icon_cache = {}
+            await ctx.defer()
 
-        for i, main_bytes in enumerate(main_weapon_images_data):
-            if not main_bytes: continue
-            
-            c = i % cols
-            r = i // cols
-            base_x = c * cell_w
-            base_y = r * cell_h
-            
-            # 1. メインウェポン描画 (中央揃え)
-            try:
-                main_img = Image.open(io.BytesIO(main_bytes))
-                if main_img.size != (w, h):
-                    main_img = main_img.resize((w, h))
-                
-                main_x = base_x + (cell_w - w) // 2
-                combined.paste(main_img, (int(main_x), int(base_y)))
-            except Exception:
-                print(f"Error processing weapon image index {i}")
-                continue
+            with COMMAND_STAGE_SECONDS.time(command='random_bracket', stage='catalog'):
+                await self.data_manager.fetch_weapons()
+                if not self.gear_powers['head']:
+                    await self.fetch_gear_abilities()
+                bracket = self.generate_bulk_loadouts(teams, team_size, weapon_type, sub, special)
 
-            current_y = base_y + h + padding
+            if not bracket:
+                await self.responses.send(ctx, "条件に一致するブキが見つかりませんでした。")
+                return
 
-            # 2. ギアパワー描画 (中央揃え)
-            gears = gear_sets[i] # (head, clothing, shoes) dicts
-            valid_gears = []
-            
-            for gear_data in gears:
-                gear_key = gear_data.get('key')
-                if not gear_key: continue
-
-                # キャッシュ確認またはダウンロード
-                if gear_key not in gear_icon_cache:
-                    url = self.GEAR_IMAGE_URLS.get(gear_key)
-                    if url:
-                        gear_data_bytes = await self._fetch_external_image(url)
-                        if gear_data_bytes:
-                            try:
-                                gear_img = Image.open(io.BytesIO(gear_data_bytes)).resize((gear_size, gear_size))
-                                gear_icon_cache[gear_key] = gear_img
-                            except Exception:
-                                gear_icon_cache[gear_key] = None
-                        else:
-                            gear_icon_cache[gear_key] = None
-                    else:
-                        gear_icon_cache[gear_key] = None
-                
-                gear_icon = gear_icon_cache.get(gear_key)
-                if gear_icon:
-                    valid_gears.append(gear_icon)
-
-            if valid_gears:
-                total_w = (gear_size * len(valid_gears)) + (padding * (len(valid_gears) - 1))
-                start_x = base_x + (cell_w - total_w) // 2
-                for idx, img in enumerate(valid_gears):
-                    combined.paste(img, (int(start_x + (gear_size + padding) * idx), int(current_y)))
-            
-        output = io.BytesIO()
-        combined.save(output, format='PNG')
-        output.seek(0)
-        return output
+            tag = random.randint(1000, 9999)
+            rows = iter_rows(bracket, self.data_manager.get_localized_name)
+            data, ext = export(rows, output)
+            total = sum(len(team) for team in bracket)
+            note = ""
+            if len(bracket[0]) < team_size:
+                note = f"\n条件に一致するブキが少ないため、1チーム {len(bracket[0])} 人で選出しました。"
+            with COMMAND_STAGE_SECONDS.time(command='random_bracket', stage='upload'):
+                await self.responses.send(ctx, f"🦑 {len(bracket)}チーム・{total}人分を選出しました。{note}",
+                                          file=discord.File(data, filename=f"bracket_{tag}.{ext}"))
+
+            if images:
+                await self._send_bracket_sheets(ctx, bracket, tag)
+        except Exception as e:
+            await self.responses.send(ctx, f"エラーが発生しました: {e}")
+        finally:
+            COMMAND_SECONDS.observe(time.perf_counter() - started, command='random_bracket')
+
+    async def _send_bracket_sheets(self, ctx: commands.Context, bracket: List[List[Tuple[Weapon, tuple]]], tag: int):
+        """選出結果をページごとのスプライトシートにして、添付上限ごとに順次送信する"""
+        players = [p for team in bracket for p in team]
+        main_images, gear_images = await self._fetch_loadout_images(
+            [w for w, _ in players], [g for _, g in players], command='random_bracket')
+
+        pages = paginate(bracket)
+        first_team = 1
+        files: List[discord.File] = []
+        for page_no, page in enumerate(pages, 1):
+            weapons = [w for team in page for w, _ in team]
+            gears = [g for team in page for _, g in team]
+            rendered = None
+            if any(self._has_main_image(w, main_images) for w in weapons):
+                # 対話的なコマンドを妨げないよう、ページは1枚ずつレンダリングする
+                layout = self._build_layout(weapons, gears, main_images, gear_images)
+                rendered = await self._render_layout(layout, command='random_bracket')
+            if rendered:
+                image_data, ext, _ = rendered
+                last_team = first_team + len(page) - 1
+                files.append(discord.File(image_data, filename=f"bracket_{tag}_teams{first_team:03d}-{last_team:03d}.{ext}"))
+            first_team += len(page)
+            # 1メッセージの添付ファイル数の上限 (10) に達するか最後のページで送信する
+            if files and (len(files) == 10 or page_no == len(pages)):
+                with COMMAND_STAGE_SECONDS.time(command='random_bracket', stage='upload'):
+                    await self.responses.send(ctx, files=files)
+                files = []
 
 async def setup(bot):
     await bot.add_cog(Spl3Random(bot))
\ No newline at end of file
@@ -0,0 +1,123 @@
+import hashlib
+import json
+import os
+import time
+import urllib.parse
+from collections import OrderedDict
+from typing import Dict, Iterable, Optional, Set, Tuple
+
+from data.image_encoder import EncoderParams
+
+
+class AttachmentCacheParams:
+    # 保持するURLの最大数
+    MAX_ENTRIES = int(os.environ.get("ATTACHMENT_CACHE_SIZE", 2048))
+    # 有効期限のこの秒数前から期限切れとして扱う (表示までの猶予)
+    EXPIRY_MARGIN = int(os.environ.get("ATTACHMENT_CACHE_MARGIN", 10 * 60))
+    # URLに有効期限 (ex=) が含まれない場合の保持秒数
+    DEFAULT_TTL = int(os.environ.get("ATTACHMENT_CACHE_TTL", 12 * 60 * 60))
+    # キャッシュするURLのホスト (Discord の CDN)
+    HOSTS = ('cdn.discordapp.com', 'media.discordapp.net')
+
+
+def layout_digest(layout: Dict) -> str:
+    """レイアウト記述から画像データを除いた正規形のハッシュ値を返します
+
+    メイン・ギアのkeyと並び順、サイズ、エンコード設定が同じであれば同じ画像になるため、
+    同じハッシュ値になります。
+    """
+    canonical = {
+        'gear_size': layout.get('gear_size', 64),
+        'padding': layout.get('padding', 10),
+        'encoder': layout.get('encoder', EncoderParams.MODE),
+        'byte_budget': layout.get('byte_budget', EncoderParams.BYTE_BUDGET),
+        'players': [[p.get('main_key'), [key for key, _ in p.get('gears', [])]] for p in layout['players']],
+    }
+    raw = json.dumps(canonical, sort_keys=True, separators=(',', ':')).encode('utf-8')
+    return hashlib.sha256(raw).hexdigest()
+
+
+def parse_expiry(url: str) -> Optional[float]:
+    """Discord の CDN URL の ex= (16進数のUNIX時刻) から有効期限を返します (無い場合は None)"""
+    query = urllib.parse.parse_qs(urllib.parse.urlsplit(url).query)
+    values = query.get('ex')
+    if not values:
+        return None
+    try:
+        return float(int(values[0], 16))
+    except ValueError:
+        return None
+
+
+class AttachmentCache:
+    """アップロード済みの合成画像の CDN URL をレイアウトのハッシュ値ごとに保持するキャッシュ (LRU)
+
+    同じ組み合わせの画像は再レンダリング・再アップロードせず、以前のURLをEmbedから参照します。
+    URLは署名の有効期限 (ex=) を過ぎる前、または添付したメッセージが削除された時点で破棄されます。
+    """
+
+    def __init__(self, max_entries: int = AttachmentCacheParams.MAX_ENTRIES,
+                 margin: int = AttachmentCacheParams.EXPIRY_MARGIN,
+                 default_ttl: int = AttachmentCacheParams.DEFAULT_TTL):
+        self.max_entries = max_entries
+        self.margin = margin
+        self.default_ttl = default_ttl
+        # key -> (url, 有効期限, 添付したメッセージのID)
+        self._entries: "OrderedDict[str, Tuple[str, float, Optional[int]]]" = OrderedDict()
+        # メッセージのID -> そのメッセージに添付した画像の key (まとめて送った応答では複数)
+        self._messages: Dict[int, Set[str]] = {}
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, key: str) -> Optional[str]:
+        """有効なURLがあれば返します (期限切れ間近のものは破棄します)"""
+        entry = self._entries.get(key)
+        if entry is not None:
+            url, expires_at, _ = entry
+            if time.time() < expires_at - self.margin:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return url
+            self.invalidate(key)
+        self.misses += 1
+        return None
+
+    def put(self, key: str, url: Optional[str], message_id: Optional[int] = None) -> None:
+        """アップロードされた画像のURLを保存します (Discord の CDN 以外のURLは無視します)
+
+        message_id を渡すと、そのメッセージが削除された際に invalidate_messages() で破棄できます。
+        """
+        if not url or self.max_entries <= 0:
+            return
+        if urllib.parse.urlsplit(url).hostname not in AttachmentCacheParams.HOSTS:
+            return
+        self.invalidate(key)
+        expires_at = parse_expiry(url) or time.time() + self.default_ttl
+        self._entries[key] = (url, expires_at, message_id)
+        if message_id is not None:
+            self._messages.setdefault(message_id, set()).add(key)
+        while len(self._entries) > self.max_entries:
+            self.invalidate(next(iter(self._entries)))
+
+    def invalidate(self, key: str) -> None:
+        """URLが使えなくなった場合 (元のメッセージが削除された等) に破棄します"""
+        entry = self._entries.pop(key, None)
+        if entry is None or entry[2] is None:
+            return
+        keys = self._messages.get(entry[2])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._messages[entry[2]]
+
+    def invalidate_messages(self, message_ids: Iterable[int]) -> int:
+        """削除されたメッセージに添付していた画像のURLを破棄し、破棄した数を返します"""
+        removed = 0
+        for message_id in message_ids:
+            for key in self._messages.pop(message_id, ()):
+                self._entries.pop(key, None)
+                removed += 1
+        return removed
+
+    def __len__(self) -> int:
+        return len(self._entries)
@@ -0,0 +1,208 @@
+import unicodedata
+from collections import OrderedDict
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from data.catalog import CatalogItem
+
+
+class AutocompleteParams:
+    # 前方一致用に登録する接頭辞の最大長
+    PREFIX_MAX = 8
+    # 直近の入力文字列に対する結果を保持する件数
+    MEMO_SIZE = 512
+    # Discordが受け付ける候補数の上限
+    LIMIT = 25
+
+
+_ROMAJI = {
+    'あ': 'a', 'い': 'i', 'う': 'u', 'え': 'e', 'お': 'o',
+    'か': 'ka', 'き': 'ki', 'く': 'ku', 'け': 'ke', 'こ': 'ko',
+    'さ': 'sa', 'し': 'shi', 'す': 'su', 'せ': 'se', 'そ': 'so',
+    'た': 'ta', 'ち': 'chi', 'つ': 'tsu', 'て': 'te', 'と': 'to',
+    'な': 'na', 'に': 'ni', 'ぬ': 'nu', 'ね': 'ne', 'の': 'no',
+    'は': 'ha', 'ひ': 'hi', 'ふ': 'fu', 'へ': 'he', 'ほ': 'ho',
+    'ま': 'ma', 'み': 'mi', 'む': 'mu', 'め': 'me', 'も': 'mo',
+    'や': 'ya', 'ゆ': 'yu', 'よ': 'yo',
+    'ら': 'ra', 'り': 'ri', 'る': 'ru', 'れ': 're', 'ろ': 'ro',
+    'わ': 'wa', 'ゐ': 'i', 'ゑ': 'e', 'を': 'o', 'ん': 'n',
+    'が': 'ga', 'ぎ': 'gi', 'ぐ': 'gu', 'げ': 'ge', 'ご': 'go',
+    'ざ': 'za', 'じ': 'ji', 'ず': 'zu', 'ぜ': 'ze', 'ぞ': 'zo',
+    'だ': 'da', 'ぢ': 'ji', 'づ': 'zu', 'で': 'de', 'ど': 'do',
+    'ば': 'ba', 'び': 'bi', 'ぶ': 'bu', 'べ': 'be', 'ぼ': 'bo',
+    'ぱ': 'pa', 'ぴ': 'pi', 'ぷ': 'pu', 'ぺ': 'pe', 'ぽ': 'po',
+    'ゔ': 'vu',
+    'ぁ': 'a', 'ぃ': 'i', 'ぅ': 'u', 'ぇ': 'e', 'ぉ': 'o',
+    'ゃ': 'ya', 'ゅ': 'yu', 'ょ': 'yo', 'ゎ': 'wa',
+}
+
+# 拗音などの2文字の組み合わせ
+_ROMAJI_DIGRAPHS = {
+    'きゃ': 'kya', 'きゅ': 'kyu', 'きょ': 'kyo',
+    'しゃ': 'sha', 'しゅ': 'shu', 'しぇ': 'she', 'しょ': 'sho',
+    'ちゃ': 'cha', 'ちゅ': 'chu', 'ちぇ': 'che', 'ちょ': 'cho',
+    'にゃ': 'nya', 'にゅ': 'nyu', 'にょ': 'nyo',
+    'ひゃ': 'hya', 'ひゅ': 'hyu', 'ひょ': 'hyo',
+    'みゃ': 'mya', 'みゅ': 'myu', 'みょ': 'myo',
+    'りゃ': 'rya', 'りゅ': 'ryu', 'りょ': 'ryo',
+    'ぎゃ': 'gya', 'ぎゅ': 'gyu', 'ぎょ': 'gyo',
+    'じゃ': 'ja', 'じゅ': 'ju', 'じぇ': 'je', 'じょ': 'jo',
+    'びゃ': 'bya', 'びゅ': 'byu', 'びょ': 'byo',
+    'ぴゃ': 'pya', 'ぴゅ': 'pyu', 'ぴょ': 'pyo',
+    'ふぁ': 'fa', 'ふぃ': 'fi', 'ふぇ': 'fe', 'ふぉ': 'fo',
+    'てぃ': 'ti', 'でぃ': 'di', 'とぅ': 'tu', 'どぅ': 'du',
+    'うぃ': 'wi', 'うぇ': 'we', 'うぉ': 'wo',
+    'ゔぁ': 'va', 'ゔぃ': 'vi', 'ゔぇ': 've', 'ゔぉ': 'vo',
+}
+
+# 表記ゆれとして無視する記号
+_IGNORED_CHARS = set(' \t-_・･.,\'"’()（）')
+
+
+def _to_hiragana(text: str) -> str:
+    """カタカナをひらがなに変換します"""
+    return ''.join(chr(ord(c) - 0x60) if 'ァ' <= c <= 'ヶ' else c for c in text)
+
+
+def normalize(text: str) -> str:
+    """全角/半角・大文字/小文字・カタカナ/ひらがなの違いを吸収した文字列を返します"""
+    text = unicodedata.normalize('NFKC', text).casefold()
+    return ''.join(c for c in _to_hiragana(text) if c not in _IGNORED_CHARS)
+
+
+def to_romaji(text: str) -> str:
+    """正規化済みの文字列に含まれるひらがなをローマ字に変換します"""
+    result = []
+    sokuon = False
+    i = 0
+    while i < len(text):
+        pair = text[i:i + 2]
+        if pair in _ROMAJI_DIGRAPHS:
+            romaji = _ROMAJI_DIGRAPHS[pair]
+            i += 2
+        elif text[i] == 'っ':
+            sokuon = True
+            i += 1
+            continue
+        elif text[i] == 'ー':
+            # 長音は表記ゆれが大きいため読み飛ばす
+            i += 1
+            continue
+        else:
+            romaji = _ROMAJI.get(text[i], text[i])
+            i += 1
+        if sokuon:
+            # 促音は次の子音を重ねる (ch は tch とする)
+            if romaji.startswith('ch'):
+                romaji = 't' + romaji
+            elif romaji[0] not in 'aiueon':
+                romaji = romaji[0] + romaji
+            sokuon = False
+        result.append(romaji)
+    return ''.join(result)
+
+
+def _forms(names: Iterable[str]) -> Set[str]:
+    """名前から検索対象となる正規化形 (ローマ字形を含む) を作ります"""
+    forms = set()
+    for name in names:
+        if not name:
+            continue
+        norm = normalize(name)
+        if norm:
+            forms.add(norm)
+            romaji = to_romaji(norm)
+            if romaji != norm:
+                forms.add(romaji)
+    return forms
+
+
+class AutocompleteIndex:
+    """多言語名に対する前方一致・n-gram索引
+
+    候補は登録順 (=日本語表示順) に並べ、前方一致したものを部分一致より先に返します。
+    """
+
+    def __init__(self, entries: List[Tuple[str, str, List[str]]]):
+        """entries は (表示名, 値, 検索対象の名前リスト) のリストです"""
+        self._choices: List[Tuple[str, str]] = [(display, value) for display, value, _ in entries]
+        self._forms: List[Set[str]] = [_forms([display, *names]) for display, _, names in entries]
+        self._prefix: Dict[str, Set[int]] = {}
+        self._grams: Dict[str, Set[int]] = {}
+        self._memo: "OrderedDict[str, List[Tuple[str, str]]]" = OrderedDict()
+
+        for i, forms in enumerate(self._forms):
+            for form in forms:
+                for n in range(1, min(len(form), AutocompleteParams.PREFIX_MAX) + 1):
+                    self._prefix.setdefault(form[:n], set()).add(i)
+                for gram in self._ngrams(form):
+                    self._grams.setdefault(gram, set()).add(i)
+
+    @staticmethod
+    def _ngrams(text: str) -> Set[str]:
+        """1文字と2文字のn-gramを返します"""
+        grams = set(text)
+        grams.update(text[i:i + 2] for i in range(len(text) - 1))
+        return grams
+
+    def _match(self, query: str) -> Tuple[Set[int], Set[int]]:
+        """(前方一致した候補, 部分一致した候補) を返します"""
+        if len(query) <= AutocompleteParams.PREFIX_MAX:
+            prefix = self._prefix.get(query, set())
+        else:
+            prefix = {i for i in self._prefix.get(query[:AutocompleteParams.PREFIX_MAX], ())
+                      if any(f.startswith(query) for f in self._forms[i])}
+
+        # 2文字以上はbigram、1文字はその文字自体で候補を絞り込む
+        grams = [query[i:i + 2] for i in range(len(query) - 1)] or [query]
+        candidates = None
+        for gram in grams:
+            ids = self._grams.get(gram)
+            if not ids:
+                return prefix, set()
+            candidates = set(ids) if candidates is None else candidates & ids
+            if not candidates:
+                return prefix, set()
+        substring = {i for i in candidates
+                     if i not in prefix and any(query in f for f in self._forms[i])}
+        return prefix, substring
+
+    def search(self, current: str, limit: int = AutocompleteParams.LIMIT) -> List[Tuple[str, str]]:
+        """入力中の文字列に一致する (表示名, 値) のリストを返します"""
+        memo_key = f"{limit}:{current}"
+        cached = self._memo.get(memo_key)
+        if cached is not None:
+            self._memo.move_to_end(memo_key)
+            return cached
+
+        query = normalize(current or '')
+        if not query:
+            result = self._choices[:limit]
+        else:
+            prefix: Set[int] = set()
+            substring: Set[int] = set()
+            for variant in {query, to_romaji(query)}:
+                p, s = self._match(variant)
+                prefix |= p
+                substring |= s
+            substring -= prefix
+            ordered = sorted(prefix) + sorted(substring)
+            result = [self._choices[i] for i in ordered[:limit]]
+
+        self._memo[memo_key] = result
+        if len(self._memo) > AutocompleteParams.MEMO_SIZE:
+            self._memo.popitem(last=False)
+        return result
+
+
+EMPTY_INDEX = AutocompleteIndex([])
+
+
+def build_index(items: List[CatalogItem], lang: str = 'ja_JP',
+                search_names: Optional[Dict[str, List[str]]] = None) -> AutocompleteIndex:
+    """カタログのアイテムから索引を作ります
+
+    search_names (key -> 名前のリスト) があればその名前で、無ければ保持している言語の名前で検索できます。
+    """
+    search_names = search_names or {}
+    return AutocompleteIndex([(item.name(lang) or "Unknown", item.key, search_names.get(item.key) or item.all_names())
+                              for item in items])
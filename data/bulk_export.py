@@ -0,0 +1,85 @@
+import csv
+import io
+import json
+import os
+from typing import Callable, Dict, Iterable, Iterator, List, Sequence, Tuple
+
+from data.catalog import CatalogItem, Weapon
+
+
+class BulkParams:
+    # 1回のリクエストで生成できる選出数の上限
+    MAX_LOADOUTS = int(os.environ.get("BULK_MAX_LOADOUTS", 512))
+    # スプライトシート1枚あたりの最大人数
+    PAGE_SIZE = int(os.environ.get("BULK_PAGE_SIZE", 8))
+
+
+# CSV/JSONの列 (チーム番号・チーム内の番号・ブキ・ギア)
+FIELDS = ('team', 'slot', 'weapon_key', 'weapon', 'type', 'sub', 'special', 'head', 'clothing', 'shoes')
+
+# 1チーム分: [(ブキ, (頭, 服, 靴)), ...]
+Team = List[Tuple[Weapon, Tuple[Dict, Dict, Dict]]]
+
+
+def iter_rows(teams: Sequence[Team], name: Callable[[CatalogItem], str]) -> Iterator[Dict]:
+    """チームごとの選出結果を1人1行の辞書として順に返します"""
+    for team_no, team in enumerate(teams, 1):
+        for slot, (weapon, (head, clothing, shoes)) in enumerate(team, 1):
+            yield {
+                'team': team_no,
+                'slot': slot,
+                'weapon_key': weapon.key,
+                'weapon': name(weapon),
+                'type': name(weapon.type),
+                'sub': name(weapon.sub),
+                'special': name(weapon.special),
+                'head': head['name'],
+                'clothing': clothing['name'],
+                'shoes': shoes['name'],
+            }
+
+
+def iter_csv(rows: Iterable[Dict]) -> Iterator[bytes]:
+    """行をCSV (UTF-8 BOM付き、Excelでそのまま開ける形式) のバイト列として少しずつ返します"""
+    buffer = io.StringIO()
+    writer = csv.DictWriter(buffer, fieldnames=FIELDS)
+    buffer.write('\ufeff')
+    writer.writeheader()
+    for row in rows:
+        writer.writerow(row)
+        if buffer.tell() >= 64 * 1024:
+            yield buffer.getvalue().encode('utf-8')
+            buffer.seek(0)
+            buffer.truncate()
+    yield buffer.getvalue().encode('utf-8')
+
+
+def iter_json(rows: Iterable[Dict]) -> Iterator[bytes]:
+    """行をJSON配列のバイト列として1行ずつ返します (全体を一度に組み立てません)"""
+    yield b'['
+    for i, row in enumerate(rows):
+        yield (',\n' if i else '\n').encode('utf-8') + json.dumps(row, ensure_ascii=False).encode('utf-8')
+    yield b'\n]\n'
+
+
+EXPORTERS: Dict[str, Tuple[Callable[[Iterable[Dict]], Iterator[bytes]], str]] = {
+    'csv': (iter_csv, 'csv'),
+    'json': (iter_json, 'json'),
+}
+
+
+def export(rows: Iterable[Dict], fmt: str) -> Tuple[io.BytesIO, str]:
+    """行を指定形式で書き出し、(データ, 拡張子) を返します"""
+    exporter, ext = EXPORTERS[fmt]
+    data = io.BytesIO()
+    for chunk in exporter(rows):
+        data.write(chunk)
+    data.seek(0)
+    return data, ext
+
+
+def paginate(teams: Sequence[Team], page_size: int = BulkParams.PAGE_SIZE) -> List[List[Team]]:
+    """スプライトシートのページ分割 (チームがページをまたがないよう、1ページに入るチーム数ごとに区切ります)"""
+    team_size = max((len(t) for t in teams), default=1)
+    per_page = max(1, page_size // max(1, team_size))
+    return [list(teams[i:i + per_page]) for i in range(0, len(teams), per_page)]
@@ -0,0 +1,100 @@
+import os
+import sys
+from typing import Dict, List, Optional, Tuple
+
+
+class CatalogParams:
+    # 保持する言語 (表示に使う ja_JP と画像URLの生成に使う en_US は常に含めます)
+    LOCALES: Tuple[str, ...] = tuple(dict.fromkeys(
+        [l.strip() for l in os.environ.get("CATALOG_LOCALES", "ja_JP,en_US").split(',') if l.strip()] + ['ja_JP', 'en_US']
+    ))
+
+
+_LOCALE_INDEX = {lang: i for i, lang in enumerate(CatalogParams.LOCALES)}
+
+
+def _intern(value: Optional[str]) -> Optional[str]:
+    return sys.intern(value) if isinstance(value, str) else None
+
+
+def _names(raw: Optional[Dict[str, str]]) -> Tuple[Optional[str], ...]:
+    """stat.ink の多言語名から、設定された言語のみをタプルで取り出します"""
+    raw = raw or {}
+    return tuple(_intern(raw.get(lang)) for lang in CatalogParams.LOCALES)
+
+
+class CatalogItem:
+    """ブキの種類・サブウェポン・スペシャルウェポン (同じkeyのものは共有されます)"""
+    __slots__ = ('key', 'names')
+
+    def __init__(self, key: str, names: Tuple[Optional[str], ...]):
+        self.key = key
+        self.names = names
+
+    def name(self, lang: str = 'ja_JP') -> Optional[str]:
+        i = _LOCALE_INDEX.get(lang)
+        return self.names[i] if i is not None else None
+
+    def all_names(self) -> List[str]:
+        return [n for n in self.names if n]
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.key!r})"
+
+
+class Weapon(CatalogItem):
+    """メインウェポン1つ分のデータ"""
+    __slots__ = ('type', 'sub', 'special')
+
+    def __init__(self, key: str, names: Tuple[Optional[str], ...], weapon_type: Optional[CatalogItem],
+                 sub: Optional[CatalogItem], special: Optional[CatalogItem]):
+        super().__init__(key, names)
+        self.type = weapon_type
+        self.sub = sub
+        self.special = special
+
+
+def build_weapons(raw_weapons: List[Dict]) -> List[Weapon]:
+    """stat.ink のJSONからブキのリストを作ります
+
+    種類・サブ・スペシャルはkeyごとに1つのオブジェクトを作り、各ブキから参照を共有します。
+    """
+    shared: Dict[Tuple[str, str], CatalogItem] = {}
+
+    def _item(field: str, raw: Optional[Dict]) -> Optional[CatalogItem]:
+        if not raw or not raw.get('key'):
+            return None
+        key = _intern(raw['key'])
+        item = shared.get((field, key))
+        if item is None:
+            item = CatalogItem(key, _names(raw.get('name')))
+            shared[(field, key)] = item
+        return item
+
+    weapons = []
+    for raw in raw_weapons:
+        if not raw.get('key'):
+            continue
+        weapons.append(Weapon(
+            _intern(raw['key']),
+            _names(raw.get('name')),
+            _item('type', raw.get('type')),
+            _item('sub', raw.get('sub')),
+            _item('special', raw.get('special')),
+        ))
+    return weapons
+
+
+def collect_search_names(raw_weapons: List[Dict], field: str) -> Dict[str, List[str]]:
+    """stat.ink のJSONから、指定されたフィールドの key -> 全言語の名前 を集めます
+
+    保持する言語 (CATALOG_LOCALES) に関わらず、オートコンプリートは全言語の名前で検索できるようにするため、
+    カタログを作る前のJSONから取り出します。
+    """
+    names: Dict[str, List[str]] = {}
+    for raw in raw_weapons:
+        item = raw.get(field)
+        if not item or not item.get('key') or item['key'] in names:
+            continue
+        names[_intern(item['key'])] = list(dict.fromkeys(_intern(n) for n in (item.get('name') or {}).values() if n))
+    return names
@@ -0,0 +1,98 @@
+import hashlib
+import json
+import os
+import time
+from typing import Dict, List, Optional
+
+
+class CatalogStoreParams:
+    CATALOG_DIR = os.environ.get("CATALOG_DIR", os.path.join(".cache", "catalog"))
+    SCHEMA = 1
+
+
+class CatalogSnapshot:
+    """stat.ink から取得したカタログ1種類分のスナップショット"""
+
+    def __init__(self, name: str, data: List[Dict], version: int = 1,
+                 fetched_at: Optional[float] = None, etag: Optional[str] = None,
+                 last_modified: Optional[str] = None, digest: Optional[str] = None):
+        self.name = name
+        self.data = data
+        self.version = version
+        self.fetched_at = fetched_at if fetched_at is not None else time.time()
+        self.etag = etag
+        self.last_modified = last_modified
+        self.digest = digest or self.compute_digest(data)
+
+    @staticmethod
+    def compute_digest(data: List[Dict]) -> str:
+        """内容が変わったかどうかの判定に使うハッシュ値を返します"""
+        raw = json.dumps(data, sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    def to_dict(self) -> Dict:
+        return {
+            'schema': CatalogStoreParams.SCHEMA,
+            'name': self.name,
+            'version': self.version,
+            'fetched_at': self.fetched_at,
+            'etag': self.etag,
+            'last_modified': self.last_modified,
+            'digest': self.digest,
+            'data': self.data,
+        }
+
+    @classmethod
+    def from_dict(cls, raw: Dict) -> "CatalogSnapshot":
+        return cls(
+            name=raw['name'],
+            data=raw['data'],
+            version=raw.get('version', 1),
+            fetched_at=raw.get('fetched_at'),
+            etag=raw.get('etag'),
+            last_modified=raw.get('last_modified'),
+            digest=raw.get('digest'),
+        )
+
+
+class CatalogStore:
+    """カタログのスナップショットをローカルのJSONファイルに保存・読み込みします"""
+
+    def __init__(self, directory: str = CatalogStoreParams.CATALOG_DIR):
+        self.directory = directory
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, f"{name}.json")
+
+    def mtime(self, name: str) -> Optional[float]:
+        """スナップショットの更新日時を返します (存在しない場合は None)"""
+        try:
+            return os.path.getmtime(self._path(name))
+        except OSError:
+            return None
+
+    def load(self, name: str) -> Optional[CatalogSnapshot]:
+        """保存済みのスナップショットを読み込みます (存在しない・壊れている場合は None)"""
+        try:
+            with open(self._path(name), 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return None
+        except (OSError, ValueError) as e:
+            print(f"Failed to load catalog snapshot {name}: {e}")
+            return None
+        if raw.get('schema') != CatalogStoreParams.SCHEMA or not raw.get('data'):
+            return None
+        return CatalogSnapshot.from_dict(raw)
+
+    def save(self, snapshot: CatalogSnapshot) -> None:
+        """スナップショットを一時ファイル経由でアトミックに保存します"""
+        path = self._path(snapshot.name)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(self.directory, exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(snapshot.to_dict(), f, ensure_ascii=False)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to save catalog snapshot {snapshot.name}: {e}")
@@ -0,0 +1,171 @@
+import hashlib
+import os
+import time
+from collections import OrderedDict
+from typing import Dict, Optional, Tuple
+
+
+class ImageCacheParams:
+    CACHE_DIR = os.environ.get("IMAGE_CACHE_DIR", os.path.join(".cache", "images"))
+    # メモリ層・ディスク層それぞれの上限サイズ (バイト)
+    MEMORY_LIMIT = int(os.environ.get("IMAGE_CACHE_MEMORY_LIMIT", 32 * 1024 * 1024))
+    DISK_LIMIT = int(os.environ.get("IMAGE_CACHE_DISK_LIMIT", 256 * 1024 * 1024))
+    # この秒数を過ぎたエントリは再取得を試みる (失敗時は古いデータを返す)
+    TTL = int(os.environ.get("IMAGE_CACHE_TTL", 7 * 24 * 60 * 60))
+
+
+class ImageCache:
+    """URLをキーにした画像キャッシュ (メモリ層 + ディスク層, LRU)
+
+    エントリは URL の SHA-256 をファイル名として保存されます。
+    get() は (データ, 新鮮かどうか) を返し、TTL切れの場合は呼び出し側で再取得します。
+    """
+
+    def __init__(self, cache_dir: str = ImageCacheParams.CACHE_DIR,
+                 memory_limit: int = ImageCacheParams.MEMORY_LIMIT,
+                 disk_limit: int = ImageCacheParams.DISK_LIMIT,
+                 ttl: int = ImageCacheParams.TTL):
+        self.cache_dir = cache_dir
+        self.memory_limit = memory_limit
+        self.disk_limit = disk_limit
+        self.ttl = ttl
+
+        # key -> (data, fetched_at)
+        self._memory: "OrderedDict[str, Tuple[bytes, float]]" = OrderedDict()
+        self._memory_size = 0
+        # key -> size (最終アクセス順)
+        self._disk_index: "OrderedDict[str, int]" = OrderedDict()
+        self._disk_size = 0
+
+        self.hits = 0
+        self.misses = 0
+
+        self._load_disk_index()
+
+    @staticmethod
+    def _key(url: str) -> str:
+        return hashlib.sha256(url.encode('utf-8')).hexdigest()
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.cache_dir, key[:2], key)
+
+    def _load_disk_index(self) -> None:
+        """起動時にディスク上のエントリを更新日時順に読み込みます"""
+        if not self.cache_dir or not os.path.isdir(self.cache_dir):
+            return
+        entries = []
+        for root, _, files in os.walk(self.cache_dir):
+            for name in files:
+                if name.endswith('.tmp'):
+                    continue
+                try:
+                    st = os.stat(os.path.join(root, name))
+                except OSError:
+                    continue
+                entries.append((st.st_mtime, name, st.st_size))
+        for _, key, size in sorted(entries):
+            self._disk_index[key] = size
+            self._disk_size += size
+        self._evict_disk()
+
+    def get(self, url: str) -> Optional[Tuple[bytes, bool]]:
+        """キャッシュからデータを取り出します。(データ, TTL内かどうか) を返します"""
+        key = self._key(url)
+        now = time.time()
+
+        entry = self._memory.get(key)
+        if entry is not None:
+            self._memory.move_to_end(key)
+            if key in self._disk_index:
+                self._disk_index.move_to_end(key)
+            self.hits += 1
+            data, fetched_at = entry
+            return data, (now - fetched_at) < self.ttl
+
+        if self.cache_dir:
+            # 索引に無いエントリも、他のプロセスが同じディレクトリに保存している場合があるため確認する
+            path = self._path(key)
+            try:
+                with open(path, 'rb') as f:
+                    data = f.read()
+                fetched_at = os.path.getmtime(path)
+            except OSError:
+                if key in self._disk_index:
+                    self._drop_disk(key)
+            else:
+                if key in self._disk_index:
+                    self._disk_index.move_to_end(key)
+                else:
+                    self._disk_index[key] = len(data)
+                    self._disk_size += len(data)
+                    self._evict_disk()
+                self._put_memory(key, data, fetched_at)
+                self.hits += 1
+                return data, (now - fetched_at) < self.ttl
+
+        self.misses += 1
+        return None
+
+    def put(self, url: str, data: bytes) -> None:
+        """データをメモリ層とディスク層に保存します"""
+        if not data:
+            return
+        key = self._key(url)
+        now = time.time()
+        self._put_memory(key, data, now)
+        self._put_disk(key, data)
+
+    def _put_memory(self, key: str, data: bytes, fetched_at: float) -> None:
+        if len(data) > self.memory_limit:
+            return
+        old = self._memory.pop(key, None)
+        if old is not None:
+            self._memory_size -= len(old[0])
+        self._memory[key] = (data, fetched_at)
+        self._memory_size += len(data)
+        while self._memory_size > self.memory_limit and self._memory:
+            _, (evicted, _) = self._memory.popitem(last=False)
+            self._memory_size -= len(evicted)
+
+    def _put_disk(self, key: str, data: bytes) -> None:
+        if not self.cache_dir or len(data) > self.disk_limit:
+            return
+        path = self._path(key)
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            with open(tmp_path, 'wb') as f:
+                f.write(data)
+            # 書き込み途中のファイルを読まれないようにアトミックに置き換える
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write image cache: {e}")
+            return
+
+        self._disk_size -= self._disk_index.pop(key, 0)
+        self._disk_index[key] = len(data)
+        self._disk_size += len(data)
+        self._evict_disk()
+
+    def _drop_disk(self, key: str) -> None:
+        self._disk_size -= self._disk_index.pop(key, 0)
+        try:
+            os.remove(self._path(key))
+        except OSError:
+            pass
+
+    def _evict_disk(self) -> None:
+        while self._disk_size > self.disk_limit and self._disk_index:
+            key = next(iter(self._disk_index))
+            self._drop_disk(key)
+
+    def stats(self) -> Dict[str, int]:
+        """キャッシュの統計情報を返します"""
+        return {
+            'hits': self.hits,
+            'misses': self.misses,
+            'memory_entries': len(self._memory),
+            'memory_bytes': self._memory_size,
+            'disk_entries': len(self._disk_index),
+            'disk_bytes': self._disk_size,
+        }
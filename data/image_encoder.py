@@ -0,0 +1,82 @@
+import io
+import os
+from typing import TYPE_CHECKING, Callable, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    # PIL は画像を扱う時点で読み込まれていれば十分なため、ここでは型注釈にのみ使う
+    from PIL import Image
+
+
+class EncoderParams:
+    # "auto" の場合は BYTE_BUDGET に収まる最も軽いエンコーダを選びます
+    MODE = os.environ.get("OUTPUT_ENCODER", "auto")
+    BYTE_BUDGET = int(os.environ.get("OUTPUT_BYTE_BUDGET", 512 * 1024))
+    # "auto" で試す順番 (エンコードが軽い順)
+    AUTO_ORDER = tuple(os.environ.get("OUTPUT_ENCODER_ORDER", "png_fast,png_quantized,webp_lossless").split(','))
+
+
+def _encode_png(img: "Image.Image", compress_level: int) -> bytes:
+    output = io.BytesIO()
+    img.save(output, format='PNG', compress_level=compress_level)
+    return output.getvalue()
+
+
+def encode_png(img: "Image.Image") -> bytes:
+    """既定の設定 (zlibレベル6) のPNG"""
+    return _encode_png(img, 6)
+
+
+def encode_png_fast(img: "Image.Image") -> bytes:
+    """圧縮率より速度を優先したPNG (zlibレベル1)"""
+    return _encode_png(img, 1)
+
+
+def encode_png_quantized(img: "Image.Image") -> bytes:
+    """256色に減色したパレットPNG (透過を保持します)"""
+    from PIL import Image
+    quantized = img.quantize(colors=256, method=Image.Quantize.FASTOCTREE)
+    output = io.BytesIO()
+    quantized.save(output, format='PNG', compress_level=6)
+    return output.getvalue()
+
+
+def encode_webp_lossless(img: "Image.Image") -> bytes:
+    """ロスレスWebP"""
+    output = io.BytesIO()
+    img.save(output, format='WEBP', lossless=True, quality=50, method=1)
+    return output.getvalue()
+
+
+# エンコーダ名 -> (エンコード関数, 拡張子)
+ENCODERS: Dict[str, Tuple[Callable[["Image.Image"], bytes], str]] = {
+    'png': (encode_png, 'png'),
+    'png_fast': (encode_png_fast, 'png'),
+    'png_quantized': (encode_png_quantized, 'png'),
+    'webp_lossless': (encode_webp_lossless, 'webp'),
+}
+
+
+def encode_image(img: "Image.Image", mode: str = EncoderParams.MODE,
+                 byte_budget: Optional[int] = EncoderParams.BYTE_BUDGET) -> Tuple[bytes, str]:
+    """画像をエンコードし、(バイト列, 拡張子) を返します
+
+    mode が "auto" の場合は AUTO_ORDER の順に試し、byte_budget 以下に収まった最初の結果を返します。
+    どれも収まらない場合は最も小さい結果を返します。
+    """
+    if mode != 'auto':
+        encoder, ext = ENCODERS.get(mode, ENCODERS['png'])
+        return encoder(img), ext
+
+    smallest: Optional[Tuple[bytes, str]] = None
+    for name in EncoderParams.AUTO_ORDER:
+        if name not in ENCODERS:
+            continue
+        encoder, ext = ENCODERS[name]
+        data = encoder(img)
+        if byte_budget is None or len(data) <= byte_budget:
+            return data, ext
+        if smallest is None or len(data) < len(smallest[0]):
+            smallest = (data, ext)
+    if smallest is None:
+        return encode_png(img), 'png'
+    return smallest
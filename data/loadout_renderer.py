@@ -0,0 +1,187 @@
+import io
+import time
+from typing import Dict, List, Optional, Tuple
+
+from PIL import Image
+
+from data.image_encoder import EncoderParams, encode_image
+from data.shared_tile_store import SharedTileStore, SharedTileStoreParams
+from data.sprite_atlas import get_atlas
+from data.tile_cache import TileCache, TileCacheParams
+
+# レンダリングを行うプロセス/スレッド内で共有するキャッシュ
+# (プロセスプールの場合は各ワーカープロセスがそれぞれ保持し、ヒット数は RenderWorker が集計します)
+_tile_cache = TileCache(TileCacheParams.TILE_MEMORY_LIMIT)
+_cell_cache = TileCache(TileCacheParams.CELL_MEMORY_LIMIT)
+# 複数プロセスで共有するディスク上のタイル (TILE_STORE_DIR 設定時のみ)
+_shared_tiles: Optional[SharedTileStore] = (
+    SharedTileStore(SharedTileStoreParams.TILE_STORE_DIR) if SharedTileStoreParams.TILE_STORE_DIR else None
+)
+
+
+def cache_stats() -> Dict[str, Tuple[int, int]]:
+    """このプロセスのタイル・セルキャッシュの (ヒット数, ミス数)"""
+    return {
+        'tile': (_tile_cache.hits, _tile_cache.misses),
+        'cell': (_cell_cache.hits, _cell_cache.misses),
+    }
+
+
+def _lookup_tile(key: Tuple) -> Optional[Image.Image]:
+    """メモリ上のキャッシュ、次に共有タイルストアからタイルを探します"""
+    tile = _tile_cache.get(key)
+    if tile is None and _shared_tiles is not None:
+        tile = _shared_tiles.get(key)
+        if tile is not None:
+            _tile_cache.put(key, tile)
+    return tile
+
+
+def _store_tile(key: Tuple, tile: Image.Image) -> None:
+    _tile_cache.put(key, tile)
+    if _shared_tiles is not None:
+        _shared_tiles.put(key, tile)
+
+
+def _get_tile(kind: str, key: Optional[str], data: Optional[bytes], size: Optional[Tuple[int, int]] = None) -> Optional[Image.Image]:
+    """デコード済みのRGBAタイルを返します (size指定時はリサイズ済みのもの)"""
+    if not key:
+        return None
+    # ビルド済みのアトラスにあればデコードせずにそのまま使う
+    atlas = get_atlas()
+    atlas_tile = atlas.get(kind, key) if atlas is not None else None
+    if atlas_tile is not None and (size is None or atlas_tile.size == size):
+        return atlas_tile
+
+    tile = _lookup_tile((kind, key, size))
+    if tile is not None:
+        return tile
+
+    original = atlas_tile if atlas_tile is not None else _lookup_tile((kind, key, None))
+    if original is None:
+        if not data:
+            return None
+        try:
+            with Image.open(io.BytesIO(data)) as img:
+                original = img.convert('RGBA')
+        except Exception as e:
+            print(f"Error decoding image {kind}/{key}: {e}")
+            return None
+        _store_tile((kind, key, None), original)
+
+    if size is None or original.size == size:
+        return original
+    tile = original.resize(size)
+    _store_tile((kind, key, size), tile)
+    return tile
+
+
+def _compose_cell(main_img: Image.Image, gear_icons: List[Image.Image], cell_w: int, cell_h: int, gear_size: int, padding: int) -> Image.Image:
+    """プレイヤー1人分 (メイン + ギア3つ) のセル画像を作成する"""
+    cell = Image.new('RGBA', (cell_w, cell_h), (0, 0, 0, 0))
+    w, h = main_img.size
+
+    # 1. メインウェポン描画 (中央揃え)
+    cell.paste(main_img, ((cell_w - w) // 2, 0))
+
+    # 2. ギアパワー描画 (中央揃え)
+    if gear_icons:
+        current_y = h + padding
+        total_w = (gear_size * len(gear_icons)) + (padding * (len(gear_icons) - 1))
+        start_x = (cell_w - total_w) // 2
+        for idx, img in enumerate(gear_icons):
+            cell.paste(img, (start_x + (gear_size + padding) * idx, current_y))
+    return cell
+
+
+def compose_loadout(layout: Dict, missing: Optional[List[str]] = None) -> Optional[Image.Image]:
+    """レイアウト記述から合成画像を作成します
+
+    layout の形式:
+        {
+            'gear_size': 64, 'padding': 10,
+            'players': [
+                {'main_key': str, 'main': bytes | None, 'gears': [[key, bytes | None], ...]},
+                ...
+            ],
+        }
+    各画像データはタイルがキャッシュ済みであれば None でも構いません。
+    missing を渡すと、画像が無く描画できなかったタイル ("main/<key>" / "gear/<key>") を追加します。
+    """
+    players = layout['players']
+    gear_size = layout.get('gear_size', 64)
+    padding = layout.get('padding', 10)
+
+    main_tiles = [_get_tile('main', p.get('main_key'), p.get('main')) for p in players]
+
+    # メイン画像のサイズ基準を取得 (最初の有効な画像から)
+    first_valid = next((t for t in main_tiles if t is not None), None)
+    if first_valid is None:
+        return None
+    w, h = first_valid.size
+
+    # グリッド計算 (4人以上は2列、それ以下は1列など)
+    count = len(players)
+    if count <= 3:
+        cols = count
+        rows = 1
+    else:
+        cols = 2
+        rows = (count + 1) // 2
+
+    # 1セルのサイズ計算
+    # レイアウト:
+    # [Main Weapon]
+    # [Gear] [Gear] [Gear]
+    cell_w = max(w, (gear_size * 3) + (padding * 2))
+    cell_h = h + padding + gear_size + padding
+
+    combined = Image.new('RGBA', (cell_w * cols, cell_h * rows), (0, 0, 0, 0))
+
+    for i, player in enumerate(players):
+        if main_tiles[i] is None:
+            if missing is not None:
+                missing.append(f"main/{player.get('main_key')}")
+            continue
+
+        c = i % cols
+        r = i // cols
+        gears = player.get('gears', [])
+
+        # 同じ組み合わせのセルは合成済みのものを1回貼るだけにする
+        cell_key = (player.get('main_key'), tuple(key for key, _ in gears), (w, h), gear_size, padding)
+        cell = _cell_cache.get(cell_key)
+        if cell is None:
+            main_img = _get_tile('main', player.get('main_key'), player.get('main'), (w, h))
+            gear_icons = [_get_tile('gear', key, data, (gear_size, gear_size)) for key, data in gears]
+            cell = _compose_cell(main_img, [g for g in gear_icons if g is not None], cell_w, cell_h, gear_size, padding)
+            # 取得できなかった画像があるセルはキャッシュせず、次回は揃った画像で合成し直す
+            if main_img is not None and all(g is not None for g in gear_icons):
+                _cell_cache.put(cell_key, cell)
+            elif missing is not None:
+                missing.extend(f"gear/{key}" for (key, _), g in zip(gears, gear_icons) if g is None)
+
+        combined.paste(cell, (c * cell_w, r * cell_h))
+
+    return combined
+
+
+def render_loadout(layout: Dict) -> Optional[Tuple[bytes, str, Dict[str, float], bool]]:
+    """レイアウト記述から合成画像を作成してエンコードし、(バイト列, 拡張子, 段階別の所要秒数, 全画像が揃ったか) を返します
+
+    layout に 'encoder' / 'byte_budget' があればエンコード方法の指定として使います。
+    イベントループの外 (スレッドプール/プロセスプール) で実行されることを想定しています。
+    """
+    started = time.perf_counter()
+    missing: List[str] = []
+    combined = compose_loadout(layout, missing)
+    if combined is None:
+        return None
+    composed = time.perf_counter()
+    data, ext = encode_image(
+        combined,
+        layout.get('encoder', EncoderParams.MODE),
+        layout.get('byte_budget', EncoderParams.BYTE_BUDGET),
+    )
+    timings = {'composite': composed - started, 'encode': time.perf_counter() - composed}
+    return data, ext, timings, not missing
@@ -0,0 +1,266 @@
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, Iterator, List, Optional, Sequence, Tuple
+
+# ラベルの組み合わせ ((name, value), ...) をキーとして値を保持します
+LabelKey = Tuple[Tuple[str, str], ...]
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _label_key(labels: Dict[str, object]) -> LabelKey:
+    return tuple(sorted((k, str(v)) for k, v in labels.items()))
+
+
+def _escape(value: str) -> str:
+    return value.replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _format_labels(key: LabelKey, extra: Optional[Tuple[str, str]] = None) -> str:
+    pairs = list(key) + ([extra] if extra else [])
+    if not pairs:
+        return ''
+    return '{' + ','.join(f'{k}="{_escape(v)}"' for k, v in pairs) + '}'
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if not float(value).is_integer() else str(int(value))
+
+
+class _Metric:
+    TYPE = ''
+
+    def __init__(self, name: str, documentation: str):
+        self.name = name
+        self.documentation = documentation
+        self._lock = threading.Lock()
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} {self.TYPE}"]
+        lines.extend(self._samples())
+        return lines
+
+    def _samples(self) -> List[str]:
+        raise NotImplementedError
+
+
+class Counter(_Metric):
+    """単調増加するカウンター (他の場所で数えている累計値は関数を登録して出力時に取得します)"""
+    TYPE = 'counter'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self._functions: Dict[LabelKey, Callable[[], float]] = {}
+
+    def inc(self, amount: float = 1, **labels) -> None:
+        key = _label_key(labels)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def set_function(self, func: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._functions[_label_key(labels)] = func
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, func in functions.items():
+            try:
+                values[key] = func()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values.items()]
+
+
+class Gauge(_Metric):
+    """任意の値を取るゲージ (関数を登録すると出力時に値を取得します)"""
+    TYPE = 'gauge'
+
+    def __init__(self, name: str, documentation: str):
+        super().__init__(name, documentation)
+        self._values: Dict[LabelKey, float] = {}
+        self._functions: Dict[LabelKey, Callable[[], float]] = {}
+
+    def set(self, value: float, **labels) -> None:
+        with self._lock:
+            self._values[_label_key(labels)] = value
+
+    def set_function(self, func: Callable[[], float], **labels) -> None:
+        with self._lock:
+            self._functions[_label_key(labels)] = func
+
+    def _samples(self) -> List[str]:
+        with self._lock:
+            values = dict(self._values)
+            functions = dict(self._functions)
+        for key, func in functions.items():
+            try:
+                values[key] = func()
+            except Exception:
+                continue
+        return [f"{self.name}{_format_labels(k)} {_format_value(v)}" for k, v in values.items()]
+
+
+class Histogram(_Metric):
+    """累積バケット形式のヒストグラム"""
+    TYPE = 'histogram'
+
+    def __init__(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        super().__init__(name, documentation)
+        self.buckets = tuple(sorted(buckets))
+        # key -> ([バケット毎の件数..., +Inf], 合計)
+        self._values: Dict[LabelKey, Tuple[List[int], float]] = {}
+
+    def observe(self, value: float, **labels) -> None:
+        key = _label_key(labels)
+        index = bisect.bisect_left(self.buckets, value)
+        with self._lock:
+            counts, total = self._values.get(key) or ([0] * (len(self.buckets) + 1), 0.0)
+            counts[index] += 1
+            self._values[key] = (counts, total + value)
+
+    @contextmanager
+    def time(self, **labels) -> Iterator[None]:
+        """with ブロックの実行時間を記録します"""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.observe(time.perf_counter() - start, **labels)
+
+    def _samples(self) -> List[str]:
+        lines = []
+        with self._lock:
+            items = [(k, list(counts), total) for k, (counts, total) in self._values.items()]
+        for key, counts, total in items:
+            cumulative = 0
+            for bound, count in zip((*self.buckets, float('inf')), counts):
+                cumulative += count
+                lines.append(f"{self.name}_bucket{_format_labels(key, ('le', _format_value(bound)))} {cumulative}")
+            lines.append(f"{self.name}_sum{_format_labels(key)} {_format_value(total)}")
+            lines.append(f"{self.name}_count{_format_labels(key)} {cumulative}")
+        return lines
+
+
+class MetricsRegistry:
+    """メトリクスを登録し、Prometheus のテキスト形式で出力します"""
+
+    def __init__(self):
+        self._metrics: Dict[str, _Metric] = {}
+        self._lock = threading.Lock()
+
+    def _register(self, metric: _Metric) -> _Metric:
+        with self._lock:
+            existing = self._metrics.get(metric.name)
+            if existing is not None:
+                return existing
+            self._metrics[metric.name] = metric
+            return metric
+
+    def counter(self, name: str, documentation: str) -> Counter:
+        return self._register(Counter(name, documentation))
+
+    def gauge(self, name: str, documentation: str) -> Gauge:
+        return self._register(Gauge(name, documentation))
+
+    def histogram(self, name: str, documentation: str, buckets: Sequence[float] = DEFAULT_BUCKETS) -> Histogram:
+        return self._register(Histogram(name, documentation, buckets))
+
+    def render(self) -> str:
+        with self._lock:
+            metrics = list(self._metrics.values())
+        lines = []
+        for metric in metrics:
+            lines.extend(metric.render())
+        return '\n'.join(lines) + '\n'
+
+
+def _add_label(sample: str, label: str) -> str:
+    """サンプル行 (name{...} value / name value) の先頭にラベルを追加します"""
+    name_end = min(i for i in (sample.find('{'), sample.find(' ')) if i >= 0)
+    if sample[name_end] == '{':
+        return f"{sample[:name_end + 1]}{label},{sample[name_end + 1:]}"
+    return f"{sample[:name_end]}{{{label}}}{sample[name_end:]}"
+
+
+def merge_expositions(expositions: Dict[str, str], label: str = 'worker') -> str:
+    """複数プロセスの Prometheus テキスト形式の出力を、プロセスごとのラベルを付けて1つにまとめます
+
+    同じ名前のメトリクスは HELP / TYPE を1回だけ出力し、その下に各プロセスのサンプルを並べます。
+    """
+    # メトリクス名 -> (HELP / TYPE 行, サンプル行)
+    families: Dict[str, Tuple[List[str], List[str]]] = {}
+    for source, text in expositions.items():
+        current = None
+        for line in text.splitlines():
+            if not line.strip():
+                continue
+            if line.startswith('#'):
+                parts = line.split(None, 3)
+                if len(parts) >= 3 and parts[1] in ('HELP', 'TYPE'):
+                    current = families.setdefault(parts[2], ([], []))
+                    if not any(h.split(None, 2)[1] == parts[1] for h in current[0]):
+                        current[0].append(line)
+                continue
+            if current is None:
+                current = families.setdefault(line.split('{', 1)[0].split(' ', 1)[0], ([], []))
+            current[1].append(_add_label(line, f'{label}="{_escape(source)}"'))
+    lines = []
+    for headers, samples in families.values():
+        lines.extend(headers)
+        lines.extend(samples)
+    return '\n'.join(lines) + '\n'
+
+
+REGISTRY = MetricsRegistry()
+
+# コマンドの処理時間 (段階別)
+COMMAND_SECONDS = REGISTRY.histogram(
+    'spl3_command_seconds', "Total time spent handling a command.")
+COMMAND_STAGE_SECONDS = REGISTRY.histogram(
+    'spl3_command_stage_seconds', "Time spent in each stage of a command (catalog, image_fetch, composite, encode, upload).")
+
+# 合成画像なしで応答した回数 (理由別: deadline, queue_full)
+RENDER_FALLBACKS = REGISTRY.counter(
+    'spl3_render_fallbacks_total', "Responses sent without the composite image, by reason.")
+# 実行中と待機中のレンダリング数
+RENDER_QUEUE_DEPTH = REGISTRY.gauge(
+    'spl3_render_queue_depth', "Renders running or waiting for a worker.")
+
+# 上流 (stat.ink / splatoonwiki) へのリクエスト
+UPSTREAM_REQUESTS = REGISTRY.counter(
+    'spl3_upstream_requests_total', "Upstream HTTP requests by host and status.")
+UPSTREAM_SECONDS = REGISTRY.histogram(
+    'spl3_upstream_request_seconds', "Upstream HTTP request latency by host.")
+UPSTREAM_EVENTS = REGISTRY.counter(
+    'spl3_upstream_events_total', "Image fetch resilience events (retry, hedge, circuit_open, redirect_cache_hit).")
+FETCH_DEDUPLICATED = REGISTRY.counter(
+    'spl3_fetch_deduplicated_total', "Fetches that joined an in-flight request or were skipped during backoff, by kind and reason.")
+
+# キャッシュ
+CACHE_HITS = REGISTRY.counter('spl3_cache_hits_total', "Cache hits since start by cache.")
+CACHE_MISSES = REGISTRY.counter('spl3_cache_misses_total', "Cache misses since start by cache.")
+CACHE_HIT_RATIO = REGISTRY.gauge('spl3_cache_hit_ratio', "Cache hit ratio since start by cache.")
+
+# イベントループの遅延
+EVENT_LOOP_LAG_SECONDS = REGISTRY.histogram(
+    'spl3_event_loop_lag_seconds', "Delay between when a loop callback was due and when it ran.",
+    buckets=(0.001, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5))
+
+
+def register_cache(name: str, cache) -> None:
+    """hits / misses 属性を持つキャッシュのヒット率を公開します"""
+    CACHE_HITS.set_function(lambda: cache.hits, cache=name)
+    CACHE_MISSES.set_function(lambda: cache.misses, cache=name)
+
+    def _ratio() -> float:
+        total = cache.hits + cache.misses
+        return cache.hits / total if total else 0.0
+
+    CACHE_HIT_RATIO.set_function(_ratio, cache=name)
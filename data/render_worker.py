@@ -0,0 +1,135 @@
+import asyncio
+import os
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from typing import Dict, Optional, Tuple
+
+from data.metrics import RENDER_QUEUE_DEPTH, register_cache
+
+
+class RenderParams:
+    # "thread" または "process"
+    EXECUTOR = os.environ.get("RENDER_EXECUTOR", "thread")
+    WORKERS = int(os.environ.get("RENDER_WORKERS", 2))
+    # 実行中のものに加えて待機できるレンダリング数
+    QUEUE_LIMIT = int(os.environ.get("RENDER_QUEUE_LIMIT", 16))
+
+
+def _render(layout: Dict) -> Tuple[Optional[Tuple[bytes, str, Dict[str, float], bool]], int, Dict[str, Tuple[int, int]]]:
+    """(レンダリング結果, 実行したプロセスID, そのプロセスのキャッシュのヒット数) を返します"""
+    # PIL を含む合成処理のモジュールは最初のレンダリング時に (ワーカー内で) 読み込む
+    from data.loadout_renderer import cache_stats, render_loadout
+    return render_loadout(layout), os.getpid(), cache_stats()
+
+
+class _RenderCacheStats:
+    """レンダリングを行う各プロセスから報告されたキャッシュのヒット数を合計します
+
+    プロセスプールではキャッシュが子プロセスにあるため、レンダリングの結果とともに
+    各プロセスの累計値を受け取り、プロセスごとの最新値の合計を公開します。
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        # pid -> (ヒット数, ミス数)
+        self._counts: Dict[int, Tuple[int, int]] = {}
+
+    def update(self, pid: int, counts: Tuple[int, int]) -> None:
+        with self._lock:
+            self._counts[pid] = counts
+
+    @property
+    def hits(self) -> int:
+        with self._lock:
+            return sum(h for h, _ in self._counts.values())
+
+    @property
+    def misses(self) -> int:
+        with self._lock:
+            return sum(m for _, m in self._counts.values())
+
+
+_cache_stats = {name: _RenderCacheStats() for name in ('tile', 'cell')}
+for _name, _stats in _cache_stats.items():
+    register_cache(_name, _stats)
+
+
+class RenderQueueFull(Exception):
+    """レンダリング待ちが上限に達した場合に送出されます"""
+
+
+class RenderWorker:
+    """画像の合成・エンコードをイベントループ外のプールで実行するワーカー
+
+    同時実行数はワーカー数までに制限され、待機数が上限を超えた場合は
+    RenderQueueFull を送出して呼び出し側に画像なしでの応答を促します。
+    """
+
+    def __init__(self, executor: str = RenderParams.EXECUTOR,
+                 workers: int = RenderParams.WORKERS,
+                 queue_limit: int = RenderParams.QUEUE_LIMIT):
+        self.executor_type = executor
+        self.workers = max(1, workers)
+        self.queue_limit = max(0, queue_limit)
+        self._executor: Optional[Executor] = None
+        self._semaphore = asyncio.Semaphore(self.workers)
+        self._pending = 0
+        RENDER_QUEUE_DEPTH.set_function(lambda: self.pending)
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.executor_type == "process":
+                self._executor = ProcessPoolExecutor(max_workers=self.workers)
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.workers, thread_name_prefix="render")
+        return self._executor
+
+    @property
+    def pending(self) -> int:
+        """実行中と待機中のレンダリング数"""
+        return self._pending
+
+    async def render(self, layout: Dict) -> Optional[Tuple[bytes, str, Dict[str, float], bool]]:
+        """レイアウト記述を画像にレンダリングし、(エンコード済みのバイト列, 拡張子, 段階別の所要秒数, 全画像が揃ったか) を返します
+
+        呼び出し側が待つのをやめても (期限切れなど) プールでの実行は止まらないため、
+        実行枠はプールでの実行が終わるまで確保したままにし、結果だけを破棄します。
+        """
+        if self._pending >= self.workers + self.queue_limit:
+            raise RenderQueueFull(f"{self._pending} renders pending")
+
+        self._pending += 1
+        try:
+            await self._semaphore.acquire()
+        except BaseException:
+            self._pending -= 1
+            raise
+        try:
+            loop = asyncio.get_running_loop()
+            future = loop.run_in_executor(self._get_executor(), _render, layout)
+        except BaseException:
+            self._release()
+            raise
+        future.add_done_callback(self._finish)
+        result, _, _ = await asyncio.shield(future)
+        return result
+
+    def _release(self) -> None:
+        self._semaphore.release()
+        self._pending -= 1
+
+    def _finish(self, future: asyncio.Future) -> None:
+        """プールでの実行が終わった時点で実行枠を解放し、キャッシュのヒット数を記録します"""
+        self._release()
+        # 待つのをやめた呼び出しの結果・例外もここで受け取る (未取得の警告を出さない)
+        if future.cancelled() or future.exception() is not None:
+            return
+        _, pid, stats = future.result()
+        for name, counts in stats.items():
+            _cache_stats[name].update(pid, counts)
+
+    def shutdown(self) -> None:
+        """プールを停止します"""
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
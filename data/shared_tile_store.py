@@ -0,0 +1,67 @@
+import hashlib
+import mmap
+import os
+import struct
+from typing import Dict, Hashable, Optional
+
+from PIL import Image
+
+
+class SharedTileStoreParams:
+    # 未設定の場合は共有しない (各プロセスのメモリ上のキャッシュのみ)
+    TILE_STORE_DIR = os.environ.get("TILE_STORE_DIR") or None
+
+
+# ファイル先頭のヘッダー (幅, 高さ)
+_HEADER = struct.Struct('<II')
+
+
+class SharedTileStore:
+    """デコード済みのRGBAタイルを生データのままディスクに保存し、複数プロセスで共有するストア
+
+    読み込みは mmap で行うため、同じタイルを使う全プロセスでページキャッシュが共有され、
+    PNGのデコードも発生しません。書き込みは一時ファイル経由でアトミックに行います。
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        os.makedirs(directory, exist_ok=True)
+        # このプロセスで開いた mmap (タイルの画像が参照しているため閉じずに保持します)
+        self._maps: Dict[str, mmap.mmap] = {}
+
+    def _path(self, key: Hashable) -> str:
+        digest = hashlib.sha256(repr(key).encode('utf-8')).hexdigest()
+        return os.path.join(self.directory, f"{digest}.rgba")
+
+    def get(self, key: Hashable) -> Optional[Image.Image]:
+        """保存済みのタイルを mmap した画像として返します (無ければ None)"""
+        path = self._path(key)
+        mm = self._maps.get(path)
+        if mm is None:
+            try:
+                with open(path, 'rb') as f:
+                    mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+            except (OSError, ValueError):
+                return None
+            self._maps[path] = mm
+        width, height = _HEADER.unpack_from(mm, 0)
+        if len(mm) != _HEADER.size + width * height * 4:
+            return None
+        buffer = memoryview(mm)[_HEADER.size:]
+        return Image.frombuffer('RGBA', (width, height), buffer, 'raw', 'RGBA', 0, 1)
+
+    def put(self, key: Hashable, img: Image.Image) -> None:
+        """タイルを保存します (既に存在する場合は何もしません)"""
+        path = self._path(key)
+        if os.path.exists(path):
+            return
+        if img.mode != 'RGBA':
+            img = img.convert('RGBA')
+        tmp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(tmp_path, 'wb') as f:
+                f.write(_HEADER.pack(img.width, img.height))
+                f.write(img.tobytes())
+            os.replace(tmp_path, path)
+        except OSError as e:
+            print(f"Failed to write shared tile: {e}")
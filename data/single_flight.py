@@ -0,0 +1,82 @@
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, Hashable, Tuple, TypeVar
+
+from data.metrics import FETCH_DEDUPLICATED
+
+T = TypeVar('T')
+
+
+class SingleFlightParams:
+    # 失敗したリソースを再取得するまでの待ち時間 (失敗するたびに倍、上限あり)
+    BACKOFF_BASE = float(os.environ.get("FETCH_BACKOFF_BASE", 1.0))
+    BACKOFF_MAX = float(os.environ.get("FETCH_BACKOFF_MAX", 300.0))
+
+
+class FetchFailed(Exception):
+    """取得に失敗した場合に送出されます (同じ取得を待っていた全員に伝わります)"""
+
+
+class BackoffActive(FetchFailed):
+    """直前に失敗したリソースの再試行待ちの間に送出されます"""
+
+
+class SingleFlight:
+    """同じキーへの同時の取得を1回にまとめ、失敗したキーはバックオフの間取得しないようにします
+
+    キーは (種類, リソース名) のタプルを想定しています (種類はメトリクスのラベルに使います)。
+    """
+
+    def __init__(self, backoff_base: float = SingleFlightParams.BACKOFF_BASE,
+                 backoff_max: float = SingleFlightParams.BACKOFF_MAX):
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self._inflight: Dict[Hashable, asyncio.Task] = {}
+        # key -> (連続失敗回数, 再試行できる時刻)
+        self._failures: Dict[Hashable, Tuple[int, float]] = {}
+
+    @staticmethod
+    def _kind(key: Hashable) -> str:
+        return str(key[0]) if isinstance(key, tuple) and key else 'unknown'
+
+    def retry_after(self, key: Hashable) -> float:
+        """再試行できるまでの残り秒数 (バックオフ中でなければ 0)"""
+        failure = self._failures.get(key)
+        if failure is None:
+            return 0.0
+        return max(0.0, failure[1] - time.monotonic())
+
+    async def do(self, key: Hashable, func: Callable[[], Awaitable[T]]) -> T:
+        """key の取得が実行中であればその結果を待ち、そうでなければ func を実行します
+
+        func は失敗時に FetchFailed を送出してください。失敗したキーはバックオフの間
+        BackoffActive を送出し、func を呼び出しません。
+        """
+        task = self._inflight.get(key)
+        if task is not None:
+            FETCH_DEDUPLICATED.inc(kind=self._kind(key), reason='inflight')
+        else:
+            if self.retry_after(key) > 0:
+                FETCH_DEDUPLICATED.inc(kind=self._kind(key), reason='backoff')
+                raise BackoffActive(f"{key} is backing off for {self.retry_after(key):.1f}s")
+            task = asyncio.ensure_future(func())
+            self._inflight[key] = task
+            task.add_done_callback(lambda t: self._finished(key, t))
+        # 待っている呼び出し元がキャンセルされても共有の取得は続ける
+        return await asyncio.shield(task)
+
+    def _finished(self, key: Hashable, task: asyncio.Task) -> None:
+        if self._inflight.get(key) is task:
+            del self._inflight[key]
+        if task.cancelled():
+            return
+        error = task.exception()
+        if error is None:
+            self._failures.pop(key, None)
+        elif isinstance(error, FetchFailed):
+            count = self._failures.get(key, (0, 0.0))[0] + 1
+            delay = min(self.backoff_max, self.backoff_base * (2 ** (count - 1)))
+            # 複数のキーが同時に再試行しないようにばらつかせる
+            self._failures[key] = (count, time.monotonic() + delay * random.uniform(0.5, 1.0))
@@ -0,0 +1,117 @@
+import io
+import json
+import mmap
+import os
+import threading
+from typing import TYPE_CHECKING, Dict, Iterable, Optional, Tuple
+
+if TYPE_CHECKING:
+    # PIL は起動時に読み込まず、タイルを初めて使う時点で読み込む
+    from PIL import Image
+
+
+class SpriteAtlasParams:
+    # tools/build_sprite_atlas.py の出力先 (atlas.json が無ければアトラスは使いません)
+    ATLAS_DIR = os.environ.get("SPRITE_ATLAS_DIR", os.path.join(".cache", "atlas"))
+    # 正規化後のサイズ (メインはアスペクト比を保って中央に配置します)
+    MAIN_SIZE = int(os.environ.get("SPRITE_ATLAS_MAIN_SIZE", 128))
+    GEAR_SIZE = int(os.environ.get("SPRITE_ATLAS_GEAR_SIZE", 64))
+    SCHEMA = 1
+
+
+INDEX_FILE = 'atlas.json'
+DATA_FILE = 'atlas.rgba'
+
+
+def normalize(data: bytes, size: Tuple[int, int]) -> "Image.Image":
+    """画像をデコードし、指定サイズの透明なキャンバスの中央に収まるよう縮小したRGBA画像を返します"""
+    from PIL import Image
+    with Image.open(io.BytesIO(data)) as img:
+        img = img.convert('RGBA')
+    img.thumbnail(size, Image.LANCZOS)
+    if img.size == size:
+        return img
+    canvas = Image.new('RGBA', size, (0, 0, 0, 0))
+    canvas.paste(img, ((size[0] - img.width) // 2, (size[1] - img.height) // 2))
+    return canvas
+
+
+def build_atlas(directory: str, tiles: Iterable[Tuple[str, str, "Image.Image"]]) -> int:
+    """(種類, key, 画像) のタイルを1つの生RGBAファイルと索引に書き出し、タイル数を返します
+
+    各タイルは連続した領域に並べるため、読み込み側はコピーせずに切り出せます。
+    """
+    os.makedirs(directory, exist_ok=True)
+    data_path = os.path.join(directory, DATA_FILE)
+    index_path = os.path.join(directory, INDEX_FILE)
+    entries: Dict[str, Dict[str, list]] = {}
+    offset = 0
+    with open(f"{data_path}.tmp", 'wb') as f:
+        for kind, key, img in tiles:
+            if img.mode != 'RGBA':
+                img = img.convert('RGBA')
+            raw = img.tobytes()
+            f.write(raw)
+            entries.setdefault(kind, {})[key] = [offset, img.width, img.height]
+            offset += len(raw)
+    index = {'schema': SpriteAtlasParams.SCHEMA, 'size': offset, 'tiles': entries}
+    with open(f"{index_path}.tmp", 'w', encoding='utf-8') as f:
+        json.dump(index, f)
+    # 索引が新しいデータを指すよう、データ → 索引の順に置き換える
+    os.replace(f"{data_path}.tmp", data_path)
+    os.replace(f"{index_path}.tmp", index_path)
+    return sum(len(v) for v in entries.values())
+
+
+class SpriteAtlas:
+    """ビルド済みのスプライトアトラスを mmap し、タイルをデコードなしで切り出します"""
+
+    def __init__(self, directory: str):
+        with open(os.path.join(directory, INDEX_FILE), 'r', encoding='utf-8') as f:
+            index = json.load(f)
+        if index.get('schema') != SpriteAtlasParams.SCHEMA:
+            raise ValueError(f"unsupported atlas schema: {index.get('schema')}")
+        with open(os.path.join(directory, DATA_FILE), 'rb') as f:
+            self._map = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        if len(self._map) != index['size']:
+            raise ValueError("atlas data does not match its index")
+        self._tiles: Dict[str, Dict[str, list]] = index['tiles']
+
+    def has(self, kind: str, key: Optional[str]) -> bool:
+        return key in self._tiles.get(kind, {})
+
+    def get(self, kind: str, key: Optional[str]) -> Optional["Image.Image"]:
+        """タイルを mmap 上の領域を参照する画像として返します (無ければ None)"""
+        from PIL import Image
+        entry = self._tiles.get(kind, {}).get(key)
+        if entry is None:
+            return None
+        offset, width, height = entry
+        buffer = memoryview(self._map)[offset:offset + width * height * 4]
+        return Image.frombuffer('RGBA', (width, height), buffer, 'raw', 'RGBA', 0, 1)
+
+    def __len__(self) -> int:
+        return sum(len(v) for v in self._tiles.values())
+
+
+_atlas: Optional[SpriteAtlas] = None
+_atlas_loaded = False
+_atlas_lock = threading.Lock()
+
+
+def get_atlas() -> Optional[SpriteAtlas]:
+    """このプロセスで共有するアトラスを返します (ビルドされていない場合は None)"""
+    global _atlas, _atlas_loaded
+    if not _atlas_loaded:
+        # レンダリングのスレッドから同時に呼ばれても読み込みは1回だけ行う
+        with _atlas_lock:
+            if not _atlas_loaded:
+                directory = SpriteAtlasParams.ATLAS_DIR
+                if directory and os.path.exists(os.path.join(directory, INDEX_FILE)):
+                    try:
+                        _atlas = SpriteAtlas(directory)
+                        print(f"Loaded sprite atlas with {len(_atlas)} tiles from {directory}")
+                    except (OSError, ValueError) as e:
+                        print(f"Failed to load sprite atlas: {e}")
+                _atlas_loaded = True
+    return _atlas
@@ -0,0 +1,61 @@
+import os
+import threading
+from collections import OrderedDict
+from typing import Hashable, Optional
+
+from PIL import Image
+
+
+class TileCacheParams:
+    # デコード済みタイル・合成済みセルそれぞれのメモリ上限 (バイト)
+    TILE_MEMORY_LIMIT = int(os.environ.get("TILE_CACHE_MEMORY_LIMIT", 48 * 1024 * 1024))
+    CELL_MEMORY_LIMIT = int(os.environ.get("CELL_CACHE_MEMORY_LIMIT", 32 * 1024 * 1024))
+
+
+class TileCache:
+    """貼り付け可能な RGBA 画像をメモリ上限付きの LRU で保持するキャッシュ
+
+    キーは (種類, key, サイズ) などのタプルを想定しています。
+    画像は共有されるため、取り出した画像を書き換えないでください。
+    """
+
+    def __init__(self, memory_limit: int):
+        self.memory_limit = memory_limit
+        self._items: "OrderedDict[Hashable, Image.Image]" = OrderedDict()
+        self._size = 0
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def _cost(img: Image.Image) -> int:
+        return img.width * img.height * 4
+
+    def get(self, key: Hashable) -> Optional[Image.Image]:
+        with self._lock:
+            img = self._items.get(key)
+            if img is None:
+                self.misses += 1
+                return None
+            self._items.move_to_end(key)
+            self.hits += 1
+            return img
+
+    def put(self, key: Hashable, img: Image.Image) -> None:
+        cost = self._cost(img)
+        if cost > self.memory_limit:
+            return
+        with self._lock:
+            old = self._items.pop(key, None)
+            if old is not None:
+                self._size -= self._cost(old)
+            self._items[key] = img
+            self._size += cost
+            while self._size > self.memory_limit and self._items:
+                _, evicted = self._items.popitem(last=False)
+                self._size -= self._cost(evicted)
+
+    def clear(self) -> None:
+        with self._lock:
+            self._items.clear()
+            self._size = 0
@@ -0,0 +1,238 @@
+import asyncio
+import json
+import os
+import random
+import time
+import urllib.parse
+from typing import Callable, Dict, Optional, Tuple
+
+import aiohttp
+
+from data.metrics import UPSTREAM_EVENTS
+from data.single_flight import FetchFailed
+
+
+class UpstreamParams:
+    # リダイレクト (Special:Redirect/file/...) の解決先を保存するファイル
+    REDIRECT_CACHE_PATH = os.environ.get("REDIRECT_CACHE_PATH", os.path.join(".cache", "redirects.json"))
+    # 1回の試行のタイムアウトと、再試行を含めた全体の期限 (秒)
+    ATTEMPT_TIMEOUT = float(os.environ.get("IMAGE_ATTEMPT_TIMEOUT", 4.0))
+    DEADLINE = float(os.environ.get("IMAGE_FETCH_DEADLINE", 6.0))
+    # 失敗時の再試行回数と待ち時間の基準 (秒, 試行ごとに倍 + ゆらぎ)
+    RETRIES = int(os.environ.get("IMAGE_RETRIES", 2))
+    RETRY_BACKOFF = float(os.environ.get("IMAGE_RETRY_BACKOFF", 0.2))
+    # この秒数以内に応答が無ければ同じリクエストをもう1つ送り、先に返った方を使う (0 で無効)
+    HEDGE_DELAY = float(os.environ.get("IMAGE_HEDGE_DELAY", 1.0))
+    # ホストごとに連続でこの回数失敗したら、COOLDOWN 秒の間リクエストを送らない
+    BREAKER_THRESHOLD = int(os.environ.get("UPSTREAM_BREAKER_THRESHOLD", 5))
+    BREAKER_COOLDOWN = float(os.environ.get("UPSTREAM_BREAKER_COOLDOWN", 30.0))
+    # リダイレクトキャッシュをディスクに書き出す最短間隔 (秒)
+    SAVE_INTERVAL = 5.0
+
+
+class CircuitOpen(FetchFailed):
+    """ホストのサーキットブレーカーが開いている間に送出されます"""
+
+
+class _Retryable(FetchFailed):
+    """再試行すれば成功する可能性がある失敗 (タイムアウト・接続エラー・5xx・429)"""
+
+
+def _host(url: str) -> str:
+    return urllib.parse.urlsplit(url).hostname or 'unknown'
+
+
+class RedirectCache:
+    """リダイレクト元のURL -> 最終的なURL の対応をJSONファイルに保存します"""
+
+    def __init__(self, path: Optional[str] = UpstreamParams.REDIRECT_CACHE_PATH):
+        self.path = path
+        self._entries: Dict[str, str] = {}
+        self._dirty = False
+        self._saved_at = 0.0
+        self._load()
+
+    def _load(self) -> None:
+        if not self.path:
+            return
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                raw = json.load(f)
+        except FileNotFoundError:
+            return
+        except (OSError, ValueError) as e:
+            print(f"Failed to load redirect cache: {e}")
+            return
+        if isinstance(raw, dict):
+            self._entries = {k: v for k, v in raw.items() if isinstance(k, str) and isinstance(v, str)}
+
+    def get(self, url: str) -> Optional[str]:
+        return self._entries.get(url)
+
+    def put(self, url: str, final_url: str) -> None:
+        if self._entries.get(url) == final_url:
+            return
+        self._entries[url] = final_url
+        self._dirty = True
+        if time.monotonic() - self._saved_at >= UpstreamParams.SAVE_INTERVAL:
+            self.flush()
+
+    def discard(self, url: str) -> None:
+        if self._entries.pop(url, None) is not None:
+            self._dirty = True
+
+    def flush(self) -> None:
+        """変更があればファイルにアトミックに書き出します"""
+        if not self.path or not self._dirty:
+            return
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(self.path) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self._entries, f, ensure_ascii=False)
+            os.replace(tmp_path, self.path)
+        except OSError as e:
+            print(f"Failed to save redirect cache: {e}")
+            return
+        self._dirty = False
+        self._saved_at = time.monotonic()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+
+class CircuitBreaker:
+    """ホストごとの連続失敗を数え、閾値を超えたら一定時間そのホストへのリクエストを止めます
+
+    停止時間が過ぎると1件だけ試行を通し、成功すれば元に戻ります (失敗すれば再び停止します)。
+    """
+
+    def __init__(self, threshold: int = UpstreamParams.BREAKER_THRESHOLD,
+                 cooldown: float = UpstreamParams.BREAKER_COOLDOWN):
+        self.threshold = max(1, threshold)
+        self.cooldown = cooldown
+        # host -> (連続失敗回数, 停止した時刻)
+        self._hosts: Dict[str, Tuple[int, float]] = {}
+
+    def allow(self, host: str) -> bool:
+        failures, opened_at = self._hosts.get(host, (0, 0.0))
+        if failures < self.threshold:
+            return True
+        now = time.monotonic()
+        if now - opened_at >= self.cooldown:
+            # 試行を1件だけ通し、結果が出るまでは再び停止扱いにする
+            self._hosts[host] = (failures, now)
+            return True
+        return False
+
+    def success(self, host: str) -> None:
+        self._hosts.pop(host, None)
+
+    def failure(self, host: str) -> None:
+        failures, _ = self._hosts.get(host, (0, 0.0))
+        failures += 1
+        self._hosts[host] = (failures, time.monotonic())
+        if failures == self.threshold:
+            print(f"Circuit opened for {host} after {failures} consecutive failures")
+
+
+class ImageFetcher:
+    """splatoonwiki の画像を取得するクライアント
+
+    - 解決済みのリダイレクト先を保存し、次回からは直接取得します
+    - 一定時間応答が無いリクエストにはもう1つ同じリクエストを送ります (ヘッジ)
+    - タイムアウト・5xx などはゆらぎ付きの待ち時間を置いて再試行します
+    - 失敗が続くホストにはサーキットブレーカーでしばらくリクエストを送りません
+    全体の期限 (DEADLINE) を過ぎた場合は FetchFailed を送出します。
+    """
+
+    def __init__(self, session: Callable[[], aiohttp.ClientSession],
+                 record: Callable[[str, object, float], None],
+                 redirects: Optional[RedirectCache] = None,
+                 breaker: Optional[CircuitBreaker] = None):
+        self._session = session
+        self._record = record
+        self.redirects = redirects if redirects is not None else RedirectCache()
+        self.breaker = breaker if breaker is not None else CircuitBreaker()
+
+    async def fetch(self, url: str) -> bytes:
+        """画像を取得してバイト列を返します (失敗時は FetchFailed)"""
+        try:
+            return await asyncio.wait_for(self._fetch(url), UpstreamParams.DEADLINE)
+        except asyncio.TimeoutError:
+            raise FetchFailed(f"deadline of {UpstreamParams.DEADLINE}s exceeded") from None
+
+    async def _fetch(self, url: str) -> bytes:
+        target = self.redirects.get(url) or url
+        if target != url:
+            UPSTREAM_EVENTS.inc(event='redirect_cache_hit')
+        attempt = 0
+        while True:
+            host = _host(target)
+            if not self.breaker.allow(host):
+                UPSTREAM_EVENTS.inc(event='circuit_open')
+                raise CircuitOpen(f"circuit open for {host}")
+            try:
+                data, final_url = await self._hedged(target)
+            except _Retryable:
+                self.breaker.failure(host)
+                if attempt >= UpstreamParams.RETRIES:
+                    raise
+                attempt += 1
+                UPSTREAM_EVENTS.inc(event='retry')
+                delay = UpstreamParams.RETRY_BACKOFF * (2 ** (attempt - 1))
+                await asyncio.sleep(random.uniform(0, delay))
+                continue
+            except FetchFailed:
+                # ホストは応答しているのでブレーカーの失敗には数えない
+                self.breaker.success(host)
+                if target != url:
+                    # 保存済みのリダイレクト先が無くなった場合は元のURLから解決し直す
+                    self.redirects.discard(url)
+                    target = url
+                    continue
+                raise
+            self.breaker.success(host)
+            if final_url != url:
+                self.redirects.put(url, final_url)
+            return data
+
+    async def _hedged(self, url: str) -> Tuple[bytes, str]:
+        first = asyncio.ensure_future(self._attempt(url))
+        tasks = {first}
+        try:
+            if UpstreamParams.HEDGE_DELAY > 0:
+                done, _ = await asyncio.wait(tasks, timeout=UpstreamParams.HEDGE_DELAY)
+                if not done:
+                    UPSTREAM_EVENTS.inc(event='hedge')
+                    tasks.add(asyncio.ensure_future(self._attempt(url)))
+            error: Optional[BaseException] = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        return task.result()
+                    error = task.exception()
+            raise error
+        finally:
+            for task in tasks:
+                task.cancel()
+
+    async def _attempt(self, url: str) -> Tuple[bytes, str]:
+        """1回分のリクエストを行い、(データ, 最終的なURL) を返します"""
+        started = time.perf_counter()
+        timeout = aiohttp.ClientTimeout(total=UpstreamParams.ATTEMPT_TIMEOUT)
+        try:
+            async with self._session().get(url, timeout=timeout) as response:
+                self._record(url, response.status, started)
+                if response.status == 200:
+                    return await response.read(), str(response.url)
+                message = f"HTTP {response.status} - {url} (Final: {response.url})"
+                if response.status == 429 or response.status >= 500:
+                    raise _Retryable(message)
+                raise FetchFailed(message)
+        except FetchFailed:
+            raise
+        except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+            self._record(url, 'error', started)
+            raise _Retryable(f"{type(e).__name__}: {e} - {url}") from e
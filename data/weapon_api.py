@@ -1,103 +1,373 @@
 import aiohttp
+import asyncio
+import itertools
+import os
 import random
+import time
 import urllib.parse
-from typing import List, Dict, Optional
+from typing import List, Dict, Optional, Tuple
+from data.image_cache import ImageCache
+from data.catalog_store import CatalogSnapshot, CatalogStore
+from data.catalog import CatalogItem, Weapon, build_weapons, collect_search_names
+from data.metrics import UPSTREAM_REQUESTS, UPSTREAM_SECONDS, register_cache
+from data.autocomplete_index import AutocompleteIndex, EMPTY_INDEX, build_index
+from data.single_flight import FetchFailed, SingleFlight
+from data.upstream import ImageFetcher
 
 class WeaponDataParams:
-    API_URL = "https://stat.ink/api/v3/weapon"
+    # 接続先 (ベンチマークなどでローカルの代替サーバーに向けられるよう環境変数で変更可能)
+    STATINK_BASE_URL = os.environ.get("STATINK_BASE_URL", "https://stat.ink").rstrip('/')
+    IMAGE_BASE_URL = os.environ.get("IMAGE_BASE_URL", "https://splatoonwiki.org/wiki/Special:Redirect/file/")
+    API_URL = f"{STATINK_BASE_URL}/api/v3/weapon"
+    ABILITY_API_URL = f"{STATINK_BASE_URL}/api/v3/ability"
     USER_AGENT = "Mozilla/5.0 (Windows NT 10.0; Win64; x64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/91.0.4472.124 Safari/537.36"
+    # 共有HTTPセッションの設定
+    TIMEOUT = 10
+    CONNECTION_LIMIT = 64
+    CONNECTION_LIMIT_PER_HOST = 16
+    DNS_CACHE_TTL = 300
+    KEEPALIVE_TIMEOUT = 60
+    # 起動時の画像プリフェッチ
+    WARMUP_ENABLED = os.environ.get("ASSET_WARMUP", "1") != "0"
+    WARMUP_CONCURRENCY = int(os.environ.get("ASSET_WARMUP_CONCURRENCY", 8))
+    # カタログをバックグラウンドで再取得する間隔 (秒)
+    CATALOG_REFRESH_INTERVAL = int(os.environ.get("CATALOG_REFRESH_INTERVAL", 6 * 60 * 60))
+    # 再取得を担当しないプロセスが共有スナップショットの更新を確認する間隔 (秒)
+    CATALOG_FOLLOW_INTERVAL = int(os.environ.get("CATALOG_FOLLOW_INTERVAL", 30))
+    # 再取得を担当しないプロセスが起動時に共有スナップショットを待つ上限 (秒)。超えた場合は自分で取得します
+    CATALOG_WAIT_TIMEOUT = float(os.environ.get("CATALOG_WAIT_TIMEOUT", 120))
 
 class WeaponDataManager:
     def __init__(self):
-        self._cache: List[Dict] = []
+        self._cache: List[Weapon] = []
+        # (type, sub, special) -> 候補ブキのリスト (None は条件なし)
+        self._index: Dict[Tuple[Optional[str], Optional[str], Optional[str]], List[Weapon]] = {}
+        # field ('type'/'sub'/'special') -> ユニークなアイテムリスト / オートコンプリート索引
+        self._unique_items: Dict[str, List[CatalogItem]] = {}
+        self._autocomplete: Dict[str, AutocompleteIndex] = {}
+        # stat.ink のギアパワー一覧
+        self._abilities: List[Dict] = []
+        # name ('weapon'/'ability') -> 現在使用中のスナップショット
+        self._snapshots: Dict[str, CatalogSnapshot] = {}
+        self._snapshot_mtimes: Dict[str, float] = {}
+        self.catalog_store = CatalogStore()
+        self.image_cache = ImageCache()
+        register_cache('image', self.image_cache)
+        self._session: Optional[aiohttp.ClientSession] = None
+        # 同じカタログ・画像への同時の取得を1回にまとめる (失敗時はバックオフ)
+        self._flights = SingleFlight()
+        # 画像の取得 (リダイレクト先のキャッシュ・再試行・ヘッジ・サーキットブレーカー)
+        self.image_fetcher = ImageFetcher(lambda: self.session, self._record_upstream)
+
+    @staticmethod
+    def _create_session() -> aiohttp.ClientSession:
+        """keep-alive・ホスト毎の接続数制限・DNSキャッシュ付きのセッションを作成します"""
+        connector = aiohttp.TCPConnector(
+            limit=WeaponDataParams.CONNECTION_LIMIT,
+            limit_per_host=WeaponDataParams.CONNECTION_LIMIT_PER_HOST,
+            ttl_dns_cache=WeaponDataParams.DNS_CACHE_TTL,
+            keepalive_timeout=WeaponDataParams.KEEPALIVE_TIMEOUT,
+        )
+        return aiohttp.ClientSession(
+            connector=connector,
+            headers={"User-Agent": WeaponDataParams.USER_AGENT},
+            timeout=aiohttp.ClientTimeout(total=WeaponDataParams.TIMEOUT),
+        )
+
+    @property
+    def session(self) -> aiohttp.ClientSession:
+        """全リクエストで共有するHTTPセッション (未作成の場合はその場で作成します)"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+        return self._session
+
+    async def open(self) -> None:
+        """共有HTTPセッションを作成します"""
+        if self._session is None or self._session.closed:
+            self._session = self._create_session()
+
+    async def close(self) -> None:
+        """共有HTTPセッションを閉じます"""
+        self.image_fetcher.redirects.flush()
+        if self._session is not None:
+            await self._session.close()
+            self._session = None
+
+    @staticmethod
+    def _record_upstream(url: str, status, started: float) -> None:
+        """上流へのリクエスト数・ステータス・所要時間を記録します"""
+        host = urllib.parse.urlsplit(url).hostname or 'unknown'
+        UPSTREAM_REQUESTS.inc(host=host, status=status)
+        UPSTREAM_SECONDS.observe(time.perf_counter() - started, host=host)
+
+    def load_snapshots(self) -> bool:
+        """ディスク上のスナップショットからカタログを読み込みます。ブキデータを読み込めた場合 True を返します"""
+        self.reload_snapshots()
+        return bool(self._cache)
+
+    def reload_snapshots(self) -> List[str]:
+        """ディスク上のスナップショットが (他のプロセスによって) 更新されていれば読み込み直します
+
+        読み込み直したカタログ名のリストを返します。
+        """
+        changed = []
+        for name in ('weapon', 'ability'):
+            mtime = self.catalog_store.mtime(name)
+            if mtime is None or mtime == self._snapshot_mtimes.get(name):
+                continue
+            self._snapshot_mtimes[name] = mtime
+            snapshot = self.catalog_store.load(name)
+            if snapshot is None:
+                continue
+            current = self._snapshots.get(name)
+            if current is not None and current.digest == snapshot.digest:
+                continue
+            count = len(snapshot.data)
+            self._apply_snapshot(snapshot)
+            print(f"Loaded {name} catalog snapshot v{snapshot.version} ({count} items)")
+            changed.append(name)
+        return changed
+
+    def _apply_snapshot(self, snapshot: CatalogSnapshot) -> None:
+        self._snapshots[snapshot.name] = snapshot
+        if snapshot.name == 'weapon':
+            self._set_catalog(snapshot.data)
+            # 変換後は生のJSONを保持しない (バージョン情報のみ残す)
+            snapshot.data = []
+        else:
+            self._abilities = snapshot.data
+
+    async def refresh_catalog(self, name: str) -> bool:
+        """stat.ink にカタログの更新を問い合わせます (ETag / If-Modified-Since 付き)
+
+        内容が更新された場合のみ True を返します。取得に失敗した場合は最後に取得できた内容を使い続けます。
+        同時に呼ばれた場合は1回の問い合わせの結果を共有し、失敗後はバックオフの間問い合わせません。
+        """
+        try:
+            return await self._flights.do(('catalog', name), lambda: self._refresh_catalog(name))
+        except FetchFailed:
+            return False
+
+    async def _refresh_catalog(self, name: str) -> bool:
+        url = WeaponDataParams.API_URL if name == 'weapon' else WeaponDataParams.ABILITY_API_URL
+        current = self._snapshots.get(name)
+        headers = {}
+        if current is not None:
+            if current.etag:
+                headers['If-None-Match'] = current.etag
+            if current.last_modified:
+                headers['If-Modified-Since'] = current.last_modified
+
+        started = time.perf_counter()
+        try:
+            async with self.session.get(url, headers=headers) as response:
+                self._record_upstream(url, response.status, started)
+                if response.status == 304 and current is not None:
+                    current.fetched_at = time.time()
+                    return False
+                if response.status != 200:
+                    print(f"Error fetching {name} data: {response.status}")
+                    raise FetchFailed(f"{name}: HTTP {response.status}")
+                data = await response.json()
+                etag = response.headers.get('ETag')
+                last_modified = response.headers.get('Last-Modified')
+        except FetchFailed:
+            raise
+        except Exception as e:
+            self._record_upstream(url, 'error', started)
+            print(f"Exception during {name} fetch: {e}")
+            raise FetchFailed(f"{name}: {e}") from e
+
+        if not isinstance(data, list) or not data:
+            print(f"Ignoring empty {name} data")
+            raise FetchFailed(f"{name}: empty data")
+
+        digest = CatalogSnapshot.compute_digest(data)
+        if current is not None and current.digest == digest:
+            current.fetched_at = time.time()
+            current.etag = etag
+            current.last_modified = last_modified
+            self.catalog_store.save(CatalogSnapshot(
+                name, data, version=current.version, fetched_at=current.fetched_at,
+                etag=etag, last_modified=last_modified, digest=digest,
+            ))
+            return False
+
+        snapshot = CatalogSnapshot(
+            name, data,
+            version=(current.version + 1) if current is not None else 1,
+            etag=etag, last_modified=last_modified, digest=digest,
+        )
+        self.catalog_store.save(snapshot)
+        self._apply_snapshot(snapshot)
+        return True
+
+    async def refresh_catalogs(self) -> List[str]:
+        """全カタログの更新を並行して問い合わせ、更新されたカタログ名のリストを返します"""
+        names = ('weapon', 'ability')
+        results = await asyncio.gather(*(self.refresh_catalog(name) for name in names))
+        return [name for name, changed in zip(names, results) if changed]
 
     async def fetch_weapons(self) -> None:
         """APIからブキデータを取得してキャッシュします"""
         if self._cache:
             return
+        await self.refresh_catalog('weapon')
+
+    async def fetch_abilities(self) -> List[Dict]:
+        """APIからギアパワーデータを取得してキャッシュし、そのリストを返します"""
+        if not self._abilities:
+            await self.refresh_catalog('ability')
+        return self._abilities
 
-        headers = {"User-Agent": WeaponDataParams.USER_AGENT}
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
-            try:
-                async with session.get(WeaponDataParams.API_URL) as response:
-                    if response.status == 200:
-                        self._cache = await response.json()
-                    else:
-                        print(f"Error fetching data: {response.status}")
-                        self._cache = []
-            except Exception as e:
-                print(f"Exception during fetch: {e}")
-                self._cache = []
+    def _set_catalog(self, raw_weapons: List[Dict]) -> None:
+        """ブキデータを型付きのレコードに変換して保存し、種類・サブ・スペシャルとその組み合わせで索引を作ります
+
+        索引をすべて作り終えてから差し替えるため、読み込み中も古いカタログで応答できます。
+        """
+        weapons = build_weapons(raw_weapons)
+        index: Dict[Tuple[Optional[str], Optional[str], Optional[str]], List[Weapon]] = {}
+        for w in weapons:
+            keys = tuple(item.key if item else None for item in (w.type, w.sub, w.special))
+            # 各条件を「指定あり/なし」にした全8通りの組み合わせに登録する
+            for mask in itertools.product((False, True), repeat=3):
+                index_key = tuple(k if use else None for k, use in zip(keys, mask))
+                index.setdefault(index_key, []).append(w)
+        unique_items = {field: self._get_unique_items(weapons, field) for field in ('type', 'sub', 'special')}
+        # 検索には保持していない言語の名前も含める (元のJSONはこの後破棄される)
+        autocomplete = {field: build_index(items, search_names=collect_search_names(raw_weapons, field))
+                        for field, items in unique_items.items()}
+
+        self._cache = weapons
+        self._index = index
+        self._unique_items = unique_items
+        self._autocomplete = autocomplete
 
     async def fetch_image_data(self, url: str) -> Optional[bytes]:
-        """URLから画像データを取得します"""
+        """URLから画像データを取得します (キャッシュがあればそれを返します)"""
         if not url:
             return None
 
-        headers = {"User-Agent": WeaponDataParams.USER_AGENT}
-        timeout = aiohttp.ClientTimeout(total=10)
-        async with aiohttp.ClientSession(headers=headers, timeout=timeout) as session:
-            try:
-                async with session.get(url) as response:
-                    if response.status == 200:
-                        return await response.read()
-                    else:
-                        print(f"Failed to fetch image: {response.status} - {url} (Final: {response.url})")
-            except Exception as e:
-                print(f"Error fetching image: {e}")
-        return None
-
-    def get_random_weapon(self, weapon_type: Optional[str] = None, sub: Optional[str] = None, special: Optional[str] = None) -> Optional[Dict]:
-        """キャッシュからランダムに1つのブキ情報を返します"""
-        if not self._cache:
+        cached = self.image_cache.get(url)
+        if cached is not None:
+            data, fresh = cached
+            if fresh:
+                return data
+
+        try:
+            # 同じ画像を同時に必要とする呼び出しは1回のダウンロードを共有する
+            return await self._flights.do(('image', url), lambda: self._download_image(url))
+        except FetchFailed:
+            # 再検証に失敗した場合は期限切れのデータを返す
+            if cached is not None:
+                return cached[0]
             return None
-        
-        candidates = self._cache
-        if weapon_type:
-            candidates = [w for w in candidates if w.get('type', {}).get('key') == weapon_type]
-        if sub:
-            candidates = [w for w in candidates if w.get('sub', {}).get('key') == sub]
-        if special:
-            candidates = [w for w in candidates if w.get('special', {}).get('key') == special]
-            
+
+    async def _download_image(self, url: str) -> bytes:
+        """画像をダウンロードしてキャッシュに保存します (失敗時は FetchFailed)"""
+        try:
+            data = await self.image_fetcher.fetch(url)
+        except FetchFailed as e:
+            print(f"Failed to fetch image: {e}")
+            raise
+        self.image_cache.put(url, data)
+        return data
+
+    async def prefetch_images(self, urls: List[str], concurrency: int = WeaponDataParams.WARMUP_CONCURRENCY) -> List[str]:
+        """画像を同時実行数を制限しながら並行して取得し、キャッシュに載せます
+
+        取得に失敗したURLのリストを返します。
+        """
+        urls = list(dict.fromkeys(u for u in urls if u))
+        total = len(urls)
+        semaphore = asyncio.Semaphore(max(1, concurrency))
+        failed: List[str] = []
+        done = 0
+
+        async def _prefetch(url: str) -> None:
+            nonlocal done
+            async with semaphore:
+                data = await self.fetch_image_data(url)
+            if data is None:
+                failed.append(url)
+            done += 1
+            if done % 20 == 0 or done == total:
+                print(f"Prefetching images: {done}/{total} ({len(failed)} failed)")
+
+        await asyncio.gather(*(_prefetch(url) for url in urls))
+        return failed
+
+    def _candidates(self, weapon_type: Optional[str] = None, sub: Optional[str] = None, special: Optional[str] = None) -> List[Weapon]:
+        """条件に一致するブキのリストを索引から返します"""
+        return self._index.get((weapon_type or None, sub or None, special or None), [])
+
+    def get_random_weapon(self, weapon_type: Optional[str] = None, sub: Optional[str] = None, special: Optional[str] = None) -> Optional[Weapon]:
+        """キャッシュからランダムに1つのブキ情報を返します"""
+        candidates = self._candidates(weapon_type, sub, special)
         if not candidates:
             return None
         return random.choice(candidates)
 
-    def _get_unique_items(self, field: str) -> List[Dict]:
+    def sample_weapons(self, n: int, weapon_type: Optional[str] = None, sub: Optional[str] = None, special: Optional[str] = None) -> List[Weapon]:
+        """条件に一致するブキを重複なしでn個(候補が足りない場合は候補数分)返します"""
+        candidates = self._candidates(weapon_type, sub, special)
+        return random.sample(candidates, min(n, len(candidates)))
+
+    def sample_weapon_batches(self, batches: int, size: int, weapon_type: Optional[str] = None,
+                              sub: Optional[str] = None, special: Optional[str] = None) -> List[List[Weapon]]:
+        """sample_weapons を batches 回まとめて行います (各バッチ内は重複なし、候補の検索は1回のみ)"""
+        candidates = self._candidates(weapon_type, sub, special)
+        if not candidates:
+            return []
+        k = min(size, len(candidates))
+        return [random.sample(candidates, k) for _ in range(batches)]
+
+    @staticmethod
+    def _get_unique_items(weapons: List[Weapon], field: str) -> List[CatalogItem]:
         """指定されたフィールドのユニークなアイテムリストを返します"""
         items = {}
-        for w in self._cache:
-            item = w.get(field)
-            if item and 'key' in item:
-                items[item['key']] = item
+        for w in weapons:
+            item = getattr(w, field)
+            if item is not None:
+                items[item.key] = item
         return list(items.values())
 
-    def get_weapon_types(self) -> List[Dict]:
+    def get_all_weapons(self) -> List[Weapon]:
+        """読み込み済みの全ブキのリストを返します"""
+        return self._cache
+
+    def get_abilities(self) -> List[Dict]:
+        """読み込み済みのギアパワーのリストを返します"""
+        return self._abilities
+
+    def get_weapon_types(self) -> List[CatalogItem]:
         """利用可能なブキの種類リストを返します"""
-        return self._get_unique_items('type')
+        return self._unique_items.get('type', [])
 
-    def get_sub_weapons(self) -> List[Dict]:
+    def get_sub_weapons(self) -> List[CatalogItem]:
         """利用可能なサブウェポンのリストを返します"""
-        return self._get_unique_items('sub')
+        return self._unique_items.get('sub', [])
 
-    def get_special_weapons(self) -> List[Dict]:
+    def get_special_weapons(self) -> List[CatalogItem]:
         """利用可能なスペシャルウェポンのリストを返します"""
-        return self._get_unique_items('special')
+        return self._unique_items.get('special', [])
+
+    def search_items(self, field: str, current: str) -> List[Tuple[str, str]]:
+        """オートコンプリート用に (日本語名, key) のリストを返します (通信は行いません)"""
+        return self._autocomplete.get(field, EMPTY_INDEX).search(current)
 
     @staticmethod
-    def get_localized_name(data: Dict, key: str = 'name', lang: str = 'ja_JP') -> str:
-        """多言語対応フィールドから指定言語の文字列を取り出します"""
-        if not data:
+    def get_localized_name(item: Optional[CatalogItem], lang: str = 'ja_JP') -> str:
+        """ブキ・サブ・スペシャルなどから指定言語の名前を取り出します"""
+        if item is None:
             return "Unknown"
-        return data.get(key, {}).get(lang, "Unknown")
+        return item.name(lang) or "Unknown"
 
     @staticmethod
-    def get_image_url(weapon: Dict, type_hint: str = "Main") -> str:
+    def get_image_url(weapon: CatalogItem, type_hint: str = "Main") -> str:
         """Inkipediaの画像URLを生成します"""
         # 英語名を取得し、ファイル名用に整形（空白とスラッシュをアンダースコアに置換）
-        name = weapon.get('name', {}).get('en_US', 'Unknown')
+        name = weapon.name('en_US') or 'Unknown'
         filename = name.replace(' ', '_').replace('/', '_')
         
         # type_hintに基づいてプレフィックスを決定
@@ -109,4 +379,4 @@ class WeaponDataManager:
 
         # URLエンコードしてRedirect URLを生成
         encoded_name = urllib.parse.quote(f"{prefix}_{filename}.png")
-        return f"https://splatoonwiki.org/wiki/Special:Redirect/file/{encoded_name}"
\ No newline at end of file
+        return f"{WeaponDataParams.IMAGE_BASE_URL}{encoded_name}"
\ No newline at end of file
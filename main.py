@@ -1,64 +1,246 @@
 import discord
 import os
 import asyncio
+import aiohttp
+import hashlib
+import json
+import multiprocessing
+from aiohttp import web
+from typing import Dict, List, Optional
 from discord.ext import commands
 from dotenv import load_dotenv
-from flask import Flask
-from threading import Thread
+from data.metrics import REGISTRY, merge_expositions
 
 # .envファイルからトークンを読み込み
 load_dotenv()
 TOKEN = os.getenv('DISCORD_BOT_TOKEN')
 
-# Flaskアプリケーションのセットアップ
-app = Flask(__name__)
+# シャード構成
+# SHARD_PROCESSES が2以上の場合、ランチャーがシャードを分担するワーカープロセスを起動します
+SHARD_PROCESSES = int(os.environ.get("SHARD_PROCESSES", 1))
+# 総シャード数 (未指定の場合、単一プロセスではDiscordの推奨数、複数プロセスではプロセス数)
+SHARD_COUNT = int(os.environ.get("SHARD_COUNT", 0)) or None
+# 各ワーカーのWebサーバーのポート (ワーカー番号を加算)
+WORKER_PORT_BASE = int(os.environ.get("WORKER_PORT_BASE", 5100))
 
-@app.route('/')
-def home():
-    return "Discord bot is alive."
+# スラッシュコマンドの定義のハッシュ値の保存先 (変わった場合のみ同期します)
+COMMAND_HASH_PATH = os.environ.get("COMMAND_HASH_PATH", os.path.join(".cache", "command_tree.sha256"))
+# 1 の場合は定義が変わっていなくても毎回同期する
+FORCE_COMMAND_SYNC = os.environ.get("FORCE_COMMAND_SYNC", "0") == "1"
 
-def run_web_server():
+# Webサーバー (Botと同じイベントループで動作)
+def create_web_app(bot: commands.Bot) -> web.Application:
+    async def home(request):
+        return web.Response(text="Discord bot is alive.")
+
+    async def healthz(request):
+        # プロセスが応答できれば生存とみなす
+        return web.Response(text="ok")
+
+    async def readyz(request):
+        # ブキ・ギアパワー一覧の読み込みが終わるまではトラフィックを受けない
+        cog = bot.get_cog('Spl3Random')
+        if cog is None or not cog.catalogs_loaded:
+            return web.Response(status=503, text="not ready")
+        return web.Response(text="ready")
+
+    async def metrics(request):
+        return web.Response(
+            body=REGISTRY.render().encode('utf-8'),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/readyz', readyz)
+    app.router.add_get('/metrics', metrics)
+    return app
+
+async def start_web_server(app: web.Application, port: Optional[int] = None, host: str = "0.0.0.0") -> web.AppRunner:
     # Renderが指定するポート、またはローカルテスト用に5000番ポートを使用
-    port = int(os.environ.get("PORT", 5000))
-    app.run(host="0.0.0.0", port=port)
+    if port is None:
+        port = int(os.environ.get("PORT", 5000))
+    runner = web.AppRunner(app, access_log=None)
+    await runner.setup()
+    await web.TCPSite(runner, host, port).start()
+    return runner
 
 # Discord Botのセットアップ
-class MyBot(commands.Bot):
-    def __init__(self):
+class MyBot(commands.AutoShardedBot):
+    def __init__(self, shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None, catalog_leader: bool = True):
         intents = discord.Intents.default()
         intents.message_content = True
         super().__init__(
             command_prefix="!",
             intents=intents,
-            help_command=None
+            help_command=None,
+            shard_ids=shard_ids,
+            shard_count=shard_count
         )
+        # カタログの再取得を担当するかどうか (複数プロセス構成では1プロセスのみ)
+        self.catalog_leader = catalog_leader
 
     async def setup_hook(self):
         # Cogsフォルダ内の拡張機能をロード
         await self.load_extension("cogs.spl3_random")
-        # スラッシュコマンドの同期
+        # スラッシュコマンドの同期 (全体の同期はレート制限が厳しいため、定義が変わった場合のみ行う)
+        if self.catalog_leader:
+            await self.sync_commands_if_changed()
+
+    def command_tree_hash(self) -> str:
+        """スラッシュコマンドの定義 (名前・説明・引数など) のハッシュ値を返します"""
+        payload = sorted((cmd.to_dict(self.tree) for cmd in self.tree.get_commands()),
+                         key=lambda c: (c.get('type', 1), c['name']))
+        raw = json.dumps({'application_id': self.application_id, 'commands': payload},
+                         sort_keys=True, ensure_ascii=False).encode('utf-8')
+        return hashlib.sha256(raw).hexdigest()
+
+    async def sync_commands_if_changed(self) -> None:
+        digest = self.command_tree_hash()
+        try:
+            with open(COMMAND_HASH_PATH, 'r', encoding='utf-8') as f:
+                synced = f.read().strip()
+        except OSError:
+            synced = None
+        if synced == digest and not FORCE_COMMAND_SYNC:
+            print("Command tree unchanged, skipping sync.")
+            return
+
         await self.tree.sync()
+        print("Command tree synced.")
+        tmp_path = f"{COMMAND_HASH_PATH}.{os.getpid()}.tmp"
+        try:
+            os.makedirs(os.path.dirname(COMMAND_HASH_PATH) or '.', exist_ok=True)
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                f.write(digest)
+            os.replace(tmp_path, COMMAND_HASH_PATH)
+        except OSError as e:
+            print(f"Failed to save command tree hash: {e}")
 
     async def on_ready(self):
         print(f'Logged in as {self.user} (ID: {self.user.id})')
         print('------')
 
-async def main():
+async def main(shard_ids: Optional[List[int]] = None, shard_count: Optional[int] = None,
+               catalog_leader: bool = True, port: Optional[int] = None, host: str = "0.0.0.0"):
     if not TOKEN:
         print("Error: DISCORD_BOT_TOKEN not found in .env")
         return
 
-    # Webサーバーを別スレッドで起動
-    web_thread = Thread(target=run_web_server)
-    web_thread.daemon = True
-    web_thread.start()
+    bot = MyBot(shard_ids=shard_ids, shard_count=shard_count, catalog_leader=catalog_leader)
+    # WebサーバーをBotと同じイベントループで起動
+    runner = await start_web_server(create_web_app(bot), port, host)
+    try:
+        async with bot:
+            await bot.start(TOKEN)
+    finally:
+        await runner.cleanup()
+
+def run_worker(index: int, shard_ids: List[int], shard_count: int):
+    """ランチャーから起動されるワーカープロセスの入口"""
+    print(f"Worker {index} starting with shards {shard_ids}/{shard_count}")
+    try:
+        asyncio.run(main(shard_ids, shard_count, catalog_leader=(index == 0),
+                         port=WORKER_PORT_BASE + index, host="127.0.0.1"))
+    except KeyboardInterrupt:
+        pass
 
-    bot = MyBot()
-    async with bot:
-        await bot.start(TOKEN)
+def assign_shards(shard_count: int, processes: int) -> List[List[int]]:
+    """シャードを各ワーカープロセスに均等に割り当てます"""
+    return [list(range(shard_count))[i::processes] for i in range(processes)]
+
+async def run_launcher():
+    """複数のワーカープロセスを起動・監視し、全体のヘルスチェックを提供します"""
+    processes = SHARD_PROCESSES
+    shard_count = max(SHARD_COUNT or processes, processes)
+    assignments = assign_shards(shard_count, processes)
+    # カタログ (CATALOG_DIR) と画像キャッシュ (IMAGE_CACHE_DIR) は既定でディスク上で共有される
+    # デコード済みタイルも全ワーカーで共有する
+    os.environ.setdefault("TILE_STORE_DIR", os.path.join(".cache", "tiles"))
+
+    mp = multiprocessing.get_context("spawn")
+    workers: Dict[int, multiprocessing.Process] = {}
+
+    def spawn(index: int):
+        process = mp.Process(target=run_worker, args=(index, assignments[index], shard_count), name=f"shard-worker-{index}")
+        process.start()
+        workers[index] = process
+
+    async def home(request):
+        return web.Response(text="Discord bot is alive.")
+
+    async def healthz(request):
+        dead = [i for i, p in workers.items() if not p.is_alive()]
+        if dead:
+            return web.Response(status=503, text=f"workers down: {dead}")
+        return web.Response(text="ok")
+
+    async def readyz(request):
+        # 全ワーカーの準備が完了している場合のみ ready とする
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=2)) as session:
+            for index in workers:
+                try:
+                    async with session.get(f"http://127.0.0.1:{WORKER_PORT_BASE + index}/readyz") as response:
+                        if response.status != 200:
+                            return web.Response(status=503, text=f"worker {index} not ready")
+                except Exception:
+                    return web.Response(status=503, text=f"worker {index} unreachable")
+        return web.Response(text="ready")
+
+    async def metrics(request):
+        # ワーカーのWebサーバーは 127.0.0.1 のみで待ち受けるため、各ワーカーの出力を集めて worker ラベルを付けて返す
+        async def scrape(session: aiohttp.ClientSession, index: int) -> Optional[str]:
+            try:
+                async with session.get(f"http://127.0.0.1:{WORKER_PORT_BASE + index}/metrics") as response:
+                    if response.status == 200:
+                        return await response.text()
+                    print(f"Worker {index} metrics returned {response.status}")
+            except Exception as e:
+                print(f"Failed to scrape worker {index} metrics: {e}")
+            return None
+
+        indexes = sorted(workers)
+        async with aiohttp.ClientSession(timeout=aiohttp.ClientTimeout(total=5)) as session:
+            results = await asyncio.gather(*(scrape(session, index) for index in indexes))
+        body = merge_expositions({str(i): text for i, text in zip(indexes, results) if text is not None})
+        # 取得できなかったワーカーがあることも分かるようにする
+        body += "# HELP spl3_worker_up Whether the launcher could scrape the worker's metrics.\n"
+        body += "# TYPE spl3_worker_up gauge\n"
+        body += ''.join(f'spl3_worker_up{{worker="{i}"}} {int(text is not None)}\n' for i, text in zip(indexes, results))
+        return web.Response(
+            body=body.encode('utf-8'),
+            headers={"Content-Type": "text/plain; version=0.0.4; charset=utf-8"}
+        )
+
+    app = web.Application()
+    app.router.add_get('/', home)
+    app.router.add_get('/healthz', healthz)
+    app.router.add_get('/readyz', readyz)
+    app.router.add_get('/metrics', metrics)
+
+    for index in range(processes):
+        spawn(index)
+    runner = await start_web_server(app)
+    try:
+        while True:
+            await asyncio.sleep(5)
+            for index, process in list(workers.items()):
+                if not process.is_alive():
+                    print(f"Worker {index} exited with code {process.exitcode}, restarting")
+                    spawn(index)
+    finally:
+        await runner.cleanup()
+        for process in workers.values():
+            process.terminate()
+        for process in workers.values():
+            process.join(timeout=10)
 
 if __name__ == '__main__':
     try:
-        asyncio.run(main())
+        if SHARD_PROCESSES > 1:
+            asyncio.run(run_launcher())
+        else:
+            asyncio.run(main())
     except KeyboardInterrupt:
-        pass
\ No newline at end of file
+        pass
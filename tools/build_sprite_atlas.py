@@ -0,0 +1,71 @@
+"""全ブキ・全ギアパワーの画像からスプライトアトラスを作成します
+
+画像はキャッシュ (IMAGE_CACHE_DIR) にあればそれを読み、無ければダウンロードします。
+サイズを揃えたうえで、生のRGBAデータ (atlas.rgba) と索引 (atlas.json) を書き出します。
+実行時は画像合成がアトラスを mmap してタイルを切り出すため、デコードも通信も行いません。
+
+使い方:
+    python -m tools.build_sprite_atlas                    # SPRITE_ATLAS_DIR (.cache/atlas) に出力
+    python -m tools.build_sprite_atlas --output assets/atlas --main-size 128 --gear-size 64
+"""
+import argparse
+import asyncio
+import time
+from typing import List, Tuple
+
+from PIL import Image
+
+from cogs.spl3_random import Spl3Random
+from data.sprite_atlas import SpriteAtlasParams, build_atlas, normalize
+
+
+async def collect_tiles(main_size: int, gear_size: int) -> Tuple[List[Tuple[str, str, Image.Image]], List[str]]:
+    """(種類, key, 正規化済みの画像) のリストと、取得できなかった画像のリストを返します"""
+    cog = Spl3Random(None)
+    dm = cog.data_manager
+    try:
+        await dm.open()
+        if not dm.load_snapshots():
+            await dm.fetch_weapons()
+        if not dm.get_all_weapons():
+            raise SystemExit("Failed to load the weapon catalog")
+
+        sources = [('main', w.key, dm.get_image_url(w, type_hint="Main"), (main_size, main_size))
+                   for w in dm.get_all_weapons()]
+        sources.extend(('gear', key, url, (gear_size, gear_size)) for key, url in cog.GEAR_IMAGE_URLS.items())
+
+        failed = await dm.prefetch_images([url for _, _, url, _ in sources])
+        tiles, missing = [], []
+        for kind, key, url, size in sources:
+            data = None if url in failed else await dm.fetch_image_data(url)
+            if not data:
+                missing.append(f"{kind}/{key}")
+                continue
+            try:
+                tiles.append((kind, key, normalize(data, size)))
+            except Exception as e:
+                print(f"Error decoding {kind}/{key}: {e}")
+                missing.append(f"{kind}/{key}")
+        return tiles, missing
+    finally:
+        await cog.cog_unload()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="スプライトアトラスを作成します")
+    parser.add_argument('--output', default=SpriteAtlasParams.ATLAS_DIR, help="出力先のディレクトリ")
+    parser.add_argument('--main-size', type=int, default=SpriteAtlasParams.MAIN_SIZE, help="メインウェポン画像の一辺 (px)")
+    parser.add_argument('--gear-size', type=int, default=SpriteAtlasParams.GEAR_SIZE, help="ギアパワー画像の一辺 (px)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    tiles, missing = asyncio.run(collect_tiles(args.main_size, args.gear_size))
+    count = build_atlas(args.output, tiles)
+    print(f"Wrote {count} tiles to {args.output} in {time.perf_counter() - started:.1f}s")
+    if missing:
+        # 欠けている画像は実行時に通常どおり取得されます
+        print(f"Missing {len(missing)} images: {', '.join(missing[:10])}")
+
+
+if __name__ == '__main__':
+    main()